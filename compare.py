@@ -0,0 +1,157 @@
+import argparse
+import json
+import math
+import statistics
+import sys
+
+from resultstore import ResultStore
+from runstats import COUNTERS
+from sweep import parseOptions, parseSeeds, sweep
+
+# Comparison of several configurations (e.g., no grouping, RAW and a grouping
+# given with -G) with common random numbers.
+#
+# All configurations are simulated with the same seeds and with option -crn,
+# so for a given seed they share the positions of the stations and the random
+# streams of each node (packet arrivals, backoff counters and reception
+# draws). The difference between two configurations is then estimated from
+# the per-seed differences (paired), which cancel most of the noise common to
+# both runs, and needs far fewer seeds for the same confidence than comparing
+# the means of independent runs. With antithetic replication, each seed is
+# also simulated with the antithetic streams (-av), and the average of both
+# runs is taken as a single replication.
+
+def tQuantile(p, df):
+
+	# Quantile of Student's t distribution with 'df' degrees of freedom
+	# (exact for 1 and 2, Cornish-Fisher expansion otherwise).
+	if df == 1:
+		return math.tan(math.pi * (p - 0.5))
+	if df == 2:
+		return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+
+	z = statistics.NormalDist().inv_cdf(p)
+	return (z + (z**3 + z) / (4 * df)
+		+ (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+		+ (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+		+ (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * df**4))
+
+def confidenceInterval(values, confidence):
+
+	# Mean and half-width of the confidence interval of the mean.
+	mean = statistics.mean(values)
+	if len(values) < 2:
+		return mean, float('inf')
+
+	return mean, tQuantile(0.5 + confidence / 2, len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values))
+
+def unpairedHalfWidth(a, b, confidence):
+
+	# Half-width of the confidence interval of the difference of the means of
+	# two independent samples (Welch), for reference.
+	if len(a) < 2:
+		return float('inf')
+
+	va = statistics.variance(a) / len(a)
+	vb = statistics.variance(b) / len(b)
+	if va + vb == 0:
+		return 0.0
+	df = (va + vb)**2 / (va**2 / (len(a) - 1) + vb**2 / (len(b) - 1))
+
+	return tQuantile(0.5 + confidence / 2, max(1, int(df))) * math.sqrt(va + vb)
+
+def comparisonPoints(base, configurations, seeds, antithetic):
+
+	# Configurations of all runs, as (configuration, seed, antithetic) keys
+	# mapped to the options of the run.
+	points = {}
+	for c in range(len(configurations)):
+		for seed in seeds:
+			for flipped in ([False, True] if antithetic else [False]):
+				config = dict(base)
+				config.update(configurations[c])
+				config.update({'seed': seed, 'commonRandomNumbers': True, 'antithetic': flipped})
+				points[(c, seed, flipped)] = config
+
+	return points
+
+def replications(store, points, configuration, seeds, antithetic, metric):
+
+	# Value of the metric in each replication of the configuration.
+	values = []
+	for seed in seeds:
+		value = store.get(points[(configuration, seed, False)])['total'][metric]
+		if antithetic:
+			value = (value + store.get(points[(configuration, seed, True)])['total'][metric]) / 2.0
+		values.append(value)
+
+	return values
+
+def compare(store, base, configurations, seeds, metrics, antithetic=False, confidence=0.95, jobs=None):
+
+	points = comparisonPoints(base, configurations, seeds, antithetic)
+	sweep(store, list(points.values()), jobs)
+
+	output = {'seeds': seeds, 'antithetic': antithetic, 'confidence': confidence,
+		'configurations': [], 'differences': []}
+
+	values = []
+	for c in range(len(configurations)):
+		values.append(dict((metric, replications(store, points, c, seeds, antithetic, metric)) for metric in metrics))
+
+		summary = {'options': configurations[c]}
+		for metric in metrics:
+			mean, halfWidth = confidenceInterval(values[c][metric], confidence)
+			summary[metric] = {'mean': mean, 'halfWidth': halfWidth}
+		output['configurations'].append(summary)
+
+	# Differences to the first configuration. The half-width of the interval
+	# that independent runs would give is reported, to show the gain.
+	for c in range(1, len(configurations)):
+		summary = {'options': configurations[c], 'baseline': configurations[0]}
+		for metric in metrics:
+			differences = [x - y for x, y in zip(values[c][metric], values[0][metric])]
+			mean, halfWidth = confidenceInterval(differences, confidence)
+			unpaired = unpairedHalfWidth(values[c][metric], values[0][metric], confidence)
+			summary[metric] = {'mean': mean, 'halfWidth': halfWidth, 'unpairedHalfWidth': unpaired}
+			# Number of times more seeds independent runs would need for an
+			# interval as narrow as the paired one.
+			if halfWidth > 0:
+				summary[metric]['replicationRatio'] = (unpaired / halfWidth)**2
+		output['differences'].append(summary)
+
+	return output
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-C", "--configuration", help="options of a configuration, separated by spaces (e.g., 'numberOfGroups=4 groupsFromFile=groups.txt'); may be repeated, and differences are computed against the first one", type=str, action='append', required=True)
+	parser.add_argument("-o", "--option", help="option with a fixed value for all configurations (e.g., numberOfSTAs=200); may be repeated", type=str, action='append', default=[])
+	parser.add_argument("-s", "--seeds", help="seeds (e.g., 1-10,20)", type=str, default='1-10')
+	parser.add_argument("-m", "--metric", help="counter compared; may be repeated (default: success)", choices=COUNTERS, action='append', default=None)
+	parser.add_argument("-A", "--antithetic", help="also simulate each seed with the antithetic random streams", default=False, action='store_const', const=True)
+	parser.add_argument("-c", "--confidence", help="confidence level of the intervals", type=float, default=0.95)
+	parser.add_argument("-D", "--store", help="result store (SQLite database) where runs are kept, so they are not simulated again (default: kept in memory only)", type=str, default=':memory:')
+	parser.add_argument("-j", "--jobs", help="number of worker processes (default: number of CPUs)", type=int, default=None)
+
+	args = parser.parse_args()
+
+	base = {}
+	for option, values in parseOptions(args.option).items():
+		base[option] = values[0]
+
+	configurations = []
+	for text in args.configuration:
+		configuration = {}
+		for option, values in parseOptions(text.split()).items():
+			configuration[option] = values[0]
+		configurations.append(configuration)
+
+	store = ResultStore(args.store)
+	output = compare(store, base, configurations, parseSeeds(args.seeds), args.metric or ['success'],
+		args.antithetic, args.confidence, args.jobs)
+	store.close()
+
+	json.dump(output, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
@@ -0,0 +1,359 @@
+import argparse
+import os
+import struct
+import sys
+from gzip import GzipFile
+
+import numpy as np
+
+from events import formatEvent
+
+# Columnar binary event log.
+#
+# The log file starts with a header (magic string, format version and chunk
+# size) and is followed by a sequence of chunks. Each chunk holds up to
+# 'chunkSize' events, stored as one contiguous array per field (columns), in
+# the order in which they were logged (hence, sorted by time). Every chunk
+# starts with a small header with the number of events it holds and the time
+# range it covers, so the file can be scanned even if its index is lost.
+#
+# Alongside the log, a sidecar index (same name, with an '.idx' suffix) maps
+# each chunk to its offset in the file, its time range and the ids of the
+# nodes that appear in it. The index is what allows loading only the chunks
+# relevant for a query such as "all events of STA 17 between t1 and t2".
+
+MAGIC = b'RAWEVLOG'
+VERSION = 1
+DEFAULT_CHUNK_SIZE = 65536
+INDEX_SUFFIX = '.idx'
+
+FILE_HEADER = struct.Struct('<8sII')
+CHUNK_HEADER = struct.Struct('<I4xdd')
+
+# Bits of the 'flags' column. The text log prints values using Python's str(),
+# which renders integers and floats differently, so we remember which fields
+# were integers to be able to reproduce the text log exactly.
+FLAG_INT_TIME = 1
+FLAG_INT_VALUE = 2
+FLAG_INT_AUX = 4
+
+# Layout of the in-memory records and of the columns in each chunk. Columns
+# are written in this order, which keeps them naturally aligned.
+COLUMNS = [('time', '<f8'), ('value', '<f8'), ('aux', '<f8'), ('node', '<i4'),
+	('peer', '<i4'), ('packet', '<i4'), ('count', '<i4'), ('code', 'u1'),
+	('flags', 'u1')]
+
+RECORD_DTYPE = np.dtype([('code', 'u1'), ('flags', 'u1'), ('time', '<f8'),
+	('node', '<i4'), ('peer', '<i4'), ('packet', '<i4'), ('count', '<i4'),
+	('value', '<f8'), ('aux', '<f8')])
+
+def _chunkBytes(count):
+
+	size = 0
+	for name, dtype in COLUMNS:
+		size = size + count * np.dtype(dtype).itemsize
+
+	# Pad the chunk so that the next one also starts at an aligned offset.
+	return size + (-size) % 8
+
+# Event sink that stores events in the columnar binary format.
+class EventLogWriter(object):
+
+	def __init__(self, path, level, chunkSize=DEFAULT_CHUNK_SIZE):
+
+		self.path = path
+		self.level = level
+		self.chunkSize = chunkSize
+		self.output = open(path, 'wb')
+		self.output.write(FILE_HEADER.pack(MAGIC, VERSION, chunkSize))
+		self.pending = []
+
+		# Index information, one entry per chunk.
+		self.chunkOffset = []
+		self.chunkCount = []
+		self.chunkStart = []
+		self.chunkEnd = []
+		self.chunkNodes = []
+
+	def write(self, code, time, node, peer, packet, count, value, aux):
+
+		flags = 0
+		if type(time) is int:
+			flags = FLAG_INT_TIME
+		if type(value) is int:
+			flags = flags | FLAG_INT_VALUE
+		if type(aux) is int:
+			flags = flags | FLAG_INT_AUX
+
+		self.pending.append((code, flags, time, node, peer, packet, count, value, aux))
+		if len(self.pending) >= self.chunkSize:
+			self.flush()
+
+	def flush(self):
+
+		if len(self.pending) == 0:
+			return
+
+		records = np.array(self.pending, dtype=RECORD_DTYPE)
+		self.pending = []
+		self.writeChunk(records)
+
+	def writeRecords(self, records):
+
+		# Write events already held in an array of RECORD_DTYPE, after those
+		# written one by one so far.
+		self.flush()
+		for start in range(0, len(records), self.chunkSize):
+			self.writeChunk(records[start:start + self.chunkSize])
+
+	def writeChunk(self, records):
+
+		self.chunkOffset.append(self.output.tell())
+		self.chunkCount.append(len(records))
+		self.chunkStart.append(records['time'][0])
+		self.chunkEnd.append(records['time'][-1])
+		self.chunkNodes.append(np.unique(records['node']))
+
+		self.output.write(CHUNK_HEADER.pack(len(records), records['time'][0], records['time'][-1]))
+		written = 0
+		for name, dtype in COLUMNS:
+			data = np.ascontiguousarray(records[name], dtype=dtype).tobytes()
+			self.output.write(data)
+			written = written + len(data)
+		self.output.write(b'\0' * (_chunkBytes(len(records)) - written))
+
+	def close(self):
+
+		self.flush()
+		self.output.close()
+		writeIndex(self.path, self.chunkOffset, self.chunkCount, self.chunkStart, self.chunkEnd, self.chunkNodes)
+
+def writeIndex(path, chunkOffset, chunkCount, chunkStart, chunkEnd, chunkNodes):
+
+	nodePtr = np.zeros(len(chunkNodes) + 1, dtype=np.int64)
+	for i in range(len(chunkNodes)):
+		nodePtr[i + 1] = nodePtr[i] + len(chunkNodes[i])
+
+	if len(chunkNodes) > 0:
+		nodeIds = np.concatenate(chunkNodes).astype(np.int32)
+	else:
+		nodeIds = np.zeros(0, dtype=np.int32)
+
+	# np.savez would append '.npz' to the name, so we hand it an open file.
+	with open(path + INDEX_SUFFIX, 'wb') as f:
+		np.savez(f, chunkOffset=np.array(chunkOffset, dtype=np.int64),
+			chunkCount=np.array(chunkCount, dtype=np.int64),
+			chunkStart=np.array(chunkStart, dtype=np.float64),
+			chunkEnd=np.array(chunkEnd, dtype=np.float64),
+			nodePtr=nodePtr, nodeIds=nodeIds)
+
+# Reader for logs in the columnar binary format. The file is memory-mapped, and
+# events are returned as dictionaries of NumPy arrays indexed by field name.
+class EventLog(object):
+
+	def __init__(self, path):
+
+		self.path = path
+		self.data = np.memmap(path, dtype=np.uint8, mode='r')
+
+		magic, version, self.chunkSize = FILE_HEADER.unpack_from(self.data, 0)
+		if magic != MAGIC:
+			raise ValueError(path + ' is not a binary event log')
+		if version != VERSION:
+			raise ValueError(path + ': unsupported event log version ' + str(version))
+
+		if os.path.exists(path + INDEX_SUFFIX):
+			self.loadIndex()
+		else:
+			self.rebuildIndex()
+
+	def loadIndex(self):
+
+		index = np.load(self.path + INDEX_SUFFIX)
+		self.chunkOffset = index['chunkOffset']
+		self.chunkCount = index['chunkCount']
+		self.chunkStart = index['chunkStart']
+		self.chunkEnd = index['chunkEnd']
+		self.nodePtr = index['nodePtr']
+		self.nodeIds = index['nodeIds']
+
+	def rebuildIndex(self):
+
+		# The index is missing (e.g., the simulation was interrupted). Walk
+		# the chunk headers to recover it and save it for next time.
+		chunkOffset = []
+		chunkCount = []
+		chunkStart = []
+		chunkEnd = []
+		chunkNodes = []
+
+		offset = FILE_HEADER.size
+		while offset + CHUNK_HEADER.size <= len(self.data):
+			count, start, end = CHUNK_HEADER.unpack_from(self.data, offset)
+			if count == 0 or offset + CHUNK_HEADER.size + _chunkBytes(count) > len(self.data):
+				break
+
+			chunkOffset.append(offset)
+			chunkCount.append(count)
+			chunkStart.append(start)
+			chunkEnd.append(end)
+			chunkNodes.append(np.unique(self._column(offset, count, 'node')))
+
+			offset = offset + CHUNK_HEADER.size + _chunkBytes(count)
+
+		writeIndex(self.path, chunkOffset, chunkCount, chunkStart, chunkEnd, chunkNodes)
+		self.loadIndex()
+
+	def _column(self, offset, count, field):
+
+		position = offset + CHUNK_HEADER.size
+		for name, dtype in COLUMNS:
+			dtype = np.dtype(dtype)
+			if name == field:
+				return np.frombuffer(self.data, dtype=dtype, count=count, offset=position)
+			position = position + count * dtype.itemsize
+
+	def __len__(self):
+
+		return int(self.chunkCount.sum())
+
+	def numberOfChunks(self):
+
+		return len(self.chunkOffset)
+
+	def chunk(self, i):
+
+		# Columns are views on the memory-mapped file: nothing is actually
+		# read until they are used.
+		columns = {}
+		for name, dtype in COLUMNS:
+			columns[name] = self._column(self.chunkOffset[i], self.chunkCount[i], name)
+
+		return columns
+
+	def chunksFor(self, nodes=None, start=None, end=None):
+
+		# Find the chunks that may hold events matching the query, based only
+		# on the index.
+		candidates = np.ones(len(self.chunkOffset), dtype=bool)
+
+		if start != None:
+			candidates = candidates & (self.chunkEnd >= start)
+		if end != None:
+			candidates = candidates & (self.chunkStart < end)
+
+		if nodes is not None:
+			positions = np.nonzero(np.isin(self.nodeIds, nodes))[0]
+			withNodes = np.zeros(len(self.chunkOffset), dtype=bool)
+			withNodes[np.searchsorted(self.nodePtr, positions, side='right') - 1] = True
+			candidates = candidates & withNodes
+
+		return np.nonzero(candidates)[0]
+
+	def select(self, nodes=None, start=None, end=None, codes=None):
+
+		# Return all events logged by any of 'nodes' (or all nodes, if None),
+		# with code in 'codes' (or any code, if None) and time in [start, end).
+		if nodes is not None:
+			nodes = np.atleast_1d(nodes)
+		if codes is not None:
+			codes = np.atleast_1d(codes)
+
+		parts = dict((name, []) for name, dtype in COLUMNS)
+		for i in self.chunksFor(nodes, start, end):
+
+			columns = self.chunk(i)
+
+			# Events are time-ordered within a chunk, so the time window
+			# translates to a contiguous range of records.
+			first = 0
+			last = self.chunkCount[i]
+			if start != None:
+				first = np.searchsorted(columns['time'], start, side='left')
+			if end != None:
+				last = np.searchsorted(columns['time'], end, side='left')
+
+			mask = np.ones(last - first, dtype=bool)
+			if nodes is not None:
+				mask = mask & np.isin(columns['node'][first:last], nodes)
+			if codes is not None:
+				mask = mask & np.isin(columns['code'][first:last], codes)
+
+			for name, dtype in COLUMNS:
+				parts[name].append(columns[name][first:last][mask])
+
+		result = {}
+		for name, dtype in COLUMNS:
+			if len(parts[name]) > 0:
+				result[name] = np.concatenate(parts[name])
+			else:
+				result[name] = np.zeros(0, dtype=dtype)
+
+		return result
+
+	def toText(self, stream, nodes=None, start=None, end=None):
+
+		# Write the events in the text format produced by simulator.py.
+		if nodes is None and start == None and end == None:
+			selections = (self.chunk(i) for i in range(len(self.chunkOffset)))
+		else:
+			selections = [self.select(nodes, start, end)]
+
+		for columns in selections:
+			lines = []
+			for code, flags, time, node, peer, packet, count, value, aux in zip(
+					columns['code'].tolist(), columns['flags'].tolist(),
+					columns['time'].tolist(), columns['node'].tolist(),
+					columns['peer'].tolist(), columns['packet'].tolist(),
+					columns['count'].tolist(), columns['value'].tolist(),
+					columns['aux'].tolist()):
+
+				if flags & FLAG_INT_TIME:
+					time = int(time)
+				if flags & FLAG_INT_VALUE:
+					value = int(value)
+				if flags & FLAG_INT_AUX:
+					aux = int(aux)
+
+				lines.append(formatEvent(code, time, node, peer, packet, count, value, aux) + '\n')
+
+			stream.write(''.join(lines))
+
+class _TextOutput(object):
+
+	def __init__(self, compressed):
+
+		if compressed:
+			self.output = GzipFile(fileobj=sys.stdout.buffer, mode='w')
+		else:
+			self.output = None
+
+	def write(self, data):
+
+		if self.output == None:
+			sys.stdout.write(data)
+		else:
+			self.output.write(data.encode())
+
+	def close(self):
+
+		if self.output != None:
+			self.output.close()
+		sys.stdout.flush()
+
+if __name__ == '__main__':
+
+	# Convert a binary event log to the text format.
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-f", "--file", help="binary event log to convert", type=str, required=True)
+	parser.add_argument("-N", "--nodes", help="only output events of these nodes", type=int, nargs='+', default=None)
+	parser.add_argument("-b", "--begin", help="only output events at or after this time in us", type=float, default=None)
+	parser.add_argument("-e", "--end", help="only output events before this time in us", type=float, default=None)
+	parser.add_argument("-z", "--zip", help="generate zipped output", default=False, action='store_const', const=True)
+
+	args = parser.parse_args()
+
+	output = _TextOutput(args.zip)
+	EventLog(args.file).toText(output, args.nodes, args.begin, args.end)
+	output.close()
@@ -0,0 +1,119 @@
+# Structured representation of the events found on the simulation log.
+#
+# Every event is described by the same set of fields, regardless of the output
+# format used to store it:
+#  - 'code' identifies the event type (one of the EVENT_* constants below).
+#  - 'time' is the simulation time, in us, at which the event happened.
+#  - 'node' is the id of the node that logged the event.
+#  - 'peer' is the id of the other end of the link (-1 if not applicable).
+#  - 'packet' is the id of the packet (-1 if not applicable).
+#  - 'count' is a number of simultaneous transmitters (-1 if not applicable).
+#  - 'value' is the main numeric payload of the event (0 if not applicable).
+#  - 'aux' is a secondary numeric payload of the event (0 if not applicable).
+#
+# The text format documented at the top of simulator.py is produced from these
+# fields by formatEvent(). Notice that the same textual tag may correspond to
+# more than one event code (e.g., 'D' is used both for deferrals and drops).
+
+EVENT_NEW_PACKET = 0
+EVENT_DEFER = 1
+EVENT_IN_SLOT = 2
+EVENT_BACKOFF_DRAW = 3
+EVENT_ABORT = 4
+EVENT_MEDIUM_BUSY = 5
+EVENT_MEDIUM_IDLE = 6
+EVENT_DIFS_START = 7
+EVENT_DIFS_INTERRUPT = 8
+EVENT_DIFS_OVER = 9
+EVENT_BACKOFF_START = 10
+EVENT_BACKOFF_INTERRUPT = 11
+EVENT_BACKOFF_OVER = 12
+EVENT_SUCCESS = 13
+EVENT_ACK_TIMEOUT = 14
+EVENT_DROP = 15
+EVENT_TX_START = 16
+EVENT_TX_END = 17
+EVENT_ENERGY_INCREASE = 18
+EVENT_ENERGY_DECREASE = 19
+EVENT_RX_START = 20
+EVENT_RX_END = 21
+EVENT_PER = 22
+EVENT_RX_FAIL = 23
+EVENT_RX_OK = 24
+EVENT_ACK_SIFS = 25
+EVENT_ACK_TX_START = 26
+EVENT_ACK_TX_END = 27
+EVENT_ACK_RX_START = 28
+EVENT_ACK_RX_END = 29
+EVENT_ACK_PER = 30
+EVENT_ACK_RX_FAIL = 31
+EVENT_ACK_RX_OK = 32
+EVENT_POWER_MATRIX = 33
+
+# Textual tag used for each event code in the text log.
+EVENT_TAGS = ['+', 'D', 'G', 'Cw', 'A', 'Ms', 'Mi', 'MDs', 'MDi', 'MDo', 'Bs',
+	'Bi', 'Bo', 'S', 'Ato', 'D', 'Ts', 'To', 'Ei', 'Ed', 'Rs', 'Ro', 'PER', 'd',
+	'r', 'MS', 'Ts', 'To', 'Rs', 'Ro', 'PER', 'd', 'r', 'PM']
+
+# Functions that render the fields of an event (after the time and node id) in
+# the text format. They are indexed by event code.
+def _packet(peer, packet, count, value, aux):
+	return str(packet)
+
+def _packetValue(peer, packet, count, value, aux):
+	return str(packet) + ' ' + str(value)
+
+def _packetAck(peer, packet, count, value, aux):
+	return str(packet) + ' [ack]'
+
+def _energy(peer, packet, count, value, aux):
+	return str(aux) + ' -> ' + str(value) + ' [ ' + str(count) + ']'
+
+def _peerPacket(peer, packet, count, value, aux):
+	return '_' + str(peer) + '_ ' + str(packet)
+
+def _peerPacketValue(peer, packet, count, value, aux):
+	return '_' + str(peer) + '_ ' + str(packet) + ' ' + str(value)
+
+def _peerPacketCount(peer, packet, count, value, aux):
+	return '_' + str(peer) + '_ ' + str(packet) + ' ' + str(count)
+
+def _peerPacketAck(peer, packet, count, value, aux):
+	return '_' + str(peer) + '_ ' + str(packet) + ' [ack]'
+
+def _ackValue(peer, packet, count, value, aux):
+	return str(packet) + '  [ack] ' + str(value)
+
+def _ackCount(peer, packet, count, value, aux):
+	return str(packet) + ' [ack] ' + str(count)
+
+_FORMATTERS = [_packet, _packetValue, _packetValue, _packetValue, _packet,
+	_packet, _packet, _packet, _packet, _packet, _packetValue, _packet, _packet,
+	_packet, _packetAck, _packet, _packet, _packet, _energy, _energy,
+	_peerPacket, _peerPacket, _peerPacketValue, _peerPacketCount,
+	_peerPacketCount, _peerPacketAck, _peerPacketAck, _peerPacketAck,
+	_packetAck, _packetAck, _ackValue, _ackCount, _ackCount, None]
+
+def formatEvent(code, time, node, peer, packet, count, value, aux):
+
+	if code == EVENT_POWER_MATRIX:
+		return 'PM ' + str(node) + ' -> ' + str(peer) + ' @ ' + str(value)
+
+	return EVENT_TAGS[code] + ' ' + str(time) + ' _' + str(node) + '_ ' + _FORMATTERS[code](peer, packet, count, value, aux)
+
+# Destination for the events generated by the simulation. Only events whose
+# level is not greater than the sink's level are delivered to it.
+class TextEventSink(object):
+
+	def __init__(self, stream, level):
+
+		self.stream = stream
+		self.level = level
+
+	def write(self, code, time, node, peer, packet, count, value, aux):
+
+		self.stream.write(formatEvent(code, time, node, peer, packet, count, value, aux) + '\n')
+
+	def close(self):
+
+		self.stream.close()
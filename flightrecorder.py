@@ -0,0 +1,198 @@
+import json
+import signal
+import struct
+import sys
+
+from events import *
+
+# Flight recorder (option -fr of simulator.py).
+#
+# Keeps the last events of every node in memory, whatever the verbosity of the
+# log, and writes them to disk only when something odd happens:
+#
+# - a station has had a given number of consecutive ack timeouts,
+# - a station drops a packet after too many retries,
+# - a station with a packet to transmit has logged nothing for a given time
+#   (e.g., it waits forever for the medium to become idle), or
+# - the process gets signal SIGUSR1 (the dump is written with the next event,
+#   or at the next check for stalled stations, so it never sees a record half
+#   written).
+#
+# Events are stored as fixed-size binary records in a single buffer, allocated
+# when the simulation starts, with room for the same number of records per node
+# (used as a circular buffer). Recording an event is a single struct.pack_into
+# call, and a dump converts the buffer to an event log with a few array
+# operations; whether a field was an integer or a float is not recorded, as that
+# would take a type check per field and event, so fields with integral values
+# are dumped as integers. The buffer counts towards the memory budget of scale
+# mode (option -M). A dump holds the records of all nodes, merged in the order
+# they were logged, as a binary event log (see eventlog.py), so the usual tools
+# can read it (e.g., 'python eventlog.py -f dump.bin' or 'python tracing.py');
+# a small JSON file next to it tells what triggered it.
+
+# Layout of a record: the fields of the event and its sequence number, which
+# orders the records of different nodes.
+# The same layout as a NumPy dtype, to read the buffer when dumping it. NumPy
+# (and the event log writer, which needs it) is only imported by the first
+# dump, as importing it takes longer than recording a short run.
+RECORD = struct.Struct('<BdiiiiddQ')
+RECORD_FIELDS = [('code', 'u1'), ('time', '<f8'), ('node', '<i4'),
+	('peer', '<i4'), ('packet', '<i4'), ('count', '<i4'), ('value', '<f8'),
+	('aux', '<f8'), ('sequence', '<u8')]
+
+# Time of the event, at its offset in a record.
+TIME = struct.Struct('<d')
+TIME_OFFSET = struct.calcsize('<B')
+
+# Events that may trigger a dump.
+TRIGGERS = frozenset([EVENT_ACK_TIMEOUT, EVENT_SUCCESS, EVENT_DROP])
+
+def bufferBytes(nodes, records):
+
+	# Size of the buffer of a flight recorder.
+	return nodes * records * RECORD.size
+
+class FlightRecorder(object):
+
+	def __init__(self, sim, prefix, level=0, records=64, ackTimeouts=5, stall=None, maxDumps=10):
+
+		self.sim = sim
+		self.env = sim.env
+		self.level = level
+		self.prefix = prefix
+
+		nodes = len(sim.medium.nodeList)
+		self.records = records
+		self.buffer = bytearray(bufferBytes(nodes, records))
+		self.positions = [0] * nodes
+		self.stride = records * RECORD.size
+		self.sequence = 0
+
+		# Triggers.
+		self.ackTimeouts = ackTimeouts
+		self.consecutiveTimeouts = [0] * nodes
+		self.stall = stall
+		self.stalled = set()
+
+		self.dumps = 0
+		self.maxDumps = maxDumps
+
+		# Dump on SIGUSR1, where the platform has it and we are in the main
+		# thread.
+		self.signalPending = False
+		self.handlingSignal = False
+		if hasattr(signal, 'SIGUSR1'):
+			try:
+				self.previousHandler = signal.signal(signal.SIGUSR1, self.signalled)
+				self.handlingSignal = True
+			except ValueError:
+				pass
+
+	def start(self):
+
+		if self.stall != None:
+			self.env.process(self.watch())
+
+	def write(self, code, time, node, peer, packet, count, value, aux):
+
+		position = self.positions[node]
+		self.positions[node] = position + 1
+		RECORD.pack_into(self.buffer, node * self.stride + position % self.records * RECORD.size,
+			code, time, node, peer, packet, count, value, aux, self.sequence)
+		self.sequence = self.sequence + 1
+
+		if code in TRIGGERS:
+			self.triggered(code, node)
+		if self.signalPending:
+			self.signalPending = False
+			self.dump('signal', -1)
+
+	def triggered(self, code, node):
+
+		if code == EVENT_ACK_TIMEOUT:
+			self.consecutiveTimeouts[node] = self.consecutiveTimeouts[node] + 1
+			if self.consecutiveTimeouts[node] == self.ackTimeouts:
+				self.dump('ackTimeouts', node)
+		elif code == EVENT_SUCCESS:
+			self.consecutiveTimeouts[node] = 0
+		elif code == EVENT_DROP:
+			self.dump('drop', node)
+
+	def watch(self):
+
+		# Look for stations that have a packet, but have logged nothing for
+		# 'stall' us. Each one triggers a single dump until it logs again.
+		while True:
+			yield self.env.timeout(self.stall / 2.0)
+			if self.signalPending:
+				self.signalPending = False
+				self.dump('signal', -1)
+			for node in self.sim.nodeList:
+				id = node.getId()
+				if node.hasPacket and self.env.now - self.lastEvent(id) >= self.stall:
+					if id not in self.stalled:
+						self.stalled.add(id)
+						self.dump('stall', id)
+				else:
+					self.stalled.discard(id)
+
+	def lastEvent(self, node):
+
+		# Time of the last event of a node (0 if it has logged none).
+		position = self.positions[node]
+		if position == 0:
+			return 0.0
+		return TIME.unpack_from(self.buffer, node * self.stride + (position - 1) % self.records * RECORD.size + TIME_OFFSET)[0]
+
+	def signalled(self, number, frame):
+
+		# The signal may come in the middle of write(), so only take note of
+		# it here.
+		self.signalPending = True
+
+	def dump(self, trigger, node):
+
+		if self.dumps >= self.maxDumps:
+			return
+		self.dumps = self.dumps + 1
+
+		path = self.prefix + '.' + str(self.dumps) + '.bin'
+		sys.stderr.write('Flight recorder: ' + trigger + (' of node ' + str(node) if node >= 0 else '') + ' at ' + str(self.env.now) + ', dumped to ' + path + '.\n')
+
+		import numpy as np
+		import eventlog
+
+		# Records held by each node (the first slots of its buffer until it
+		# wraps around, then all of them), merged in logging order.
+		records = np.frombuffer(self.buffer, dtype=np.dtype(RECORD_FIELDS)).reshape(len(self.positions), self.records)
+		held = np.arange(self.records) < np.minimum(self.positions, self.records)[:, None]
+		records = records[held]
+		records = records[np.argsort(records['sequence'])]
+
+		# Convert them to the records of the event log in one go, with the
+		# fields that have integral values flagged as integers.
+		events = np.zeros(len(records), dtype=eventlog.RECORD_DTYPE)
+		for name in ('code', 'time', 'node', 'peer', 'packet', 'count', 'value', 'aux'):
+			events[name] = records[name]
+		for name, flag in (('time', eventlog.FLAG_INT_TIME), ('value', eventlog.FLAG_INT_VALUE), ('aux', eventlog.FLAG_INT_AUX)):
+			events['flags'] |= np.where(np.mod(records[name], 1.0) == 0, flag, 0).astype(np.uint8)
+
+		writer = eventlog.EventLogWriter(path, self.level)
+		writer.writeRecords(events)
+		writer.close()
+
+		with open(self.prefix + '.' + str(self.dumps) + '.json', 'w') as f:
+			json.dump({'trigger': trigger, 'node': node, 'time': self.env.now, 'log': path,
+				'records': len(records), 'recordsPerNode': self.records}, f, indent=1, sort_keys=True)
+			f.write('\n')
+
+	def close(self):
+
+		# A signal that came after the last event.
+		if self.signalPending:
+			self.signalPending = False
+			self.dump('signal', -1)
+
+		if self.handlingSignal:
+			signal.signal(signal.SIGUSR1, self.previousHandler if self.previousHandler != None else signal.SIG_DFL)
+			self.handlingSignal = False
@@ -0,0 +1,266 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from simulator import Simulation, CS_THRESHOLD
+
+# Search for a good assignment of stations to RAW groups.
+#
+# A set of candidate groupings is generated for a fixed scenario (node
+# positions), and the candidates are compared by simulating them. To save
+# compute, candidates are evaluated with successive halving: all of them are
+# first simulated for a short time, only the best half is simulated again for
+# twice as long, and so on, until the maximum length is reached.
+
+### Candidate generation
+#
+# Each generator returns a list of groups indexed by node id (the AP, node 0,
+# has no group), for the scenario given by 'positions' (a list of (x, y)
+# tuples indexed by node id) and 'powerMatrix'.
+
+def balancedGroups(positions, numberOfGroups, rng=None):
+
+	# Same as the arbitrary grouping used by RAW, optionally over a random
+	# permutation of the stations.
+	stations = list(range(1, len(positions)))
+	if rng != None:
+		rng.shuffle(stations)
+
+	groups = [None] * len(positions)
+	for i in range(len(stations)):
+		groups[stations[i]] = i % numberOfGroups
+
+	return groups
+
+def sectorGroups(positions, numberOfGroups, offset=0.0):
+
+	# Split the scenario in angular sectors around the AP, with the same
+	# number of stations in each one.
+	apX, apY = positions[0]
+	stations = sorted(range(1, len(positions)), key=lambda i: (math.atan2(positions[i][1] - apY, positions[i][0] - apX) - offset) % (2 * math.pi))
+
+	groups = [None] * len(positions)
+	for i in range(len(stations)):
+		groups[stations[i]] = i * numberOfGroups // len(stations)
+
+	return groups
+
+def clusteredGroups(positions, numberOfGroups, rng, iterations=10):
+
+	# k-means over the positions of the stations, with the size of each
+	# cluster limited so that groups remain balanced.
+	stations = list(range(1, len(positions)))
+	capacity = int(math.ceil(len(stations) / float(numberOfGroups)))
+	centers = [positions[i] for i in rng.sample(stations, numberOfGroups)]
+	groups = [None] * len(positions)
+
+	for iteration in range(iterations):
+
+		# Assign stations to the nearest center with room left, nearest
+		# pairs first.
+		pairs = []
+		for i in stations:
+			for g in range(numberOfGroups):
+				pairs.append(((positions[i][0] - centers[g][0])**2 + (positions[i][1] - centers[g][1])**2, i, g))
+		pairs.sort()
+
+		groups = [None] * len(positions)
+		sizes = [0] * numberOfGroups
+		for dist, i, g in pairs:
+			if groups[i] == None and sizes[g] < capacity:
+				groups[i] = g
+				sizes[g] = sizes[g] + 1
+
+		for g in range(numberOfGroups):
+			members = [i for i in stations if groups[i] == g]
+			if len(members) > 0:
+				centers[g] = (sum(positions[i][0] for i in members) / float(len(members)), sum(positions[i][1] for i in members) / float(len(members)))
+
+	return groups
+
+def areHidden(powerMatrix, i, j):
+
+	# Two stations are hidden from each other if none of them can sense the
+	# other's transmissions.
+	return powerMatrix[i][j] <= CS_THRESHOLD and powerMatrix[j][i] <= CS_THRESHOLD
+
+def interferenceAwareGroups(positions, powerMatrix, numberOfGroups, rng=None):
+
+	# Greedily place each station in the group where it is hidden from the
+	# fewest stations, keeping groups balanced. Stations hidden from many
+	# others are placed first, since they are the hardest to accommodate.
+	stations = list(range(1, len(positions)))
+	capacity = int(math.ceil(len(stations) / float(numberOfGroups)))
+	hidden = {}
+	for i in stations:
+		hidden[i] = [j for j in stations if j != i and areHidden(powerMatrix, i, j)]
+
+	if rng != None:
+		rng.shuffle(stations)
+	stations.sort(key=lambda i: -len(hidden[i]))
+
+	groups = [None] * len(positions)
+	sizes = [0] * numberOfGroups
+	for i in stations:
+
+		conflicts = [0] * numberOfGroups
+		for j in hidden[i]:
+			if groups[j] != None:
+				conflicts[groups[j]] = conflicts[groups[j]] + 1
+
+		best = None
+		for g in range(numberOfGroups):
+			if sizes[g] < capacity and (best == None or (conflicts[g], sizes[g]) < (conflicts[best], sizes[best])):
+				best = g
+
+		groups[i] = best
+		sizes[best] = sizes[best] + 1
+
+	return groups
+
+def generateCandidates(positions, powerMatrix, numberOfGroups, variants, seed):
+
+	# Returns a list of (name, groups) tuples.
+	rng = random.Random(seed)
+	candidates = [('balanced', balancedGroups(positions, numberOfGroups))]
+
+	for k in range(variants):
+		candidates.append(('sector-' + str(k), sectorGroups(positions, numberOfGroups, 2 * math.pi * k / (variants * numberOfGroups))))
+		candidates.append(('interference-' + str(k), interferenceAwareGroups(positions, powerMatrix, numberOfGroups, rng if k > 0 else None)))
+		candidates.append(('clustered-' + str(k), clusteredGroups(positions, numberOfGroups, rng)))
+		if k > 0:
+			candidates.append(('balanced-' + str(k), balancedGroups(positions, numberOfGroups, rng)))
+
+	# Drop duplicates.
+	unique = []
+	seen = set()
+	for name, groups in candidates:
+		if tuple(groups) not in seen:
+			seen.add(tuple(groups))
+			unique.append((name, groups))
+
+	return unique
+
+def writeGroupsFile(path, positions, groups):
+
+	# Write a grouping in the format read by the -G option of the simulator.
+	f = open(path, 'w')
+	for i in range(1, len(positions)):
+		f.write(str(groups[i]) + '[' + str(positions[i][0]) + ', ' + str(positions[i][1]) + ']\n')
+	f.close()
+
+### Evaluation
+
+def evaluate(config):
+
+	results = Simulation(config).run()
+	return results['total']
+
+def score(totals, length):
+
+	# Number of successfully transmitted packets per second.
+	return totals['success'] / (length / 1e6)
+
+def successiveHalving(candidates, baseConfig, groupsFiles, minLength, maxLength, seeds, eta, jobs):
+
+	# With eta = 1, no candidate would ever be dropped nor would the rounds
+	# get longer, and with eta = 0 the rounds would get no time.
+	if eta < 2:
+		raise ValueError('the reduction factor of successive halving must be at least 2')
+
+	survivors = list(range(len(candidates)))
+	length = minLength
+	rounds = []
+	simulatedTime = 0
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		while True:
+
+			tasks = []
+			for c in survivors:
+				for seed in seeds:
+					config = dict(baseConfig)
+					config.update({'groupsFromFile': groupsFiles[c], 'length': length, 'seed': seed})
+					tasks.append((c, config))
+
+			scores = dict((c, 0.0) for c in survivors)
+			totals = dict((c, []) for c in survivors)
+			for (c, config), result in zip(tasks, executor.map(evaluate, [config for c, config in tasks])):
+				scores[c] = scores[c] + score(result, length) / len(seeds)
+				totals[c].append(result)
+			simulatedTime = simulatedTime + length * len(tasks)
+
+			survivors.sort(key=lambda c: -scores[c])
+			rounds.append({'length': length, 'ranking': [{'candidate': candidates[c][0], 'score': scores[c], 'totals': totals[c]} for c in survivors]})
+			sys.stderr.write('Evaluated ' + str(len(survivors)) + ' candidates for ' + str(length) + ' us; best: ' + candidates[survivors[0]][0] + ' (' + str(scores[survivors[0]]) + ' packets/s)\n')
+
+			if length >= maxLength:
+				break
+
+			survivors = survivors[:max(1, int(math.ceil(len(survivors) / float(eta))))]
+			length = min(length * eta, maxLength)
+
+	return survivors[0], rounds, simulatedTime
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-n", "--numberOfSTAs", help="number of STAs in the simulation", type=int, default=1)
+	parser.add_argument("-g", "--numberOfGroups", help="number of RAW grous in the simulation", type=int, default=1)
+	parser.add_argument("-G", "--groupsFromFile", type=str, help="take the positions of the stations from this grouping file (the grouping itself is also evaluated as a candidate)", default=None)
+	parser.add_argument("-S", "--slotSize", help="length of the slot of each group in us", type=int, default=50e3)
+	parser.add_argument("-W", "--scenarioWidth", help="width of the area used for positioning nodes in m", type=int, default=1000)
+	parser.add_argument("-H", "--scenarioHeight", help="height of the area used for positioning nodes in m", type=int, default=1000)
+	parser.add_argument("-s", "--seed", help="seed for the pseudo-random number generator", type=int, default=random.randint(0, 99999999))
+	parser.add_argument("-r", "--rate", help="average packet generation rate for each node in packet/us", type=float, default=10000)
+	parser.add_argument("-l", "--minLength", help="simulation length of the first (shortest) evaluation round in us", type=float, default=1e6)
+	parser.add_argument("-L", "--maxLength", help="simulation length of the last (longest) evaluation round in us", type=float, default=2e7)
+	parser.add_argument("-k", "--variants", help="number of candidates generated with each strategy", type=int, default=4)
+	parser.add_argument("-R", "--replications", help="number of seeds each candidate is simulated with in each round", type=int, default=1)
+	parser.add_argument("-e", "--eta", help="reduction factor of successive halving (1/eta of the candidates survive each round; at least 2)", type=int, default=2)
+	parser.add_argument("-j", "--jobs", help="number of worker processes (default: number of CPUs)", type=int, default=None)
+	parser.add_argument("-o", "--output", help="file where the best grouping is written (in the format accepted by -G)", type=str, required=True)
+
+	args = parser.parse_args()
+
+	# Build the scenario (without simulating it) to get the positions of the
+	# nodes and the received power matrix.
+	baseConfig = {'numberOfSTAs': args.numberOfSTAs, 'numberOfGroups': args.numberOfGroups,
+		'slotSize': args.slotSize, 'scenarioWidth': args.scenarioWidth,
+		'scenarioHeight': args.scenarioHeight, 'rate': args.rate}
+	scenario = Simulation(dict(baseConfig, seed=args.seed, groupsFromFile=args.groupsFromFile))
+	scenario.setup()
+	positions = [(node.getPosX(), node.getPosY()) for node in [scenario.ap] + scenario.nodeList]
+	baseConfig['numberOfSTAs'] = len(positions) - 1
+
+	candidates = generateCandidates(positions, scenario.medium.powerMatrix, args.numberOfGroups, args.variants, args.seed)
+	if args.groupsFromFile != None:
+		candidates.insert(0, ('file', scenario.groups))
+
+	directory = tempfile.mkdtemp()
+	try:
+		groupsFiles = []
+		for c in range(len(candidates)):
+			groupsFiles.append(os.path.join(directory, str(c) + '.txt'))
+			writeGroupsFile(groupsFiles[c], positions, candidates[c][1])
+
+		seeds = [args.seed + i for i in range(args.replications)]
+		best, rounds, simulatedTime = successiveHalving(candidates, baseConfig, groupsFiles, args.minLength, args.maxLength, seeds, args.eta, args.jobs)
+	finally:
+		shutil.rmtree(directory)
+
+	writeGroupsFile(args.output, positions, candidates[best][1])
+
+	output = {'best': candidates[best][0], 'score': rounds[-1]['ranking'][0]['score'],
+		'totals': rounds[-1]['ranking'][0]['totals'], 'rounds': rounds,
+		'candidates': len(candidates), 'simulatedTime': simulatedTime,
+		'fullEvaluationTime': len(candidates) * len(seeds) * args.maxLength}
+	json.dump(output, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
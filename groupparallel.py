@@ -0,0 +1,154 @@
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from events import *
+from runstats import COUNTERS, RunStatistics
+from simulator import ACK_PACKET_TIME, SIFS, Simulation, makeConfig
+from sweep import parseOptions
+
+# Per-group parallel simulation of a RAW scenario.
+#
+# Only the stations of one group contend in each RAW slot, and stations of
+# other groups sleep until their own slot. A station only transmits a data
+# frame if it fits in the slot of its group, so a group can only affect the
+# next one in two ways:
+#
+# - The ack the AP sends for a frame that ends right before the end of the
+#   slot may spill over the next slot, by at most SIFS plus the duration of
+#   the ack, where the stations of the next group sense it (and it may
+#   interfere with their first transmissions).
+# - Stations only notice that their slot is over once their DIFS or backoff
+#   count down ends, and give up their packet then. Meanwhile, the
+#   transmissions of the next group may interrupt the count down, which makes
+#   them give up their packet earlier and get the next one sooner.
+#
+# In a contended slot, both happen in almost every cycle, so the groups are
+# made isolated by construction instead (option -iso): stations stop
+# contending as soon as their slot ends, and only start a transmission if it
+# and the wait for its ack (which covers the ack spill above) end within the
+# slot.
+#
+# Each group is simulated by a different process, with only its stations
+# running (option -og, which implies -iso), and the counters of all groups are
+# added up. The result is that of the complete simulation with isolated
+# slots: with common random numbers (-crn), each station draws the same
+# numbers as in the complete simulation, so it is exactly the same. The acks
+# that spill over the slot of another group and the stations that give up
+# their packet during it are still counted, as a check: there must be none.
+
+# Longest time a transmission of a group can go on after the end of its
+# slot without isolated slots (the ack of a data frame that ends with the
+# slot).
+OVERLAP_BOUND = SIFS + ACK_PACKET_TIME
+
+# Event sink that counts the transmissions of a group that end after the end
+# of its slot, and the stations that give up their packet after it, with the
+# time they overlap with the following slot.
+class SlotSpill(object):
+
+	def __init__(self, group, numberOfGroups, slotSize):
+
+		self.level = 0
+		self.group = group
+		self.numberOfGroups = numberOfGroups
+		self.slotSize = slotSize
+
+		self.spills = 0
+		self.overlap = 0.0
+		self.maxOverlap = 0.0
+		self.lateAborts = 0
+		self.maxLateness = 0.0
+
+	def write(self, code, time, node, peer, packet, count, value, aux):
+
+		if code != EVENT_TX_END and code != EVENT_ACK_TX_END and code != EVENT_ABORT:
+			return
+
+		slot = int(time // self.slotSize)
+		overlap = time - slot * self.slotSize
+		if slot % self.numberOfGroups == self.group or overlap == 0:
+			return
+
+		if code == EVENT_ABORT:
+			self.lateAborts = self.lateAborts + 1
+			self.maxLateness = max(self.maxLateness, overlap)
+			return
+
+		self.spills = self.spills + 1
+		self.overlap = self.overlap + overlap
+		self.maxOverlap = max(self.maxOverlap, overlap)
+
+	def close(self):
+
+		pass
+
+	def summary(self):
+
+		return {'group': self.group, 'spills': self.spills, 'overlap': self.overlap, 'maxOverlap': self.maxOverlap,
+			'lateAborts': self.lateAborts, 'maxLateness': self.maxLateness}
+
+def runGroup(config):
+
+	sim = Simulation(config)
+	results = sim.run()
+	return results, sim.groups
+
+def groupParallel(options, jobs=None):
+
+	config = makeConfig(options)
+	if config.onlyGroup != None:
+		raise ValueError('option onlyGroup is set by the per-group simulation')
+	if config.binaryLog != None or config.trace != None:
+		raise ValueError('per-group runs do not support event logs or traces')
+	if config.disableRawScheduler:
+		raise ValueError('per-group runs need the RAW scheduler')
+
+	points = []
+	for group in range(config.numberOfGroups):
+		point = dict(vars(config))
+		point['onlyGroup'] = group
+		point['isolatedSlots'] = True
+		points.append(point)
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		outputs = list(executor.map(runGroup, points))
+
+	# Add up the counters of all groups.
+	statistics = RunStatistics(outputs[0][1])
+	spills = []
+	for results, groups in outputs:
+		for node, counters in results['nodes'].items():
+			for i in range(len(COUNTERS)):
+				statistics.count(int(node), i, counters[COUNTERS[i]])
+		spills.append(results['slotSpill'])
+
+	summary = statistics.summary()
+	total = sum(spill['spills'] for spill in spills)
+	lateAborts = sum(spill['lateAborts'] for spill in spills)
+	summary['groupParallel'] = {'groups': config.numberOfGroups, 'spills': total,
+		'maxOverlap': max(spill['maxOverlap'] for spill in spills), 'overlapBound': OVERLAP_BOUND,
+		'lateAborts': lateAborts, 'maxLateness': max(spill['maxLateness'] for spill in spills),
+		'exact': total == 0 and lateAborts == 0 and (config.commonRandomNumbers or config.antithetic),
+		'perGroup': spills}
+
+	return summary
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-o", "--option", help="option of the simulation (e.g., numberOfSTAs=200); may be repeated", type=str, action='append', default=[])
+	parser.add_argument("-j", "--jobs", help="number of worker processes (default: number of CPUs)", type=int, default=None)
+
+	args = parser.parse_args()
+
+	options = {}
+	for option, values in parseOptions(args.option).items():
+		options[option] = values[0]
+
+	summary = groupParallel(options, args.jobs)
+
+	json.dump(summary, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
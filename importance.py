@@ -0,0 +1,93 @@
+import math
+
+# Importance sampling of frame losses (options -is and -isb of simulator.py).
+#
+# When frames are almost always received, SINR losses are too rare to be
+# counted in runs of a reasonable length. The sampler draws frame receptions
+# (and, optionally, backoff counters) from a distribution biased towards
+# failure, and keeps a likelihood ratio: the product, over the biased draws,
+# of the probability of the outcome under the model divided by its probability
+# under the biased distribution. Events counted by the statistics collector
+# are weighted by the likelihood ratio, which makes the weighted counts
+# estimates of the counts of the unbiased model.
+#
+# A likelihood ratio over a whole run would be a product of thousands of
+# factors, whose variance makes it useless. Instead, each station keeps the
+# likelihood ratio of the packet it is currently handling (the draws of its
+# data frames, acks and backoff counters since the packet was generated), and
+# its events are weighted by it. This is exact for a station alone; with
+# several stations, it neglects the (small) effect that the extra
+# retransmissions caused by the bias have on the other stations. The
+# effective sample size reported for each counter tells how many of its
+# events actually contribute to the estimate.
+
+class ImportanceSampler(object):
+
+	def __init__(self, failureProbability=None, backoffFraction=None):
+
+		# Receptions whose failure probability is below 'failureProbability'
+		# fail with that probability instead.
+		self.failureProbability = failureProbability
+
+		# With probability 1/2, backoff counters are drawn from the lowest
+		# 'backoffFraction' of the contention window (making collisions more
+		# likely), and from the whole window otherwise.
+		self.backoffFraction = backoffFraction
+
+		# Logarithm of the likelihood ratio of the current packet of each
+		# station, indexed by node id.
+		self.logLikelihoodRatio = {}
+		self.biasedDraws = 0
+
+	def newPacket(self, node):
+
+		self.logLikelihoodRatio[node] = 0.0
+
+	def update(self, node, ratio):
+
+		self.logLikelihoodRatio[node] = self.logLikelihoodRatio.get(node, 0.0) + math.log(ratio)
+		self.biasedDraws = self.biasedDraws + 1
+
+	def weight(self, node):
+
+		return math.exp(self.logLikelihoodRatio.get(node, 0.0))
+
+	def receptionFails(self, node, draw, receptionProbability):
+
+		# Decide, from the uniform 'draw', whether a frame of the station 'node'
+		# (data frame sent or ack received) is lost, given the probability
+		# that it is received. Without bias, it is lost if the draw is above
+		# that probability.
+		failureProbability = 1 - receptionProbability
+		if self.failureProbability == None or failureProbability <= 0 or failureProbability >= self.failureProbability:
+			return draw > receptionProbability
+
+		failed = draw > 1 - self.failureProbability
+		if failed:
+			self.update(node, failureProbability / self.failureProbability)
+		else:
+			self.update(node, receptionProbability / (1 - self.failureProbability))
+
+		return failed
+
+	def drawBackoff(self, node, rng, cw):
+
+		if self.backoffFraction == None:
+			return rng.randint(0, cw)
+
+		low = int(cw * self.backoffFraction)
+		if rng.random() < 0.5:
+			backoff = rng.randint(0, low)
+		else:
+			backoff = rng.randint(0, cw)
+
+		biased = 0.5 / (cw + 1)
+		if backoff <= low:
+			biased = biased + 0.5 / (low + 1)
+		self.update(node, (1.0 / (cw + 1)) / biased)
+
+		return backoff
+
+	def summary(self):
+
+		return {'biasedDraws': self.biasedDraws}
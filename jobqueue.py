@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+from resultstore import resultKey
+
+# Job queue in a shared directory (e.g., an NFS mount), for sweeps run by
+# workers on several machines without any scheduler or broker.
+#
+# Each job is a file with the options of a simulation, named after the key of
+# the run in the result store (see resultstore.py), so the same run is never
+# queued twice. Jobs move between subdirectories of the queue:
+#
+#   pending/KEY.json            waiting for a worker
+#   running/KEY@WORKER.json     claimed by a worker
+#   done/KEY.json               finished, with its results
+#   failed/KEY.json             the simulation raised an error
+#
+# A worker claims a job by renaming it from pending/ to running/, which
+# succeeds for a single worker even if several try at once. Files are always
+# written under a temporary name in their final directory and then renamed,
+# so readers never see a partial file.
+#
+# While it runs a job, a worker touches the job file every few seconds (the
+# heartbeat). A job whose file has not been touched for a while is taken to
+# belong to a worker that died, and any worker moves it back to pending/. The
+# clocks of the machines must roughly agree, and the time after which a job
+# is stale must be much longer than the heartbeat interval. A worker that was
+# only slow still writes its results, which are the same as those of the
+# worker that runs the job again.
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Default heartbeat interval and time after which a running job is stale, in
+# seconds.
+HEARTBEAT = 30.0
+STALE_AFTER = 300.0
+
+def workerName():
+
+	return socket.gethostname() + '.' + str(os.getpid())
+
+class JobQueue(object):
+
+	def __init__(self, path):
+
+		self.path = path
+		for directory in [PENDING, RUNNING, DONE, FAILED]:
+			os.makedirs(os.path.join(path, directory), exist_ok=True)
+
+	def file(self, directory, name):
+
+		return os.path.join(self.path, directory, name)
+
+	def write(self, directory, name, content):
+
+		# Write a file atomically: temporary files start with a dot, and are
+		# ignored by everyone else.
+		temporary = self.file(directory, '.' + name + '.' + workerName())
+		with open(temporary, 'w') as f:
+			json.dump(content, f, sort_keys=True)
+		os.replace(temporary, self.file(directory, name))
+
+	def list(self, directory):
+
+		return [name for name in os.listdir(os.path.join(self.path, directory)) if not name.startswith('.')]
+
+	def state(self, key):
+
+		# Directory the job with this key is in, or None if it is not queued.
+		for directory in [DONE, FAILED, PENDING]:
+			if os.path.exists(self.file(directory, key + '.json')):
+				return directory
+		for name in self.list(RUNNING):
+			if name.startswith(key + '@'):
+				return RUNNING
+
+		return None
+
+	def submit(self, configs):
+
+		# Queue the simulations with these options that are not queued yet
+		# (or failed). Returns the keys of all of them.
+		keys = []
+		for config in configs:
+			key = resultKey(config)
+			keys.append(key)
+			state = self.state(key)
+			if state == None or state == FAILED:
+				if state == FAILED:
+					os.remove(self.file(FAILED, key + '.json'))
+				self.write(PENDING, key + '.json', {'key': key, 'config': config, 'submitted': time.time()})
+
+		return keys
+
+	def claim(self, worker):
+
+		# Claim a pending job. Returns the job and the path of its file in
+		# running/, or None if there is no pending job. Workers try the jobs
+		# in random order, so they seldom compete for the same one.
+		names = self.list(PENDING)
+		random.shuffle(names)
+		for name in names:
+			key = name[:-len('.json')]
+			pending = self.file(PENDING, name)
+			running = self.file(RUNNING, key + '@' + worker + '.json')
+
+			# Start the heartbeat of the job before it moves to running/: the
+			# rename keeps the time the job was submitted, and a worker
+			# reclaiming jobs in between would take it as stale right away.
+			try:
+				os.utime(pending)
+				os.rename(pending, running)
+			except FileNotFoundError:
+				continue
+
+			# The job is ours, unless another worker already reclaimed it.
+			try:
+				with open(running) as f:
+					return json.load(f), running
+			except FileNotFoundError:
+				continue
+
+		return None
+
+	def reclaim(self, staleAfter=STALE_AFTER):
+
+		# Move back to pending/ the running jobs whose heartbeat stopped.
+		# Returns the number of jobs moved.
+		reclaimed = 0
+		now = time.time()
+		for name in self.list(RUNNING):
+			path = self.file(RUNNING, name)
+			try:
+				if now - os.stat(path).st_mtime < staleAfter:
+					continue
+				os.rename(path, self.file(PENDING, name.split('@', 1)[0] + '.json'))
+			except FileNotFoundError:
+				continue
+			reclaimed = reclaimed + 1
+
+		return reclaimed
+
+	def complete(self, job, running, results, duration, worker):
+
+		self.write(DONE, job['key'] + '.json', {'key': job['key'], 'config': job['config'], 'results': results,
+			'duration': duration, 'worker': worker, 'finished': time.time()})
+		self.release(running)
+
+	def fail(self, job, running, error, worker):
+
+		self.write(FAILED, job['key'] + '.json', {'key': job['key'], 'config': job['config'], 'error': error,
+			'worker': worker, 'finished': time.time()})
+		self.release(running)
+
+	def release(self, running):
+
+		# The job may have been reclaimed meanwhile, if we were too slow.
+		try:
+			os.remove(running)
+		except FileNotFoundError:
+			pass
+
+	def result(self, directory, key):
+
+		# Contents of the file of a finished (or failed) job.
+		with open(self.file(directory, key + '.json')) as f:
+			return json.load(f)
+
+	def status(self):
+
+		return dict((directory, len(self.list(directory))) for directory in [PENDING, RUNNING, DONE, FAILED])
+
+# Touches the file of a running job every 'interval' seconds, until stopped.
+class Heartbeat(threading.Thread):
+
+	def __init__(self, path, interval):
+
+		threading.Thread.__init__(self, daemon=True)
+		self.path = path
+		self.interval = interval
+		self.stopped = threading.Event()
+
+	def run(self):
+
+		while not self.stopped.wait(self.interval):
+			try:
+				os.utime(self.path)
+			except FileNotFoundError:
+				# Reclaimed by another worker: keep running the job anyway.
+				pass
+
+	def stop(self):
+
+		self.stopped.set()
+		self.join()
+
+def work(path, heartbeat=HEARTBEAT, staleAfter=STALE_AFTER, poll=5.0, exitWhenIdle=False, maxJobs=None):
+
+	# Run the jobs of the queue until it is empty (with 'exitWhenIdle') or
+	# forever. Returns the number of jobs run.
+	from simulator import Simulation
+
+	queue = JobQueue(path)
+	worker = workerName()
+	done = 0
+	while maxJobs == None or done < maxJobs:
+
+		queue.reclaim(staleAfter)
+		claimed = queue.claim(worker)
+		if claimed == None:
+			if exitWhenIdle and len(queue.list(RUNNING)) == 0:
+				break
+			time.sleep(poll)
+			continue
+
+		job, running = claimed
+		beat = Heartbeat(running, heartbeat)
+		beat.start()
+		start = time.time()
+		try:
+			results = Simulation(job['config']).run()
+		except Exception as e:
+			beat.stop()
+			queue.fail(job, running, type(e).__name__ + ': ' + str(e), worker)
+			sys.stderr.write(worker + ': job ' + job['key'] + ' failed: ' + type(e).__name__ + ': ' + str(e) + '\n')
+		else:
+			beat.stop()
+			queue.complete(job, running, results, time.time() - start, worker)
+			sys.stderr.write(worker + ': job ' + job['key'] + ' done (' + str(round(time.time() - start, 1)) + ' s)\n')
+		done = done + 1
+
+	return done
+
+def workers(path, jobs=1, **options):
+
+	# Run 'jobs' workers on this machine, each in its own process.
+	if jobs == 1:
+		return work(path, **options)
+
+	from concurrent.futures import ProcessPoolExecutor
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = [executor.submit(work, path, **options) for i in range(jobs)]
+		return sum(future.result() for future in futures)
+
+if __name__ == '__main__':
+
+	# Sweeps are queued with 'sweep.py -Q'; this runs workers and shows the
+	# state of a queue.
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-Q", "--queue", help="directory of the queue", type=str, required=True)
+	parser.add_argument("-w", "--work", help="run workers, instead of only showing the state of the queue", default=False, action='store_const', const=True)
+	parser.add_argument("-j", "--jobs", help="number of workers", type=int, default=1)
+	parser.add_argument("-e", "--exitWhenIdle", help="stop the workers once no job is pending or running", default=False, action='store_const', const=True)
+	parser.add_argument("-hb", "--heartbeat", help="interval between heartbeats of a running job, in seconds", type=float, default=HEARTBEAT)
+	parser.add_argument("-st", "--staleAfter", help="time without heartbeats after which a running job is run again, in seconds", type=float, default=STALE_AFTER)
+
+	args = parser.parse_args()
+
+	if args.work:
+		workers(args.queue, args.jobs, heartbeat=args.heartbeat, staleAfter=args.staleAfter, exitWhenIdle=args.exitWhenIdle)
+
+	json.dump(JobQueue(args.queue).status(), sys.stdout, sort_keys=True)
+	sys.stdout.write('\n')
@@ -0,0 +1,244 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from runstats import *
+
+# Parallel streaming analyzer for the text event logs generated by
+# simulator.py (either plain or compressed with -z).
+#
+# Plain text logs are split in byte ranges, and gzip logs are split by member
+# (the simulator starts a new gzip member every few megabytes, so its
+# compressed logs can be decompressed in parallel). Each piece is parsed by a
+# worker process into a RunStatistics object, and the partial aggregates are
+# merged at the end. Memory usage does not depend on the size of the log.
+
+GZIP_MAGIC = b'\x1f\x8b\x08'
+
+# Size of the blocks read from the log files.
+BLOCK_SIZE = 1 << 20
+
+_TAGS = set([b'+', b'D', b'S', b'Ato', b'A', b'd'])
+
+def parseLine(line, statistics):
+
+	# Only a few event types are relevant for the statistics. Avoid splitting
+	# the lines of all others.
+	tag = line[:line.find(b' ')]
+	if tag not in _TAGS:
+		return
+
+	fields = line.split()
+	node = int(fields[2][1:-1])
+
+	if tag == b'+':
+		statistics.count(node, COUNTER_GENERATED)
+	elif tag == b'D':
+		# 'D' is used both for deferrals (which include the time until the
+		# group's slot) and drops.
+		if len(fields) > 4:
+			statistics.count(node, COUNTER_DEFERRED)
+		else:
+			statistics.count(node, COUNTER_DROPS)
+	elif tag == b'S':
+		statistics.count(node, COUNTER_SUCCESS)
+	elif tag == b'Ato':
+		statistics.count(node, COUNTER_ACK_TIMEOUTS)
+	elif tag == b'A':
+		statistics.count(node, COUNTER_ABORTS)
+	elif fields[3][:1] == b'_':
+		# Data frame lost at the AP: account it to the source node.
+		statistics.count(int(fields[3][1:-1]), COUNTER_DATA_SINR_FAILURES)
+	else:
+		statistics.count(node, COUNTER_ACK_SINR_FAILURES)
+
+def analyzeTextRange(path, start, end):
+
+	# Parse all lines that begin within [start, end) of a plain text log.
+	statistics = RunStatistics()
+	with open(path, 'rb') as f:
+
+		# Unless we start at the beginning of the file, the first (partial)
+		# line belongs to the previous range.
+		if start > 0:
+			f.seek(start - 1)
+			position = start - 1 + len(f.readline())
+		else:
+			position = 0
+
+		while position < end:
+			line = f.readline()
+			if not line:
+				break
+			position = position + len(line)
+			parseLine(line, statistics)
+
+	return statistics
+
+def analyzeGzipMember(f, offset):
+
+	# Decompress and parse the gzip member starting at 'offset'. Returns the
+	# member statistics and the offset where the member ends, or None if
+	# there is no valid member there.
+	f.seek(offset)
+	decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+	statistics = RunStatistics()
+	pending = b''
+	read = 0
+
+	try:
+		while not decompressor.eof:
+			data = f.read(BLOCK_SIZE)
+			if not data:
+				# Truncated member (e.g., the simulation was killed).
+				sys.stderr.write('Ignoring truncated gzip member at offset ' + str(offset) + '\n')
+				return None
+			read = read + len(data)
+
+			lines = (pending + decompressor.decompress(data)).split(b'\n')
+			pending = lines.pop()
+			for line in lines:
+				parseLine(line, statistics)
+	except zlib.error:
+		return None
+
+	if pending:
+		parseLine(pending, statistics)
+
+	return statistics, offset + read - len(decompressor.unused_data)
+
+def analyzeGzipRange(path, candidates, end):
+
+	# Parse all gzip members that begin within [candidates[0], end).
+	# 'candidates' are the offsets in that range where the gzip magic number
+	# was found: every member begins at one of them, but the magic number may
+	# also show up by chance inside compressed data.
+	statistics = RunStatistics()
+	with open(path, 'rb') as f:
+
+		i = 0
+		offset = candidates[0]
+		while offset < end:
+
+			member = analyzeGzipMember(f, offset)
+			if member != None:
+				statistics.merge(member[0])
+				offset = member[1]
+				continue
+
+			# Not a member. Try the next candidate.
+			while i < len(candidates) and candidates[i] <= offset:
+				i = i + 1
+			if i == len(candidates):
+				break
+			offset = candidates[i]
+
+	return statistics
+
+def findGzipCandidates(path):
+
+	candidates = []
+	with open(path, 'rb') as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		position = data.find(GZIP_MAGIC)
+		while position >= 0:
+			candidates.append(position)
+			position = data.find(GZIP_MAGIC, position + 1)
+		data.close()
+
+	return candidates
+
+def isCompressed(path):
+
+	with open(path, 'rb') as f:
+		return f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+def splitLog(path, chunkSize):
+
+	# Split the log in tasks of about 'chunkSize' bytes.
+	size = os.path.getsize(path)
+	chunkSize = max(chunkSize, BLOCK_SIZE)
+	tasks = []
+
+	if isCompressed(path):
+		candidates = findGzipCandidates(path)
+		first = 0
+		while first < len(candidates):
+			last = first + 1
+			while last < len(candidates) and candidates[last] - candidates[first] < chunkSize:
+				last = last + 1
+			if last < len(candidates):
+				end = candidates[last]
+			else:
+				end = size
+			tasks.append((analyzeGzipRange, path, candidates[first:last], end))
+			first = last
+	else:
+		for start in range(0, size, chunkSize):
+			tasks.append((analyzeTextRange, path, start, min(start + chunkSize, size)))
+
+	return tasks
+
+def _run(task):
+
+	return task[0](*task[1:])
+
+def analyzeLogs(paths, groups=None, jobs=None, chunkSize=64 << 20):
+
+	# Analyze the logs in parallel. Returns one RunStatistics per log.
+	tasks = []
+	for path in paths:
+		tasks.extend(splitLog(path, chunkSize))
+
+	results = dict((path, RunStatistics(groups)) for path in paths)
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		for task, statistics in zip(tasks, executor.map(_run, tasks)):
+			results[task[1]].merge(statistics)
+
+	return [results[path] for path in paths]
+
+def readGroupsFile(path):
+
+	# Read the grouping of the stations from a file in the format accepted by
+	# the -G option of the simulator. Returns a list indexed by node id.
+	groups = [None]
+	for line in open(path, 'r'):
+		line = line.replace('[', ' ')
+		info = line.split()
+		if len(info) > 0:
+			groups.append(int(info[0]))
+
+	return groups
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-f", "--files", help="text event logs to analyze (plain or gzip)", type=str, nargs='+', required=True)
+	parser.add_argument("-g", "--numberOfGroups", help="number of RAW grous in the simulation", type=int, default=1)
+	parser.add_argument("-G", "--groupsFromFile", type=str, help="read station grouping information from file. If this option is used, any value specified with -g will be ignored.", default=None)
+	parser.add_argument("-j", "--jobs", help="number of worker processes (default: number of CPUs)", type=int, default=None)
+	parser.add_argument("-c", "--chunkSize", help="approximate size of the pieces each log is split into, in MB", type=int, default=64)
+
+	args = parser.parse_args()
+
+	results = analyzeLogs(args.files, None, args.jobs, args.chunkSize << 20)
+
+	# Map stations to groups the same way the simulator does.
+	for statistics in results:
+		if args.groupsFromFile != None:
+			statistics.groups = readGroupsFile(args.groupsFromFile)
+		else:
+			statistics.groups = [None] + [i % args.numberOfGroups for i in range(max(list(statistics.nodes) + [0]))]
+
+	if len(args.files) == 1:
+		output = results[0].summary()
+	else:
+		output = dict((path, statistics.summary()) for path, statistics in zip(args.files, results))
+
+	json.dump(output, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
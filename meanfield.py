@@ -0,0 +1,219 @@
+import math
+
+import numpy as np
+
+# Mean-field aggregation of distant interferers (options -mf and -mfp of
+# simulator.py).
+#
+# Each transmission normally updates the energy level of every node of the
+# medium. With this model, a transmission only updates the nodes near its
+# transmitter, i.e. those that receive it with at least a given power (or,
+# equivalently, within a given distance). The contribution of the far
+# transmitters to the energy received by a node is replaced by a background
+# term, added to its noise floor.
+#
+# The area is divided into square regions. The background term of node i is
+#
+#   sum over regions r of F[i, r] * activity[r] / stations[r]
+#
+# where F[i, r] is the total power (in mW) node i would receive if all the
+# stations of region r that are far from it transmitted at once, and
+# activity[r] is the average number of stations of region r transmitting
+# simultaneously. Since only the stations of one group contend in each RAW
+# slot, the activity is kept per group: at the beginning of each slot, it is
+# taken from the previous slot of the same group. During the first RAW cycle
+# there is no estimate yet, so far transmitters are ignored.
+#
+# The AP is never folded into the background: its acks update every node.
+# Neither is the frame a node is receiving: when the AP starts receiving a
+# data frame from a far station, it tracks that station exactly until the
+# frame is over.
+#
+# The error of the model is measured at the beginning of each reception, as
+# the difference (in dB) between the energy level the receiver perceives and
+# the one it would perceive with all transmitters tracked exactly.
+
+class MeanFieldInterference(object):
+
+	def __init__(self, sim, threshold, cellSize, backgroundNoise):
+
+		self.sim = sim
+		self.env = sim.env
+		self.config = sim.config
+		self.medium = sim.medium
+
+		# Transmitters received with less than 'threshold' dBm are far.
+		self.threshold = threshold
+		self.noise = 10.0 ** (backgroundNoise / 10.0)
+
+		nodes = self.medium.nodeList
+		n = len(nodes)
+		groups = sim.groups
+		positions = np.array([(i.getPosX(), i.getPosY()) for i in nodes], dtype=np.float64)
+
+		# Region of each station (the AP, node 0, belongs to none).
+		columns = max(1, int(math.ceil(self.config.scenarioWidth / cellSize)))
+		cells = np.floor(positions / cellSize).astype(np.int64)
+		cells[:, 0] = np.clip(cells[:, 0], 0, columns - 1)
+		cells[:, 1] = np.maximum(cells[:, 1], 0)
+		region = cells[:, 0] + columns * cells[:, 1]
+		used, region = np.unique(region[1:], return_inverse=True)
+		self.region = np.concatenate(([-1], region)).tolist()
+		self.numberOfRegions = len(used)
+		self.stations = np.bincount(region, minlength=self.numberOfRegions).astype(np.float64)
+
+		# Nodes near each transmitter, with the power they receive from it,
+		# and far power matrix F (one column per region).
+		self.near = [None] * n
+		self.nearPowers = [None] * n
+		self.far = np.zeros((n, self.numberOfRegions))
+		nearLinks = 0
+
+		self.near[0] = list(range(n))
+		self.nearPowers[0] = self.rows([0])[0].tolist()
+
+		members = np.argsort(region, kind='stable') + 1
+		bounds = np.searchsorted(region[members - 1], np.arange(self.numberOfRegions + 1))
+		step = max(1, (1 << 22) // max(n, 1))
+		for r in range(self.numberOfRegions):
+			for first in range(bounds[r], bounds[r + 1], step):
+				sources = members[first:min(first + step, bounds[r + 1])]
+				powers = self.rows(sources)
+				isNear = powers >= threshold
+				self.far[:, r] = self.far[:, r] + np.where(isNear, 0.0, np.power(10.0, powers / 10.0)).sum(axis=0)
+				for k, source in enumerate(sources.tolist()):
+					ids = np.nonzero(isNear[k])[0]
+					self.near[source] = ids.tolist()
+					self.nearPowers[source] = powers[k, ids].tolist()
+					nearLinks = nearLinks + len(ids)
+
+		self.nearFraction = nearLinks / float(max(1, (n - 1) * n))
+
+		# Transmission time of the stations of each region, per group, since
+		# the beginning of the last slot of the group, and start of the
+		# ongoing transmissions.
+		self.groups = groups
+		self.busy = np.zeros((self.config.numberOfGroups, self.numberOfRegions))
+		self.transmissionStart = {}
+
+		# Links (source, destination) of the frames being received from far
+		# transmitters, which are tracked exactly.
+		self.promoted = set()
+
+		# Current background term of each node, in mW.
+		self.background = np.zeros(n)
+
+		# Error of the model at the beginning of the receptions.
+		self.samples = 0
+		self.errorSum = 0.0
+		self.absErrorSum = 0.0
+		self.maxAbsError = 0.0
+
+	def rows(self, sources):
+
+		# Received power (dBm) from each of 'sources' at every node.
+		if self.medium.compact:
+			return self.medium.powerMatrix.rows(np.asarray(sources))
+
+		return np.array([self.medium.powerMatrix[i] for i in sources], dtype=np.float64)
+
+	def isNear(self, source, dest, power):
+
+		return source == 0 or power >= self.threshold or (source, dest) in self.promoted
+
+	def start(self):
+
+		self.env.process(self.run())
+
+	def transmissionStarted(self, node):
+
+		self.transmissionStart[node.getId()] = self.env.now
+
+	def transmissionStopped(self, node):
+
+		id = node.getId()
+		start = self.transmissionStart.pop(id)
+		if id != 0:
+			self.busy[self.groups[id], self.region[id]] += self.env.now - start
+
+	def run(self):
+
+		# At the beginning of each slot, estimate the activity of each region
+		# from the last slot of the same group, and update the background term
+		# of every node.
+		slot = 0
+		while True:
+			group = slot % self.config.numberOfGroups
+			activity = self.busy[group] / float(self.config.slotSize)
+			self.busy[group] = 0.0
+
+			self.updateBackground(self.far.dot(activity / np.maximum(self.stations, 1.0)))
+
+			slot = slot + 1
+			yield self.env.timeout(slot * self.config.slotSize - self.env.now)
+
+	def updateBackground(self, background):
+
+		# Nodes that follow the medium see their energy level change right
+		# away; the others only get their new noise floor.
+		self.medium.flushUpdates()
+		notified = self.medium.notifiedNodes()
+
+		for node, old, new in zip(self.medium.nodeList, self.background.tolist(), background.tolist()):
+			if old == new:
+				continue
+			node.noiseFloor = 10.0 * math.log10(self.noise + new)
+			if node.getId() in notified:
+				node.changeReceivedEnergy(new, old, 0)
+
+		self.background = background
+
+	def receptionStarted(self, node, source):
+
+		self.medium.flushUpdates()
+		power = self.medium.getPowerMatrix(source.getId(), node.getId())
+		if not self.isNear(source.getId(), node.getId(), power):
+			self.promoted.add((source.getId(), node.getId()))
+			node.increaseReceivedEnergy(power)
+
+		self.sample(node)
+
+	def receptionEnded(self, node, source):
+
+		# The transmission is over by now, so the power of the source has to
+		# be removed from the energy level of the node.
+		link = (source.getId(), node.getId())
+		if link in self.promoted:
+			self.promoted.remove(link)
+			node.decreaseReceivedEnergy(self.medium.getPowerMatrix(source.getId(), node.getId()))
+
+	def sample(self, node):
+
+		# Compare the energy level perceived by a receiver with the exact one.
+		self.medium.flushUpdates()
+		exact = self.noise
+		for i in self.medium.transmitters:
+			exact = exact + 10.0 ** (self.medium.getPowerMatrix(i.getId(), node.getId()) / 10.0)
+
+		error = node.energyLevel - 10.0 * math.log10(exact)
+		self.samples = self.samples + 1
+		self.errorSum = self.errorSum + error
+		self.absErrorSum = self.absErrorSum + abs(error)
+		self.maxAbsError = max(self.maxAbsError, abs(error))
+
+	def summary(self):
+
+		samples = max(self.samples, 1)
+		return {'threshold': self.threshold, 'regions': self.numberOfRegions, 'nearLinkFraction': self.nearFraction,
+			'samples': self.samples, 'meanErrorDb': self.errorSum / samples,
+			'meanAbsErrorDb': self.absErrorSum / samples, 'maxAbsErrorDb': self.maxAbsError}
+
+def distanceToPower(distance, transmissionPower, antennaGain, antennaHeight):
+
+	# Power received at the given distance, with the propagation model of the
+	# simulator.
+	return transmissionPower - (-10.0 * math.log10(2.0 * antennaGain * math.pow(antennaHeight, 4.0)) + 40.0 * math.log10(distance))
+
+def powerToDistance(power, transmissionPower, antennaGain, antennaHeight):
+
+	return math.pow(10.0, (transmissionPower - power + 10.0 * math.log10(2.0 * antennaGain * math.pow(antennaHeight, 4.0))) / 40.0)
@@ -0,0 +1,179 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+
+from runstats import COUNTERS
+from simulator import makeConfig, MODEL_VERSION
+
+# Persistent store of simulation results.
+#
+# Results are kept in an SQLite database, keyed by a hash of the
+# configuration of the run (including the seed) and of the model version.
+# Options at their default values are left out of the key, so adding an
+# option to the simulator does not change the keys of the runs that do not
+# use it (changing the default of an option requires a new model version, as
+# any other change of the results). A run whose key is
+# already in the store does not have to be simulated again, so a sweep that
+# is interrupted can simply be restarted. Each result is committed as soon as
+# its run finishes.
+#
+# The database uses write-ahead logging, so it can be read (e.g., by an
+# analysis script) while a sweep is writing to it.
+
+# Options that only affect the output of a run (logs and auxiliary files), not
+# its results. They are not part of the key.
+OUTPUT_OPTIONS = ['verbosity', 'printPositions', 'printPER', 'propagationModel', 'binaryLog',
+	'trace', 'traceNodes', 'traceBegin', 'traceEnd', 'flightRecorder', 'flightLevel', 'flightRecords',
+	'flightAckTimeouts', 'flightStall', 'flightDumps']
+
+# Options stored in their own (indexed) columns, so runs can be selected by
+# them efficiently.
+INDEXED_OPTIONS = ['numberOfSTAs', 'numberOfGroups', 'slotSize', 'scenarioWidth',
+	'scenarioHeight', 'rate', 'length', 'seed']
+
+def effectiveConfig(config):
+
+	# The options that determine the results of a run, as a dictionary.
+	config = vars(makeConfig(config)).copy()
+	for option in OUTPUT_OPTIONS:
+		del config[option]
+
+	# The same number may be given as an integer or as a float (e.g., 50e3 and
+	# 50000 for the slot size): use a single representation.
+	for option, value in config.items():
+		if type(value) is float and value.is_integer():
+			config[option] = int(value)
+
+	# A grouping file is identified by its contents, not by its name.
+	if config['groupsFromFile'] != None:
+		with open(config['groupsFromFile'], 'rb') as f:
+			config['groupsFromFile'] = 'sha256:' + hashlib.sha256(f.read()).hexdigest()
+
+	return config
+
+# Effective configuration of a run with no option given. The default seed is
+# drawn at random, so the seed is always part of the key.
+DEFAULT_CONFIG = effectiveConfig({})
+del DEFAULT_CONFIG['seed']
+
+def resultKey(config):
+
+	config = effectiveConfig(config)
+	config = dict((option, value) for option, value in config.items()
+		if option not in DEFAULT_CONFIG or value != DEFAULT_CONFIG[option] or type(value) != type(DEFAULT_CONFIG[option]))
+	text = json.dumps({'model': MODEL_VERSION, 'config': config}, sort_keys=True)
+	return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultStore(object):
+
+	def __init__(self, path):
+
+		self.path = path
+		self.connection = sqlite3.connect(path, timeout=60)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+
+		columns = ''.join(', ' + option + ' REAL' for option in INDEXED_OPTIONS)
+		columns = columns + ''.join(', ' + counter + ' INTEGER' for counter in COUNTERS)
+		with self.connection:
+			self.connection.execute('CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, model INTEGER, config TEXT, results TEXT, created REAL, duration REAL' + columns + ')')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS runsByScenario ON runs (model, numberOfSTAs, numberOfGroups, slotSize, rate, length, seed)')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS runsBySeed ON runs (seed)')
+
+	def get(self, config):
+
+		# Results of the run with this configuration, or None if it is not in
+		# the store.
+		row = self.connection.execute('SELECT results FROM runs WHERE key = ?', (resultKey(config),)).fetchone()
+		if row == None:
+			return None
+
+		return json.loads(row[0])
+
+	def contains(self, config):
+
+		return self.connection.execute('SELECT 1 FROM runs WHERE key = ?', (resultKey(config),)).fetchone() != None
+
+	def put(self, config, results, duration=None):
+
+		effective = effectiveConfig(config)
+		values = [resultKey(config), MODEL_VERSION, json.dumps(effective, sort_keys=True),
+			json.dumps(results, sort_keys=True), time.time(), duration]
+		values.extend(effective[option] for option in INDEXED_OPTIONS)
+		values.extend(results['total'][counter] for counter in COUNTERS)
+
+		# A single statement: the result is either completely stored or not
+		# at all.
+		with self.connection:
+			self.connection.execute('INSERT OR REPLACE INTO runs VALUES (' + ', '.join(['?'] * len(values)) + ')', values)
+
+	def query(self, conditions=None, allModels=False):
+
+		# Runs whose options match all 'conditions' (a dictionary mapping
+		# option names to values). Only runs of the current model version are
+		# returned, unless 'allModels' is set.
+		where = []
+		values = []
+		if not allModels:
+			where.append('model = ?')
+			values.append(MODEL_VERSION)
+
+		for option, value in sorted((conditions or {}).items()):
+			if option not in INDEXED_OPTIONS:
+				raise ValueError('runs cannot be selected by option: ' + str(option))
+			where.append(option + ' = ?')
+			values.append(value)
+
+		sql = 'SELECT config, results, duration FROM runs'
+		if len(where) > 0:
+			sql = sql + ' WHERE ' + ' AND '.join(where)
+
+		rows = []
+		for config, results, duration in self.connection.execute(sql + ' ORDER BY rowid', values):
+			rows.append({'config': json.loads(config), 'results': json.loads(results), 'duration': duration})
+
+		return rows
+
+	def close(self):
+
+		self.connection.close()
+
+def parseValue(text):
+
+	# Option values are given as JSON when possible (numbers, null, ...), and
+	# as plain strings otherwise.
+	try:
+		return json.loads(text)
+	except ValueError:
+		return text
+
+if __name__ == '__main__':
+
+	# Query the store.
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-D", "--store", help="result store (SQLite database)", type=str, required=True)
+	parser.add_argument("-w", "--where", help="only output runs where option=value (e.g., numberOfSTAs=100); may be repeated", type=str, action='append', default=[])
+	parser.add_argument("-t", "--totals", help="output only the totals of each run", default=False, action='store_const', const=True)
+	parser.add_argument("-a", "--allModels", help="also output runs of previous model versions", default=False, action='store_const', const=True)
+
+	args = parser.parse_args()
+
+	conditions = {}
+	for condition in args.where:
+		option, value = condition.split('=', 1)
+		conditions[option] = parseValue(value)
+
+	store = ResultStore(args.store)
+	rows = store.query(conditions, args.allModels)
+	store.close()
+
+	if args.totals:
+		for row in rows:
+			row['results'] = row['results']['total']
+
+	json.dump(rows, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
@@ -0,0 +1,125 @@
+from events import *
+
+# Statistics collected for each node during a simulation run. The ones related
+# to SINR failures refer to the frames sent by the node: 'dataSinrFailures'
+# counts the data frames the AP could not decode, and 'ackSinrFailures' the
+# acks the node itself could not decode.
+COUNTERS = ['generated', 'deferred', 'success', 'drops', 'ackTimeouts', 'aborts',
+	'dataSinrFailures', 'ackSinrFailures']
+
+COUNTER_GENERATED = 0
+COUNTER_DEFERRED = 1
+COUNTER_SUCCESS = 2
+COUNTER_DROPS = 3
+COUNTER_ACK_TIMEOUTS = 4
+COUNTER_ABORTS = 5
+COUNTER_DATA_SINR_FAILURES = 6
+COUNTER_ACK_SINR_FAILURES = 7
+
+# Index of the counter incremented by each event code (-1 for the events that
+# do not affect any counter).
+_COUNTER_OF_EVENT = [-1] * len(EVENT_TAGS)
+_COUNTER_OF_EVENT[EVENT_NEW_PACKET] = COUNTER_GENERATED
+_COUNTER_OF_EVENT[EVENT_DEFER] = COUNTER_DEFERRED
+_COUNTER_OF_EVENT[EVENT_SUCCESS] = COUNTER_SUCCESS
+_COUNTER_OF_EVENT[EVENT_DROP] = COUNTER_DROPS
+_COUNTER_OF_EVENT[EVENT_ACK_TIMEOUT] = COUNTER_ACK_TIMEOUTS
+_COUNTER_OF_EVENT[EVENT_ABORT] = COUNTER_ABORTS
+_COUNTER_OF_EVENT[EVENT_RX_FAIL] = COUNTER_DATA_SINR_FAILURES
+_COUNTER_OF_EVENT[EVENT_ACK_RX_FAIL] = COUNTER_ACK_SINR_FAILURES
+
+# Aggregates the events of a run into per-node and per-group counters. It is
+# used both as an event sink by the simulator and by the log analyzer, so that
+# both produce the same numbers.
+class RunStatistics(object):
+
+	def __init__(self, groups=None, weight=None):
+
+		# All counted events are logged at level 0.
+		self.level = 0
+		self.groups = groups
+		self.nodes = {}
+
+		# With importance sampling (see importance.py), 'weight' returns the
+		# likelihood ratio of a node, and the events of each node are also
+		# counted weighted by it. The sums of the squared weights give the effective
+		# sample size of each counter.
+		self.weight = weight
+		self.weighted = [0.0] * len(COUNTERS)
+		self.squaredWeights = [0.0] * len(COUNTERS)
+
+	def write(self, code, time, node, peer, packet, count, value, aux):
+
+		counter = _COUNTER_OF_EVENT[code]
+		if counter < 0:
+			return
+
+		# Data frame losses are logged by the AP, but they are accounted to
+		# the node that sent the frame.
+		if code == EVENT_RX_FAIL:
+			node = peer
+
+		self.count(node, counter)
+
+		if self.weight != None:
+			weight = self.weight(node)
+			self.weighted[counter] = self.weighted[counter] + weight
+			self.squaredWeights[counter] = self.squaredWeights[counter] + weight * weight
+
+	def count(self, node, counter, amount=1):
+
+		if node not in self.nodes:
+			self.nodes[node] = [0] * len(COUNTERS)
+		self.nodes[node][counter] = self.nodes[node][counter] + amount
+
+	def merge(self, other):
+
+		for node, counters in other.nodes.items():
+			for i in range(len(COUNTERS)):
+				if counters[i] != 0:
+					self.count(node, i, counters[i])
+
+		for i in range(len(COUNTERS)):
+			self.weighted[i] = self.weighted[i] + other.weighted[i]
+			self.squaredWeights[i] = self.squaredWeights[i] + other.squaredWeights[i]
+
+	def close(self):
+
+		pass
+
+	def summary(self):
+
+		nodes = {}
+		groups = {}
+		total = [0] * len(COUNTERS)
+		for node in sorted(self.nodes):
+
+			counters = self.nodes[node]
+			nodes[str(node)] = dict(zip(COUNTERS, counters))
+
+			if self.groups != None and node < len(self.groups) and self.groups[node] != None:
+				group = str(self.groups[node])
+				if group not in groups:
+					groups[group] = [0] * len(COUNTERS)
+				for i in range(len(COUNTERS)):
+					groups[group][i] = groups[group][i] + counters[i]
+
+			for i in range(len(COUNTERS)):
+				total[i] = total[i] + counters[i]
+
+		for group in groups:
+			groups[group] = dict(zip(COUNTERS, groups[group]))
+
+		summary = {'nodes': nodes, 'groups': groups, 'total': dict(zip(COUNTERS, total))}
+
+		if self.weight != None:
+			effective = []
+			for i in range(len(COUNTERS)):
+				if self.squaredWeights[i] > 0:
+					effective.append(self.weighted[i]**2 / self.squaredWeights[i])
+				else:
+					effective.append(0.0)
+			summary['importanceSampling'] = {'weightedTotal': dict(zip(COUNTERS, self.weighted)),
+				'effectiveSampleSize': dict(zip(COUNTERS, effective))}
+
+		return summary
@@ -0,0 +1,194 @@
+import math
+import sys
+import tracemalloc
+
+import numpy as np
+
+# Support for simulations with a very large number of stations (option
+# --scaleMode of simulator.py).
+#
+# The default received power matrix is a list of lists of floats, which takes
+# about 32 bytes per pair of nodes and is out of reach beyond a few thousand
+# stations. In scale mode, it is replaced by a CompactPowerMatrix, which
+# either keeps the matrix quantized to int16 hundredths of dB (2 bytes per
+# pair), or only keeps the positions of the nodes and computes the power of
+# each link when it is needed (no memory per pair). The memory needed by the
+# scenario is estimated before it is built, so a run that would not fit the
+# configured budget fails right away instead of after swapping for a while.
+
+# Resolution of the quantized power matrix, in dB.
+QUANTUM = 0.01
+
+# Without a budget, the quantized matrix is used up to this size.
+MAX_QUANTIZED_BYTES = 1 << 30
+
+# Approximate memory taken by each station in scale mode, besides the power
+# matrix: node object (with __slots__), entries in the node list, the list
+# of groups and the awake nodes of the medium, pending packet arrival and its
+# statistics counters (measured as the growth of the peak resident memory of
+# runs with 100k stations).
+BYTES_PER_STATION = 1500
+
+# Memory taken regardless of the number of stations (interpreter, modules).
+BASE_BYTES = 40e6
+
+class CompactPowerMatrix(object):
+
+	def __init__(self, positions, transmissionPower, antennaGain, antennaHeight, quantized):
+
+		positions = np.asarray(positions, dtype=np.float64)
+		self.x = np.ascontiguousarray(positions[:, 0])
+		self.y = np.ascontiguousarray(positions[:, 1])
+		self.transmissionPower = transmissionPower
+		self.gainLoss = -10.0 * math.log10(2.0 * antennaGain * math.pow(antennaHeight, 4.0))
+		self.quantized = quantized
+
+		if quantized:
+			# Build a block of rows at a time, to keep the temporary arrays
+			# small.
+			n = len(self.x)
+			self.matrix = np.empty((n, n), dtype=np.int16)
+			step = max(1, (1 << 22) // max(n, 1))
+			for first in range(0, n, step):
+				rows = np.arange(first, min(first + step, n))
+				power = self.powers(rows[:, None], np.arange(n)[None, :])
+				self.matrix[first:first + len(rows)] = np.clip(np.round(power / QUANTUM), -32768, 32767)
+		else:
+			self.matrix = None
+
+	def powers(self, source, dest):
+
+		# Received power (dBm) from 'source' at 'dest' (arrays of node ids, with
+		# broadcasting), computed from the positions.
+		dist = np.sqrt((self.x[source] - self.x[dest])**2 + (self.y[source] - self.y[dest])**2)
+		loss = np.where(dist > 0, self.gainLoss + 40.0 * np.log10(np.maximum(dist, 1e-300)), 0.0)
+		return self.transmissionPower - loss
+
+	def get(self, source, dest):
+
+		if self.quantized:
+			return int(self.matrix[source, dest]) * QUANTUM
+
+		dist = math.sqrt((self.x[source] - self.x[dest])**2 + (self.y[source] - self.y[dest])**2)
+		if dist == 0:
+			return self.transmissionPower
+		return self.transmissionPower - (self.gainLoss + 40.0 * math.log10(dist))
+
+	def row(self, source, dests):
+
+		# Received power from 'source' at each of the nodes in 'dests' (a list
+		# of ids), as a list of floats.
+		dests = np.fromiter(dests, dtype=np.int64, count=len(dests))
+		if self.quantized:
+			return (self.matrix[source, dests] * QUANTUM).tolist()
+
+		return self.powers(source, dests).tolist()
+
+	def rows(self, sources):
+
+		# Received power from each of 'sources' (an array of ids) at every
+		# node, as a 2D array.
+		if self.quantized:
+			return self.matrix[sources] * QUANTUM
+
+		return self.powers(sources[:, None], np.arange(len(self.x))[None, :])
+
+	def __getitem__(self, source):
+
+		# Whole row, so that powerMatrix[source][dest] also works (slowly).
+		return self.row(source, range(len(self.x)))
+
+	def __len__(self):
+
+		return len(self.x)
+
+	def nbytes(self):
+
+		total = self.x.nbytes + self.y.nbytes
+		if self.matrix is not None:
+			total = total + self.matrix.nbytes
+		return total
+
+def quantizedBytes(numberOfNodes):
+
+	return 2 * numberOfNodes * numberOfNodes
+
+def choosePowerMatrix(numberOfNodes, budget=None):
+
+	# Use the quantized matrix if it fits in half of the budget (the rest is
+	# left for the stations and the simulation itself).
+	if budget == None:
+		return quantizedBytes(numberOfNodes) <= MAX_QUANTIZED_BYTES
+
+	return quantizedBytes(numberOfNodes) <= budget / 2
+
+def estimateMemory(numberOfSTAs, quantized, flightRecords=0):
+
+	# Estimated memory (in bytes) of a scenario in scale mode, with the
+	# buffer of a flight recorder that keeps 'flightRecords' events per node
+	# (if any).
+	nodes = numberOfSTAs + 1
+	powerMatrix = 16 * nodes
+	if quantized:
+		powerMatrix = powerMatrix + quantizedBytes(nodes)
+
+	flightRecorder = 0
+	if flightRecords > 0:
+		from flightrecorder import bufferBytes
+		flightRecorder = bufferBytes(nodes, flightRecords)
+
+	return {'base': BASE_BYTES, 'stations': BYTES_PER_STATION * numberOfSTAs, 'powerMatrix': powerMatrix,
+		'flightRecorder': flightRecorder, 'total': BASE_BYTES + BYTES_PER_STATION * numberOfSTAs + powerMatrix + flightRecorder}
+
+def checkMemoryBudget(config):
+
+	# Decide how to keep the power matrix and make sure the scenario fits the
+	# budget (given in MB). Returns True if the quantized matrix is to be used.
+	flightRecords = 0
+	if config.flightRecorder != None:
+		flightRecords = config.flightRecords
+
+	# The buffer of the flight recorder (if any) is not available for the
+	# power matrix.
+	budget = None
+	matrixBudget = None
+	if config.memoryBudget != None:
+		budget = config.memoryBudget * 1e6
+		matrixBudget = budget - estimateMemory(config.numberOfSTAs, False, flightRecords)['flightRecorder']
+
+	quantized = choosePowerMatrix(config.numberOfSTAs + 1, matrixBudget)
+	estimate = estimateMemory(config.numberOfSTAs, quantized, flightRecords)
+	if budget != None and estimate['total'] > budget:
+		raise MemoryError('a scenario with ' + str(config.numberOfSTAs) + ' stations needs about ' +
+			str(int(math.ceil(estimate['total'] / 1e6))) + ' MB, over the budget of ' + str(config.memoryBudget) + ' MB')
+
+	return quantized
+
+class MemoryMeter(object):
+
+	# Measures the memory allocated while a scenario is built.
+
+	def __init__(self):
+
+		self.started = not tracemalloc.is_tracing()
+		if self.started:
+			tracemalloc.start()
+		self.before = tracemalloc.get_traced_memory()[0]
+
+	def stop(self):
+
+		# Returns the number of bytes allocated (and still in use) since the
+		# meter was created.
+		allocated = tracemalloc.get_traced_memory()[0] - self.before
+		if self.started:
+			tracemalloc.stop()
+
+		return allocated
+
+def reportMemory(sim, stream=sys.stderr):
+
+	stations = sim.config.numberOfSTAs
+	powerMatrix = sim.medium.powerMatrix
+	stream.write('Scale mode: ' + str(stations) + ' stations, ' + str(sim.scenarioBytes) + ' bytes allocated for the scenario: ' +
+		str(powerMatrix.nbytes()) + ' for the ' + ('quantized' if powerMatrix.quantized else 'on-demand') + ' power matrix and ' +
+		str((sim.scenarioBytes - powerMatrix.nbytes()) // max(stations, 1)) + ' per station.\n')
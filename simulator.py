@@ -2,9 +2,13 @@ import simpy
 import math
 import random
 import argparse
+import json
+import time
 from gzip import GzipFile
 import sys
-from scipy.special import erfc
+from math import erfc
+from events import *
+from runstats import RunStatistics
 
 # Assumptions:
 # - All communication is assumed to be from STAs to AP.
@@ -16,7 +20,8 @@ from scipy.special import erfc
 ##
 # List of the events found on the output log and their formats. Notice that not
 # all events are logged by default. You may have to increase verbosity in order
-# to get those.
+# to get those. The same events can be written in a columnar binary format
+# instead (option -B), which can be read with eventlog.py.
 
 # Entry of the received power matrix.
 #  - 'idS' is the link's source node id.
@@ -119,6 +124,8 @@ from scipy.special import erfc
 ## To now _id_ pktId
 
 # The total amount of energy received by this node's wireless interface has been increased.
+# Stations sleeping until the slot of their group do not log these changes (nor
+# the ones below) unless option -dR is used.
 #  - 'id' is the id of the node that generated that packet
 #  - 'oldValue' total amount of power in dBm received at the interface before this increase.
 #  - 'newValue' total amount of power in dBm received at the interface after this increase.
@@ -212,6 +219,15 @@ from scipy.special import erfc
 ## r now _id_ pktId [ack] SimTransmitters
 
 
+# Version of the simulation model. It is part of the key of the results kept
+# in a result store (see resultstore.py): increment it whenever a change makes
+# the same configuration produce different results.
+#   2: stations waiting for their slot or their next packet sleep (see
+#      RawScheduler).
+#   3: stations can start backlogged or waiting for their slot, for the
+#      windows of time-parallel runs (see timeparallel.py).
+MODEL_VERSION=3
+
 ## MAC times
 SLOT_TIME=52
 SIFS=160
@@ -259,6 +275,30 @@ def sumdBmPower(a, b):
 def subtractdBmPower(a, b):
 	return mW2dBm(dBm2mW(a) - dBm2mW(b))
 
+# Random number generator that draws the antithetic counterpart of each number
+# drawn by random.Random with the same seed: 1 - u for uniforms (and so also
+# for the exponentials derived from them) and a + b - k for integers in
+# [a, b].
+class AntitheticRandom(random.Random):
+
+	def random(self):
+		u = super().random()
+		if u == 0:
+			return 0.0
+		return 1.0 - u
+
+	# Deliberately not antithetic. In a subclass that overrides random()
+	# but not getrandbits(), random.Random draws integers from random(),
+	# so they would come out mirrored already, and randint would mirror
+	# them back. Overriding getrandbits() keeps integers drawn from the raw
+	# bits, which randint mirrors exactly once; complementing the bits here
+	# would undo that mirroring too.
+	def getrandbits(self, k):
+		return super().getrandbits(k)
+
+	def randint(self, a, b):
+		return a + b - super().randint(a, b)
+
 class OutStream(object):
 
 	def write(self, data):
@@ -267,29 +307,73 @@ class OutStream(object):
 	def close(self):
 		sys.stdout.flush()
 
+# The compressed output is written as a sequence of independent gzip members
+# (each holding about MEMBER_SIZE bytes of log), so that it can be decompressed
+# in parallel (see loganalyzer.py). Standard tools handle it as a single file.
 class CompressedOutStream(object):
 
+	MEMBER_SIZE = 16 << 20
+
 	def __init__(self):
-		self.output = GzipFile(fileobj=OutStream(), mode="w")
+		self.output = GzipFile(fileobj=sys.stdout.buffer, mode="w")
+		self.memberSize = 0
 
 	def write(self, data):
+		data = data.encode()
 		self.output.write(data)
+		self.memberSize = self.memberSize + len(data)
+
+		if self.memberSize >= self.MEMBER_SIZE:
+			# Closing the GzipFile only finishes the current member: the
+			# underlying stream remains open.
+			self.output.close()
+			self.output = GzipFile(fileobj=sys.stdout.buffer, mode="w")
+			self.memberSize = 0
 
 	def close(self):
 		self.output.close()
-
-def log(what, level=0):
-
-	if level <= args.verbosity:
-		outputStream.write(what + '\n')
+		sys.stdout.buffer.flush()
 
 # Class that handles the wireless medium common to all nodes.
 class Medium:
 
-	def __init__(self, numberOfNodes):
+	def __init__(self, sim, numberOfNodes):
 
+		self.sim = sim
 		self.nodeList = []
 		self.powerMatrix = []
+
+		# Nodes that follow the energy level of the medium, indexed by id, and
+		# nodes currently transmitting. Stations sleeping until the slot of
+		# their group are left out of the first (see RawScheduler).
+		self.awakeNodes = {}
+		self.transmitters = []
+
+		# With lazy carrier sense, only the nodes that are contending for the
+		# medium or receiving a frame (the listeners, indexed by id) follow
+		# its energy level. Other nodes get their energy level computed from
+		# the transmitters when they start listening.
+		self.lazy = sim.config.lazyCarrierSense
+		self.listeners = {}
+
+		# With coalesced updates, the transmissions that start or stop at the
+		# same instant are queued as (transmitter, +1 or -1) and applied
+		# together to each node, by flushUpdates, at the end of the instant or
+		# as soon as a node needs its energy level.
+		self.coalesce = sim.config.coalesceUpdates
+		self.pendingUpdates = []
+
+		# Mean-field aggregation of the distant interferers (see meanfield.py),
+		# set up by the simulation once all nodes are added. Transmissions
+		# then only update the nodes near the transmitter.
+		self.meanField = None
+
+		# In scale mode, the power matrix is a CompactPowerMatrix (see
+		# scalemode.py), built by buildPowerMatrix once all nodes are added.
+		self.compact = sim.config.scaleMode
+		if self.compact:
+			return
+
 		for i in range(numberOfNodes):
 			self.powerMatrix.append([0] * numberOfNodes)
 
@@ -298,6 +382,10 @@ class Medium:
 		id = node.getId()
 		dist = 0
 		self.nodeList.append(node)
+		self.awakeNodes[id] = node
+
+		if self.compact:
+			return
 
 		for i in self.nodeList:
 
@@ -318,35 +406,263 @@ class Medium:
 			#print("------------------------------------------")
 			#print("id getid loss dist powermatrix", id , i.getId(), loss, dist, self.powerMatrix[id][i.getId()])
 
+	def addNodes(self, nodes):
+
+		# Same as calling addNode for each node, but the whole received power
+		# matrix is computed at once with NumPy (see topology.py). Node ids must
+		# be their index in the node list.
+		from topology import receivedPowerMatrix
+
+		for node in nodes:
+			self.nodeList.append(node)
+			self.awakeNodes[node.getId()] = node
+
+		if [i.getId() for i in self.nodeList] != list(range(len(self.nodeList))):
+			raise ValueError('node ids must match their index in the node list')
+
+		if self.compact:
+			return
+
+		positions = [(i.getPosX(), i.getPosY()) for i in self.nodeList]
+		self.powerMatrix = receivedPowerMatrix(positions, TRANSMISSION_POWER, ANTENNA_GAIN, ANTENNA_HEIGHT).tolist()
+
+	def buildPowerMatrix(self, quantized):
+
+		# Scale mode: build the compact power matrix of all nodes added.
+		from scalemode import CompactPowerMatrix
+
+		positions = [(i.getPosX(), i.getPosY()) for i in self.nodeList]
+		self.powerMatrix = CompactPowerMatrix(positions, TRANSMISSION_POWER, ANTENNA_GAIN, ANTENNA_HEIGHT, quantized)
+
+	def notifiedNodes(self):
+
+		# Nodes whose energy level is updated on every transmission.
+		if self.lazy:
+			return self.listeners
+
+		return self.awakeNodes
+
 	def startNodeTransmission(self, node):
 
 		id = node.getId()
+		self.transmitters.append(node)
 
-		for i in self.nodeList:
+		if self.meanField != None:
+			self.meanField.transmissionStarted(node)
+
+		if self.coalesce:
+			self.queueUpdate(node, 1)
+			return
+
+		if self.meanField != None:
+			notified = self.notifiedNodes()
+			for k, power in zip(self.meanField.near[id], self.meanField.nearPowers[id]):
+				i = notified.get(k)
+				if i != None:
+					i.increaseReceivedEnergy(power)
+			return
+
+		if self.compact:
+			nodes = list(self.notifiedNodes().values())
+			for i, power in zip(nodes, self.powerMatrix.row(id, [i.getId() for i in nodes])):
+				i.increaseReceivedEnergy(power)
+			return
+
+		for i in self.notifiedNodes().values():
 
 			i.increaseReceivedEnergy(self.powerMatrix[id][i.getId()])
 
 	def stopNodeTransmission(self, node):
 
 		id = node.getId()
+		self.transmitters.remove(node)
 
-		for i in self.nodeList:
+		if self.meanField != None:
+			self.meanField.transmissionStopped(node)
+
+		if self.coalesce:
+			self.queueUpdate(node, -1)
+			return
+
+		if self.meanField != None:
+			notified = self.notifiedNodes()
+			for k, power in zip(self.meanField.near[id], self.meanField.nearPowers[id]):
+				i = notified.get(k)
+				if i != None:
+					i.decreaseReceivedEnergy(power)
+			return
+
+		if self.compact:
+			nodes = list(self.notifiedNodes().values())
+			for i, power in zip(nodes, self.powerMatrix.row(id, [i.getId() for i in nodes])):
+				i.decreaseReceivedEnergy(power)
+			return
+
+		for i in self.notifiedNodes().values():
 
 			i.decreaseReceivedEnergy(self.powerMatrix[id][i.getId()])
 
+	def queueUpdate(self, node, change):
+
+		# The first update of an instant schedules the flush. Its event comes
+		# after the ones already scheduled for this instant, so the other
+		# transmitters that were due to start or stop by then join the batch.
+		if len(self.pendingUpdates) == 0:
+			flush = self.sim.env.event()
+			flush.callbacks.append(lambda event: self.flushUpdates())
+			flush.succeed()
+
+		self.pendingUpdates.append((node, change))
+
+	def flushUpdates(self):
+
+		# Apply the queued updates: each node gets the total power, in mW, of
+		# the transmissions that started and of those that stopped.
+		if len(self.pendingUpdates) == 0:
+			return
+
+		updates = self.pendingUpdates
+		self.pendingUpdates = []
+
+		if self.meanField != None:
+			self.flushNearUpdates(updates)
+			return
+
+		nodes = list(self.notifiedNodes().values())
+		ids = [i.getId() for i in nodes]
+		added = [0.0] * len(nodes)
+		removed = [0.0] * len(nodes)
+		count = 0
+
+		for transmitter, change in updates:
+
+			if self.compact:
+				powers = self.powerMatrix.row(transmitter.getId(), ids)
+			else:
+				row = self.powerMatrix[transmitter.getId()]
+				powers = [row[k] for k in ids]
+
+			total = added if change > 0 else removed
+			for k, power in enumerate(powers):
+				total[k] = total[k] + dBm2mW(power)
+			count = count + change
+
+		for k, node in enumerate(nodes):
+			node.changeReceivedEnergy(added[k], removed[k], count)
+
+	def flushNearUpdates(self, updates):
+
+		# Same as flushUpdates, with mean-field aggregation: each transmitter
+		# only counts for the nodes near it, so the totals are kept per node.
+		notified = self.notifiedNodes()
+		totals = {}
+
+		for transmitter, change in updates:
+			id = transmitter.getId()
+			for k, power in zip(self.meanField.near[id], self.meanField.nearPowers[id]):
+				if k not in notified:
+					continue
+
+				total = totals.get(k)
+				if total == None:
+					total = [0.0, 0.0, 0]
+					totals[k] = total
+				if change > 0:
+					total[0] = total[0] + dBm2mW(power)
+				else:
+					total[1] = total[1] + dBm2mW(power)
+				total[2] = total[2] + change
+
+		for k, (added, removed, count) in totals.items():
+			notified[k].changeReceivedEnergy(added, removed, count)
+
+	def sleep(self, node):
+
+		# Stop updating the energy level perceived by the node.
+		del self.awakeNodes[node.getId()]
+
+	def wake(self, node):
+
+		# Rebuild the energy level perceived by the node from the ongoing
+		# transmissions, and resume updating it. With lazy carrier sense, that
+		# is left for when the node starts listening. Queued updates already
+		# count in the transmitters, so they must not reach the node again.
+		self.flushUpdates()
+		self.awakeNodes[node.getId()] = node
+		if self.lazy:
+			return
+
+		node.energyLevel, node.energyHowMany = self.energyAt(node)
+
+	def listen(self, node):
+
+		# Lazy carrier sense: bring the energy level perceived by the node up
+		# to date, and keep updating it until it stops listening.
+		if node.id in self.listeners:
+			return
+
+		self.flushUpdates()
+		node.energyLevel, node.energyHowMany = self.energyAt(node)
+		self.listeners[node.id] = node
+
+	def stopListening(self, node):
+
+		# Nodes receiving a frame keep listening until it is over.
+		if len(node.receptions) == 0:
+			self.listeners.pop(node.id, None)
+
+	def energyLevelAt(self, node):
+
+		return self.energyAt(node)[0]
+
+	def energyAt(self, node):
+
+		# Energy level perceived by the node due to the ongoing transmissions,
+		# and number of transmissions it accounts for. With mean-field
+		# aggregation, far transmitters are only part of the noise floor.
+		level = node.noiseFloor
+		howMany = 0
+		for i in self.transmitters:
+			power = self.getPowerMatrix(i.getId(), node.getId())
+			if self.meanField != None and not self.meanField.isNear(i.getId(), node.getId(), power):
+				continue
+			level = sumdBmPower(level, power)
+			howMany = howMany + 1
+
+		return level, howMany
+
 	def getPowerMatrix(self, source, dest):
 
+		if self.compact:
+			return self.powerMatrix.get(source, dest)
+
 		return self.powerMatrix[source][dest]
 
+	def getPowerRow(self, source, dests):
+
+		# Received power from 'source' at each of the nodes in 'dests' (a list
+		# of ids). A row of the compact matrix is computed at once, while
+		# indexing it element by element would compute a whole row each time.
+		if self.compact:
+			return self.powerMatrix.row(source, dests)
+
+		row = self.powerMatrix[source]
+		return [row[dest] for dest in dests]
+
 	def logPowerMatrix(self):
 
+		# Skip the (quadratic) walk when no sink logs the matrix.
+		if not any(sink.level >= 3 for sink in self.sim.eventSinks):
+			return
+
+		ids = [j.getId() for j in self.nodeList]
 		for i in self.nodeList:
-			for j in self.nodeList:
+			for j, power in zip(self.nodeList, self.getPowerRow(i.getId(), ids)):
 
 				if i == j:
 					continue
 
-				log('PM ' + str(i.getId()) + ' -> ' + str(j.getId()) + ' @ ' + str(self.powerMatrix[i.getId()][j.getId()]), 3)
+				self.sim.logEvent(3, EVENT_POWER_MATRIX, 0, i.getId(), j.getId(), -1, -1, power, 0)
 
 	def logPER(self, outputFileName):
 		"""
@@ -368,15 +684,16 @@ class Medium:
 
 		f = open(outputFileName, 'w')
 
+		ids = [j.getId() for j in self.nodeList]
 		for i in self.nodeList:
-			for j in self.nodeList:
+			for j, power in zip(self.nodeList, self.getPowerRow(i.getId(), ids)):
 				#if i == j: # or i.getId() == 0 or j.getId() == 0:
 				#	continue
 				#else:
 
 					# Compute the SINR for the incoming packet
 					idPM = str(j.getId())+'->'+str(i.getId())
-					SNR = (self.powerMatrix[i.getId()][j.getId()] - BACKGROUND_NOISE)
+					SNR = (power - BACKGROUND_NOISE)
 					#SNR = abs(self.powerMatrix[i.getId()][j.getId()] - BACKGROUND_NOISE)
 
 					# TODO: use a more complex error model. For now, we are just using a
@@ -395,7 +712,7 @@ class Medium:
 					#symbolErrorProbability = erfc(math.sqrt(SNR))/2
 					receptionProbability = math.pow(1-symbolErrorProbability, DATA_PACKET_SIZE)
 					#f.write(idPM + ' ' + str(j.getId()) + ' ' + str(i.getId()) + ' ' + str(receptionProbability) + '\n')   #original
-					f.write(idPM + ' ' + str(j.getId()) + ' ' + str(i.getId()) + ' ' + str(self.powerMatrix[i.getId()][j.getId()]) + '\n')   #original
+					f.write(idPM + ' ' + str(j.getId()) + ' ' + str(i.getId()) + ' ' + str(power) + '\n')   #original
 					#print("symbolErrorProbability",symbolErrorProbability)
 					#print("receptionProbability",receptionProbability)
 
@@ -404,7 +721,7 @@ class Medium:
 	def propagationModelFile(self, outputFileName):
 
 		f = open(outputFileName, 'w')
-		f.write(str(args.numberOfSTAs) + '\n')
+		f.write(str(self.sim.config.numberOfSTAs) + '\n')
 
 		self.nodeListPM = []
 		
@@ -473,6 +790,304 @@ class NodePM:
 
 
 
+# Keeps track of the RAW slots. Stations that have to wait for the slot of
+# their group all wait on a single event per slot boundary, which wakes them up
+# in bulk. While they sleep, they do not contend for the medium, so they are
+# also removed from the medium, which spares updating their energy level on
+# every transmission. Their energy level is rebuilt when they wake up.
+class RawScheduler:
+
+	def __init__(self, sim):
+
+		self.sim = sim
+		self.env = sim.env
+		self.config = sim.config
+		self.medium = sim.medium
+
+		# Next wake-up of each group: (slot start, event, sleeping nodes).
+		self.wakeUps = {}
+
+	def nextSlotStart(self, group):
+
+		# Compute the beginning of the next slot of the group, starting
+		# strictly after now.
+		cycleLength = self.config.numberOfGroups * self.config.slotSize
+		currentCycle = math.floor(self.env.now / cycleLength)
+		currentGroup = math.floor((self.env.now - currentCycle * cycleLength) / self.config.slotSize)
+
+		if currentGroup < group:
+
+			# Group slot is still within this cycle
+			return currentCycle * cycleLength + group * self.config.slotSize
+		else:
+			# Next slot is in the next cycle
+			return (currentCycle + 1) * cycleLength + group * self.config.slotSize
+
+	def sleepUntilSlot(self, node):
+
+		# Return an event that is triggered at the beginning of the next slot
+		# of the node's group. Its value is the time at which that happens.
+		group = node.groups[node.id]
+		delay = self.nextSlotStart(group) - self.env.now
+
+		if self.config.disableRawScheduler:
+			return self.env.timeout(delay, value=self.env.now + delay)
+
+		wakeUp = self.wakeUps.get(group)
+		if wakeUp == None or wakeUp[1].processed or wakeUp[0] != self.env.now + delay:
+			wakeUp = (self.env.now + delay, self.env.timeout(delay, value=self.env.now + delay), [])
+			# This callback is registered before any node waits on the
+			# event, so nodes are woken up before any of them resumes.
+			wakeUp[1].callbacks.append(lambda event, sleeping=wakeUp[2]: self.wakeNodes(sleeping))
+			self.wakeUps[group] = wakeUp
+
+		# Nodes still receiving a frame must keep track of the medium.
+		if len(node.receptions) == 0:
+			self.medium.sleep(node)
+			wakeUp[2].append(node)
+
+		return wakeUp[1]
+
+	def wakeNodes(self, nodes):
+
+		for node in nodes:
+			self.medium.wake(node)
+
+# Reception of a frame by a node. Instead of keeping a history of the energy
+# received by the node and walking it once the frame is over, each reception
+# accumulates the log of the probability that the symbols received so far are
+# correct, as the energy level perceived by the receiver changes.
+#
+# This is the 'segment' level of the PHY model (option --phy). All levels share
+# the same interface, used for both data frames and acks: update() is called
+# on every change of the energy level perceived by the receiver during the
+# frame, and finish() returns the probability that the frame was received.
+class Reception:
+
+	__slots__ = ['receivingPower', 'start', 'end', 'lastChange', 'level', 'howMany',
+		'maxSimTransmissions', 'logSuccessProbability']
+
+	def __init__(self, receivingPower, start, duration, level, howMany):
+
+		self.receivingPower = receivingPower
+		self.start = start
+		self.end = start + duration
+
+		# Energy state since the last change.
+		self.lastChange = start
+		self.level = level
+		self.howMany = howMany
+
+		self.maxSimTransmissions = howMany
+		self.logSuccessProbability = 0.0
+
+	def accumulate(self, until):
+
+		# Compute the number of symbols affected by the current energy state.
+		currentStateSymbols = (until - self.lastChange) / SYMBOL_DURATION
+		# Compute the SINR for the incoming packet
+		currentStateSINR = self.receivingPower - subtractdBmPower(self.level, self.receivingPower)
+
+		# TODO: use a more complex error model. For now, we are just using a
+		# simple mathematical model for the error in a BPSK modulation symbol.
+		symbolErrorProbability = erfc(math.sqrt(dBm2mW(currentStateSINR))) / 2
+		self.logSuccessProbability = self.logSuccessProbability + currentStateSymbols * math.log1p(-symbolErrorProbability)
+
+	def update(self, now, level, howMany):
+
+		# Changes at the very end of the frame do not affect it.
+		if now >= self.end:
+			return
+
+		if now > self.lastChange:
+			self.accumulate(now)
+			self.lastChange = now
+		elif now == self.start:
+			# Several changes at the instant the frame starts: only the last
+			# one actually applies to the frame.
+			self.maxSimTransmissions = howMany
+
+		self.level = level
+		self.howMany = howMany
+		if self.maxSimTransmissions < howMany:
+			self.maxSimTransmissions = howMany
+
+	def finish(self):
+
+		# Account for the last energy state and return the probability that
+		# the frame was received without errors.
+		self.accumulate(self.end)
+		self.lastChange = self.end
+
+		return math.exp(self.logSuccessProbability)
+
+# 'exact' level of the PHY model: same as Reception, but the energy states the
+# frame went through are kept, and the result is checked against a direct
+# computation from them. Any inconsistency is an error of the simulator.
+class ValidatedReception(Reception):
+
+	__slots__ = ['segments']
+
+	def __init__(self, receivingPower, start, duration, level, howMany):
+
+		super().__init__(receivingPower, start, duration, level, howMany)
+		self.segments = []
+
+	def accumulate(self, until):
+
+		self.segments.append((self.lastChange, until, self.level, self.howMany))
+		super().accumulate(until)
+
+	def finish(self):
+
+		receptionProbability = super().finish()
+
+		# The states must cover the whole frame, one after the other, and
+		# include the power of the frame itself.
+		expected = self.start
+		directProbability = 1.0
+		for start, end, level, howMany in self.segments:
+			if start != expected or end <= start:
+				raise RuntimeError('reception states do not cover the frame: ' + str(self.segments))
+			if howMany < 1 or level < self.receivingPower - 1e-9:
+				raise RuntimeError('energy level ' + str(level) + ' dBm with ' + str(howMany) +
+					' transmitters does not include the received frame (' + str(self.receivingPower) + ' dBm)')
+			expected = end
+
+			SINR = self.receivingPower - subtractdBmPower(level, self.receivingPower)
+			symbolErrorProbability = erfc(math.sqrt(dBm2mW(SINR))) / 2
+			directProbability = directProbability * math.pow(1 - symbolErrorProbability, (end - start) / SYMBOL_DURATION)
+
+		if expected != self.end:
+			raise RuntimeError('reception states do not cover the frame: ' + str(self.segments))
+		if not 0.0 <= receptionProbability <= 1.0 or abs(receptionProbability - directProbability) > 1e-9 * max(directProbability, 1e-300) + 1e-12:
+			raise RuntimeError('reception probability ' + str(receptionProbability) + ' differs from ' + str(directProbability))
+
+		return receptionProbability
+
+# 'capture' level of the PHY model: the frame is received if and only if its
+# SINR stays above a threshold. Since the SINR is lowest when the energy level
+# is highest, it is enough to keep the highest energy level, and compare it,
+# once the frame is over, with the power of the frame plus 'margin' (the
+# threshold translated to a margin over the frame's power). There is no
+# transcendental math per energy state.
+class CaptureReception:
+
+	__slots__ = ['receivingPower', 'start', 'end', 'margin', 'maxLevel', 'maxSimTransmissions']
+
+	def __init__(self, receivingPower, start, duration, level, howMany, margin):
+
+		self.receivingPower = receivingPower
+		self.start = start
+		self.end = start + duration
+		self.margin = margin
+		self.maxLevel = level
+		self.maxSimTransmissions = howMany
+
+	def update(self, now, level, howMany):
+
+		if now >= self.end:
+			return
+
+		if now == self.start:
+			# Only the last of the changes at the start applies to the frame.
+			self.maxLevel = level
+			self.maxSimTransmissions = howMany
+			return
+
+		if self.maxLevel < level:
+			self.maxLevel = level
+		if self.maxSimTransmissions < howMany:
+			self.maxSimTransmissions = howMany
+
+	def finish(self):
+
+		if self.maxLevel <= self.receivingPower + self.margin:
+			return 1.0
+
+		return 0.0
+
+# Runs the capture and exact levels side by side for every frame, to measure
+# how far the cheaper level deviates (option --phyCompare). The outcome of the
+# frame is decided by the level selected with --phy.
+class ComparedReception:
+
+	__slots__ = ['selected', 'capture', 'exact', 'comparison', 'maxSimTransmissions']
+
+	def __init__(self, selected, capture, exact, comparison):
+
+		self.selected = selected
+		self.capture = capture
+		self.exact = exact
+		self.comparison = comparison
+		self.maxSimTransmissions = exact.maxSimTransmissions
+
+	def update(self, now, level, howMany):
+
+		self.capture.update(now, level, howMany)
+		self.exact.update(now, level, howMany)
+
+	def finish(self):
+
+		captureProbability = self.capture.finish()
+		exactProbability = self.exact.finish()
+		self.comparison.add(captureProbability, exactProbability)
+
+		if self.selected == 'capture':
+			self.maxSimTransmissions = self.capture.maxSimTransmissions
+			return captureProbability
+
+		self.maxSimTransmissions = self.exact.maxSimTransmissions
+		return exactProbability
+
+class PhyComparison:
+
+	def __init__(self):
+
+		self.receptions = 0
+		self.absDifference = 0.0
+		self.maxAbsDifference = 0.0
+		self.disagreements = 0
+		self.captureLosses = 0.0
+		self.exactLosses = 0.0
+
+	def add(self, captureProbability, exactProbability):
+
+		difference = abs(captureProbability - exactProbability)
+		self.receptions = self.receptions + 1
+		self.absDifference = self.absDifference + difference
+		self.maxAbsDifference = max(self.maxAbsDifference, difference)
+		if (captureProbability >= 0.5) != (exactProbability >= 0.5):
+			self.disagreements = self.disagreements + 1
+
+		# Expected number of frames lost with each level.
+		self.captureLosses = self.captureLosses + 1 - captureProbability
+		self.exactLosses = self.exactLosses + 1 - exactProbability
+
+	def summary(self):
+
+		receptions = max(self.receptions, 1)
+		return {'receptions': self.receptions, 'meanAbsDifference': self.absDifference / receptions,
+			'maxAbsDifference': self.maxAbsDifference, 'disagreements': self.disagreements,
+			'expectedLossesCapture': self.captureLosses, 'expectedLossesExact': self.exactLosses}
+
+def captureThreshold(symbols):
+
+	# SINR (dB) at which a frame of that many symbols, received with a
+	# constant SINR, has a probability 1/2 of being received with the
+	# 'segment' level (found by bisection).
+	low = -20.0
+	high = 40.0
+	for i in range(60):
+		middle = (low + high) / 2
+		symbolErrorProbability = erfc(math.sqrt(dBm2mW(middle))) / 2
+		if math.pow(1 - symbolErrorProbability, symbols) < 0.5:
+			low = middle
+		else:
+			high = middle
+
+	return (low + high) / 2
+
 # Class that defines a node: either station or AP.
 class Node:
 
@@ -483,9 +1098,17 @@ class Node:
 	STATE_BACKOFF = 3
 	STATE_TX = 4
 
-	def __init__(self, env, id, posX, posY, medium, groups, ap, rate):
+	# Nodes keep no per-instance dictionary, which matters with many stations.
+	__slots__ = ['sim', 'env', 'config', 'arrivalRandom', 'backoffRandom', 'dataRandom',
+		'ackRandom', 'id', 'posX', 'posY', 'medium', 'groups', 'rate', 'state', 'DIFSCounter', 'backoffCounter', 'energyLevel', 'energyHowMany', 'noiseFloor',
+		'receptions', 'ap', 'currentPacket', 'lastSuccessfullAttempt', 'hasPacket', 'blocked', 'channelIdle',
+		'difsAction', 'backoffAction', 'ackAction']
+
+	def __init__(self, sim, id, posX, posY, medium, groups, ap, rate):
 
-		self.env = env
+		self.sim = sim
+		self.env = sim.env
+		self.config = sim.config
 		self.id = id
 		self.posX = posX
 		self.posY = posY
@@ -493,22 +1116,70 @@ class Node:
 		self.groups = groups
 		self.rate = rate
 
+		# Random streams used for the packet arrivals of the node, its backoff
+		# counters, and the reception of its data frames (drawn by the AP) and
+		# of the acks sent to it. Unless common random numbers are requested,
+		# these are all the single stream of the simulation.
+		self.arrivalRandom = sim.nodeRandom(id, 'arrivals')
+		self.backoffRandom = sim.nodeRandom(id, 'backoff')
+		self.dataRandom = sim.nodeRandom(id, 'data')
+		self.ackRandom = sim.nodeRandom(id, 'ack')
+
 		self.state = self.STATE_IDLE
 		self.DIFSCounter = 0
 		self.backoffCounter = 0
 
-		self.receivedEnergy = []
-		self.receivedEnergy.append({'when': env.now, 'level': BACKGROUND_NOISE, 'howMany': 0})
+		# Current energy level perceived by the node's interface and number of
+		# transmitters contributing to it. The noise floor includes the
+		# background term of the distant interferers, with mean-field
+		# aggregation.
+		self.energyLevel = BACKGROUND_NOISE
+		self.energyHowMany = 0
+		self.noiseFloor = BACKGROUND_NOISE
+
+		# Frames currently being received by this node.
+		self.receptions = []
 		self.ap = ap
 
-	def start(self):
-		env.process(self.run())
+		# Id of the last packet generated and time of the last successful
+		# transmission.
+		self.currentPacket = -1
+		self.lastSuccessfullAttempt = -1
+
+		# Whether the node is handling a packet, and whether it gave up its
+		# last packet and waits for the next slot of its group before it can
+		# get another one (see Simulation.endState).
+		self.hasPacket = False
+		self.blocked = False
+
+	def start(self, backlogged=False, blocked=False):
+
+		# Backlogged nodes start with a packet to transmit, and blocked ones
+		# wait for the slot of their group before their first packet.
+		if self.config.scaleMode:
+			if backlogged:
+				self.packetArrived(None, True)
+			elif blocked:
+				self.blocked = True
+				self.sim.rawScheduler.sleepUntilSlot(self).callbacks.append(self.unblock)
+			else:
+				self.waitForPacket()
+		else:
+			self.env.process(self.run(backlogged, blocked))
+
+	def unblock(self, event):
 
-	def run(self):
+		self.blocked = False
+		self.waitForPacket()
 
-		# Initialize some internal state variables
-		lastSuccessfullAttempt = -1
-		currentPacket = -1
+	def run(self, backlogged=False, blocked=False):
+
+		if backlogged:
+			yield from self.sendPacket(True)
+		elif blocked:
+			self.blocked = True
+			yield self.sim.rawScheduler.sleepUntilSlot(self)
+			self.blocked = False
 
 		# Each iteration of the next loop corresponds to a packet
 		# transmission (perhaps, multiple attempts at the link layer).
@@ -518,234 +1189,324 @@ class Node:
 			# a possion distribution with the rate specified in the constructor.
 			# So here we draw the interval until the next packet from an exponential
 			# distribution.
-			intervalToNextPacket = random.expovariate(self.rate)
+			intervalToNextPacket = self.arrivalRandom.expovariate(self.rate)
 			if intervalToNextPacket > 0:
-				yield self.env.timeout(intervalToNextPacket)
-
-			# Now we have a new packet to transmit.
-			currentPacket = currentPacket + 1
-			self.log("+", str(currentPacket))
-			#print(str(self.env.now) + ' STA ' + str(self.id) + ' wants to transmit another packet.')
-
-			# Check if we are currently at our groups slot.
-			currentCycle = math.floor(env.now / (args.numberOfGroups * args.slotSize))
-			currentGroup = math.floor((env.now - currentCycle * args.numberOfGroups * args.slotSize) / args.slotSize)
-			#print("#######grupo#################")
-			#print(self.groups[self.id])
-			#print("#######node#################")
-			#print(self.id)
-			if currentGroup != self.groups[self.id]:
-
-				# Not my group. Compute wait time until the next
-				# slot in my group.
-				if currentGroup < self.groups[self.id]:
-
-					# Group slot is still within this cycle
-					timeUntilMyGroup = (currentCycle * args.numberOfGroups * args.slotSize + self.groups[self.id] * args.slotSize) - env.now
+
+				# Meanwhile, the station sleeps and does not follow the
+				# medium, unless sleeping stations must stay attached to it
+				# (option -dR).
+				if self.config.disableRawScheduler or len(self.receptions) > 0:
+					yield self.env.timeout(intervalToNextPacket)
 				else:
-					# Next slot is in the next cycle
-					timeUntilMyGroup = ((currentCycle + 1) * args.numberOfGroups * args.slotSize + self.groups[self.id] * args.slotSize) - env.now
+					self.medium.sleep(self)
+					yield self.env.timeout(intervalToNextPacket)
+					self.medium.wake(self)
+
+			yield from self.sendPacket()
+
+	def waitForPacket(self, event=None):
+
+		# Scale mode: instead of running a process all the time, a station
+		# waiting for its next packet only has a pending timeout. A process is
+		# started when the packet arrives, and ends once it has been handled.
+		# Meanwhile, the station does not follow the medium either (as when
+		# it sleeps until the slot of its group).
+		intervalToNextPacket = self.arrivalRandom.expovariate(self.rate)
+		self.env.timeout(intervalToNextPacket).callbacks.append(self.packetArrived)
+		if len(self.receptions) == 0:
+			self.medium.sleep(self)
+
+	def packetArrived(self, event, carried=False):
+
+		self.medium.wake(self)
+		self.env.process(self.sendPacket(carried)).callbacks.append(self.waitForPacket)
+
+	def sendPacket(self, carried=False):
+
+		# Now we have a new packet to transmit. A packet carried over from the
+		# previous time window (see timeparallel.py) was already counted as
+		# generated, and as deferred if it had to wait for our slot.
+		currentPacket = self.currentPacket + 1
+		self.currentPacket = currentPacket
+		self.hasPacket = True
+		lastSuccessfullAttempt = self.lastSuccessfullAttempt
+		if self.sim.sampler != None:
+			self.sim.sampler.newPacket(self.id)
+		if not carried:
+			self.log(EVENT_NEW_PACKET, currentPacket)
+		#print(str(self.env.now) + ' STA ' + str(self.id) + ' wants to transmit another packet.')
+
+		# Check if we are currently at our groups slot.
+		currentCycle = math.floor(self.env.now / (self.config.numberOfGroups * self.config.slotSize))
+		currentGroup = math.floor((self.env.now - currentCycle * self.config.numberOfGroups * self.config.slotSize) / self.config.slotSize)
+		#print("#######grupo#################")
+		#print(self.groups[self.id])
+		#print("#######node#################")
+		#print(self.id)
+		if currentGroup != self.groups[self.id]:
+
+			# Not my group. Compute wait time until the next
+			# slot in my group.
+			timeUntilMyGroup = self.sim.rawScheduler.nextSlotStart(self.groups[self.id]) - self.env.now
+
+			if not carried:
+				self.log(EVENT_DEFER, currentPacket, value=timeUntilMyGroup)
+			#print(str(self.env.now) + ' STA ' + str(self.id) + ': still not my group. Waiting ' + str(timeUntilMyGroup) + 'us until next opportunity.')
+
+			slotStart = yield self.sim.rawScheduler.sleepUntilSlot(self)
+
+			endOfSlot = slotStart + self.config.slotSize
+		else:
 
-				self.log("D", str(currentPacket) + ' ' + str(timeUntilMyGroup))
-				#print(str(self.env.now) + ' STA ' + str(self.id) + ': still not my group. Waiting ' + str(timeUntilMyGroup) + 'us until next opportunity.')
+			# We are already within a slot of our group. Compute
+			# when the slot is going to end.
+			endOfSlot = currentCycle * self.config.numberOfGroups * self.config.slotSize + (self.groups[self.id] + 1) * self.config.slotSize
 
-				yield env.timeout(timeUntilMyGroup)
+			self.log(EVENT_IN_SLOT, currentPacket, value=endOfSlot, level=1)
+			#print(str(self.env.now) + ' STA ' + str(self.id) + ': we are at my groups slot, until ' + str(endOfSlot) + '.')
 
-				endOfSlot = env.now + args.slotSize
-			else:
+		# At this point, we are currently within the slot of our group.
+		# Attempt medium access: CSMA/CA
 
-				# We are already within a slot of our group. Compute
-				# when the slot is going to end.
-				endOfSlot = currentCycle * args.numberOfGroups * args.slotSize + (self.groups[self.id] + 1) * args.slotSize
+		# Set the initial contention window size
+		cw = CW_MIN
 
-				self.log("G", str(currentPacket) + ' ' + str(endOfSlot), 1)
-				#print(str(self.env.now) + ' STA ' + str(self.id) + ': we are at my groups slot, until ' + str(endOfSlot) + '.')
+		# Zero the number of attempts for the current packet.
+		attempts = 0
 
-			# At this point, we are currently within the slot of our group.
-			# Attempt medium access: CSMA/CA
+		# If we have not just successfully transmitted a packet, we may not
+		# have to perform backoff (it depends on other conditions below).
+		# Test if that is the case, and set the backoffNeeded flag accordingly.
+		if lastSuccessfullAttempt == self.env.now:
+			needsBackoff = True
+		else:
+			needsBackoff = False
 
-			# Set the initial contention window size
-			cw = CW_MIN
+		# Let's proactively choose a random backoff counter (even if we may
+		# not use it later).
+		self.backoffCounter = self.drawBackoff(cw)
+		self.log(EVENT_BACKOFF_DRAW, currentPacket, value=cw, level=1)
 
-			# Zero the number of attempts for the current packet.
-			attempts = 0
+		# With isolated slots (option -iso), we stop contending as soon as the
+		# slot ends, so every wait below also ends then.
+		slotOver = None
+		if self.sim.isolatedSlots:
+			slotOver = self.env.timeout(endOfSlot - self.env.now)
 
-			# If we have not just successfully transmitted a packet, we may not
-			# have to perform backoff (it depends on other conditions below).
-			# Test if that is the case, and set the backoffNeeded flag accordingly.
-			if lastSuccessfullAttempt == self.env.now:
+		while True:
+
+			# The slot for our group may have ended from the last point we
+			# verified (e.g., last transmission attempt) to now. Check it
+			# again.
+			if self.env.now > endOfSlot or (slotOver != None and self.env.now >= endOfSlot):
+				self.log(EVENT_ABORT, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Transmission aborted due to the end of group slot.')
+				break
+
+			# Is the medium is busy? In that case, we need
+			# to wait an unspecified amount of time for the medium to be
+			# idle again. Only then we can start the DIFS count down procedure.
+			# As other STAs finish their transmissions, they will update our
+			# receivedEnergy level and trigger the channelIdle event created
+			# below.
+			self.syncEnergy()
+			self.state = self.STATE_CCA
+			if self.medium.lazy:
+				self.medium.listen(self)
+			#self.log("receivedEnergy", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+			#if(self.receivedEnergy[-1]['level'] == -95):
+				#self.log("receivedEnergy95", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+
+			#print(str(self.env.now) + ' uiSTA ' + str(self.id) + ':  idle ?...' + str(self.receivedEnergy[-1]['level']) + ' > ' + str(CS_THRESHOLD))
+			if self.energyLevel > CS_THRESHOLD:
+				#print(str(self.env.now) + ' oiSTA ' + str(self.id) + ': medium became idle...' + str(self.receivedEnergy[-1]['level']))
 				needsBackoff = True
+				#self.log("receivedEnergyMS", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+				self.log(EVENT_MEDIUM_BUSY, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': waiting for medium to become idle...')
+				#self.log("receivedEnergychannel1", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+				self.channelIdle = self.env.event()
+				#self.log("receivedEnergychannel2", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level'])+' '+str(self.channelIdle))
+				if slotOver != None:
+					yield self.channelIdle | slotOver
+					if self.env.now >= endOfSlot:
+						continue
+				else:
+					yield self.channelIdle
+				#self.log("receivedEnergychannel3", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level'])+' '+str(self.channelIdle))
+				#self.log("receivedEnergyMI", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+				self.log(EVENT_MEDIUM_IDLE, currentPacket)
+				#if((self.receivedEnergy[-1]['level'])<-95):
+				#	import os
+				#	os.system("pause")
+
+			# We can only proceed (backoff or transmission) if the medium has
+			# been free for at least DIFS, so we wait for that to happen.
+			self.syncEnergy()
+			self.state = self.STATE_DIFS
+			lastDifsAttempt = self.env.now
+			#self.log("receivedEnergyMDS", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+			self.log(EVENT_DIFS_START, currentPacket)
+			#print(str(self.env.now) + ' STA ' + str(self.id) + ': starting difs countdown...')
+			self.difsAction = self.env.event()
+			if slotOver != None:
+				yield self.difsAction | self.env.timeout(DIFS) | slotOver
+				if self.env.now >= endOfSlot:
+					continue
 			else:
-				needsBackoff = False
+				yield self.difsAction | self.env.timeout(DIFS)
+			if self.env.now - lastDifsAttempt < DIFS:
+				self.log(EVENT_DIFS_INTERRUPT, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + 'Medium not free for enough time (DIFS)...')
+				self.state = self.STATE_IDLE
+				needsBackoff = True
 
-			# Let's proactively choose a random backoff counter (even if we may
-			# not use it later).
-			self.backoffCounter = random.randint(0, cw)
-			self.log('Cw', str(currentPacket) + ' ' + str(cw), 1)
+				continue
 
-			while True:
+			self.log(EVENT_DIFS_OVER, currentPacket)
+			#print(str(self.env.now) + ' STA ' + str(self.id) + ': DIFS countdown is over...')
+
+			# Do we need to perform a backoff?
+			#self.log("receivedEnergyBS", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
+			if needsBackoff == True:
+
+				# If we got this far, then the medium has been idle for the
+				# required amount of time. Now we can decrease the backoff
+				# counter while it remains idle.
+				self.syncEnergy()
+				self.state = self.STATE_BACKOFF
+				lastBackoffAttempt = self.env.now
+				self.log(EVENT_BACKOFF_START, currentPacket, value=self.backoffCounter)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': continuing backoff countdown...')
+
+				self.backoffAction = self.env.event()
+				if slotOver != None:
+					yield self.backoffAction | self.env.timeout(self.backoffCounter * SLOT_TIME) | slotOver
+					if self.env.now >= endOfSlot:
+						continue
+				else:
+					yield self.backoffAction | self.env.timeout(self.backoffCounter * SLOT_TIME)
 
-				# The slot for our group may have ended from the last point we
-				# verified (e.g., last transmission attempt) to now. Check it
-				# again.
-				if self.env.now > endOfSlot:
-					self.log("A", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Transmission aborted due to the end of group slot.')
-					break
+				self.log(EVENT_BACKOFF_INTERRUPT, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Backoff count down interrupted (or done)...')
 
-				# Is the medium is busy? In that case, we need
-				# to wait an unspecified amount of time for the medium to be
-				# idle again. Only then we can start the DIFS count down procedure.
-				# As other STAs finish their transmissions, they will update our
-				# receivedEnergy level and trigger the channelIdle event created
-				# below.
-				self.state = self.STATE_CCA
-				#self.log("receivedEnergy", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-				#if(self.receivedEnergy[-1]['level'] == -95):
-					#self.log("receivedEnergy95", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-
-				#print(str(self.env.now) + ' uiSTA ' + str(self.id) + ':  idle ?...' + str(self.receivedEnergy[-1]['level']) + ' > ' + str(CS_THRESHOLD))
-				if self.receivedEnergy[-1]['level'] > CS_THRESHOLD:
-					#print(str(self.env.now) + ' oiSTA ' + str(self.id) + ': medium became idle...' + str(self.receivedEnergy[-1]['level']))
-					needsBackoff = True
-					#self.log("receivedEnergyMS", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-					self.log("Ms", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': waiting for medium to become idle...')
-					#self.log("receivedEnergychannel1", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-					self.channelIdle = self.env.event()
-					#self.log("receivedEnergychannel2", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level'])+' '+str(self.channelIdle))
-					yield self.channelIdle
-					#self.log("receivedEnergychannel3", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level'])+' '+str(self.channelIdle))
-					#self.log("receivedEnergyMI", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-					self.log("Mi", str(currentPacket))
-					#if((self.receivedEnergy[-1]['level'])<-95):
-					#	import os
-					#	os.system("pause")
-
-				# We can only proceed (backoff or transmission) if the medium has
-				# been free for at least DIFS, so we wait for that to happen.
-				self.state = self.STATE_DIFS
-				lastDifsAttempt = env.now
-				#self.log("receivedEnergyMDS", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-				self.log("MDs", str(currentPacket))
-				#print(str(self.env.now) + ' STA ' + str(self.id) + ': starting difs countdown...')
-				self.difsAction = self.env.event()
-				yield self.difsAction | self.env.timeout(DIFS)
-				if self.env.now - lastDifsAttempt < DIFS:
-					self.log("MDi", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + 'Medium not free for enough time (DIFS)...')
+				# Either the backoff count down is over, or it was interrupted
+				# because the medium became busy. Update the backoff counter
+				# based on the current time in order to find what which.
+				if (self.env.now - lastBackoffAttempt < self.backoffCounter * SLOT_TIME):
+					self.backoffCounter = self.backoffCounter - math.floor((self.env.now - lastBackoffAttempt) / SLOT_TIME)
 					self.state = self.STATE_IDLE
-					needsBackoff = True
-
 					continue
 
-				self.log("MDo", str(currentPacket))
-				#print(str(self.env.now) + ' STA ' + str(self.id) + ': DIFS countdown is over...')
-
-				# Do we need to perform a backoff?
-				#self.log("receivedEnergyBS", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-				if needsBackoff == True:
+				self.log(EVENT_BACKOFF_OVER, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Backoff is over...')
+
+			# At this point, the we probably can proceed to the transmission
+			# itself. However, because of all the time we had to spend
+			# before, our group slot may be over (or close). Test if the
+			# transmission fits the current group slot (with isolated slots,
+			# along with the wait for its ack).
+			if self.env.now + DATA_PACKET_TIME + (ACK_TIMEOUT if slotOver != None else 0) > endOfSlot:
+
+				# No, it doesn't.
+				self.log(EVENT_ABORT, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Transmission aborted due to the end of group slot.')
+
+				# Wait for the next slot of our group. The packet is already
+				# given up.
+				self.hasPacket = False
+				self.blocked = True
+				if self.medium.lazy:
+					self.medium.stopListening(self)
+				yield self.sim.rawScheduler.sleepUntilSlot(self)
+				self.blocked = False
 
-					# If we got this far, then the medium has been idle for the
-					# required amount of time. Now we can decrease the backoff
-					# counter while it remains idle.
-					self.state = self.STATE_BACKOFF
-					lastBackoffAttempt = env.now
-					self.log("Bs", str(currentPacket) + ' ' + str(self.backoffCounter))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': continuing backoff countdown...')
-
-					self.backoffAction = self.env.event()
-					yield self.backoffAction | self.env.timeout(self.backoffCounter * SLOT_TIME)
+				break
 
-					self.log("Bi", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Backoff count down interrupted (or done)...')
+			# Yes, it does. Proceeed to transmission.
+			self.state = self.STATE_TX
+			if self.medium.lazy:
+				self.medium.stopListening(self)
+			yield self.env.process(self.transmit(currentPacket))
 
-					# Either the backoff count down is over, or it was interrupted
-					# because the medium became busy. Update the backoff counter
-					# based on the current time in order to find what which.
-					if (env.now - lastBackoffAttempt < self.backoffCounter * SLOT_TIME):
-						self.backoffCounter = self.backoffCounter - math.floor((env.now - lastBackoffAttempt) / SLOT_TIME)
-						self.state = self.STATE_IDLE
-						continue
+			# Wait for ack.
+			self.ackAction = self.env.event()
+			yield self.ackAction | self.env.timeout(ACK_TIMEOUT)
+			if self.ackAction.triggered == True:
 
-					self.log("Bo", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Backoff is over...')
+				# Success.
+				self.log(EVENT_SUCCESS, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Packet transmission completed successfully.')
+				lastSuccessfullAttempt = self.env.now
+				self.lastSuccessfullAttempt = lastSuccessfullAttempt
 
-				# At this point, the we probably can proceed to the transmission
-				# itself. However, because of all the time we had to spend
-				# before, our group slot may be over (or close). Test if the
-				# transmission fits the current group slot.
-				if self.env.now + DATA_PACKET_TIME > endOfSlot:
+				break
 
-					# No, it doesn't.
-					self.log("A", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Transmission aborted due to the end of group slot.')
+			else:
 
-					# Check if we are currently at our groups slot.
-					currentCycle = math.floor(env.now / (args.numberOfGroups * args.slotSize))
-					currentGroup = math.floor((env.now - currentCycle * args.numberOfGroups * args.slotSize) / args.slotSize)
+				# Something went wrong.
+				self.log(EVENT_ACK_TIMEOUT, currentPacket)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Transmission attempt failed.')
 
-					if currentGroup < self.groups[self.id]:
+				# Check if the maximum retry limit was reached.
+				attempts = attempts + 1
+				if attempts > RETRY_LIMIT:
+					self.log(EVENT_DROP, currentPacket)
+					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Packet transmission failed due to retry limit.')
+					break
 
-						# Group slot is still within this cycle
-						timeUntilMyGroup = (currentCycle * args.numberOfGroups * args.slotSize + self.groups[self.id] * args.slotSize) - env.now
-					else:
-						# Next slot is in the next cycle
-						timeUntilMyGroup = ((currentCycle + 1) * args.numberOfGroups * args.slotSize + self.groups[self.id] * args.slotSize) - env.now
+				# Update contantion window size.
+				if cw < CW_MAX:
+					cw = 2 * (cw + 1) - 1
 
-					yield self.env.timeout(timeUntilMyGroup)
+				# Choose new random backoff counter for the next attempt.
+				self.backoffCounter = self.drawBackoff(cw)
+				needsBackoff = True
 
-					break
+				self.log(EVENT_BACKOFF_DRAW, currentPacket, value=cw, level=1)
+				#print(str(self.env.now) + ' STA ' + str(self.id) + ': Retrying with congestion window = ' + str(cw) + '.')
 
-				# Yes, it does. Proceeed to transmission.
-				self.state = self.STATE_TX
-				yield self.env.process(self.transmit(currentPacket))
 
-				# Wait for ack.
-				self.ackAction = self.env.event()
-				yield self.ackAction | self.env.timeout(ACK_TIMEOUT)
-				if self.ackAction.triggered == True:
+		# We are finally over with the CSMA/CA proceedure. Medium becomes
+		# idle.
+		self.state = self.STATE_IDLE
+		self.hasPacket = False
+		if self.medium.lazy:
+			self.medium.stopListening(self)
 
-					# Success.
-					self.log("S", str(currentPacket))
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Packet transmission completed successfully.')
-					lastSuccessfullAttempt = self.env.now
+	def syncEnergy(self):
 
-					break
+		# With coalesced updates, apply the ones still queued for this instant
+		# before the node starts reacting to energy changes, as it would
+		# without them.
+		if self.medium.coalesce:
+			self.medium.flushUpdates()
 
-				else:
+	def isContending(self):
 
-					# Something went wrong.
-					self.log("Ato", str(currentPacket) + ' [ack]')
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Transmission attempt failed.')
+		# Whether the node is waiting for the medium (idle, DIFS or backoff).
+		return self.state == self.STATE_CCA or self.state == self.STATE_DIFS or self.state == self.STATE_BACKOFF
 
-					# Check if the maximum retry limit was reached.
-					attempts = attempts + 1
-					if attempts > RETRY_LIMIT:
-						self.log("D", str(currentPacket))
-						#print(str(self.env.now) + ' STA ' + str(self.id) + ': Packet transmission failed due to retry limit.')
-						break
+	def drawBackoff(self, cw):
 
-					# Update contantion window size.
-					if cw < CW_MAX:
-						cw = 2 * (cw + 1) - 1
+		if self.sim.sampler != None:
+			return self.sim.sampler.drawBackoff(self.id, self.backoffRandom, cw)
 
-					# Choose new random backoff counter for the next attempt.
-					self.backoffCounter = random.randint(0, cw)
-					needsBackoff = True
+		return self.backoffRandom.randint(0, cw)
 
-					self.log('Cw', str(currentPacket) + ' ' + str(cw), 1)
-					#print(str(self.env.now) + ' STA ' + str(self.id) + ': Retrying with congestion window = ' + str(cw) + '.')
+	def receptionFails(self, station, draw, receptionProbability):
 
+		# 'station' is the id of the station the frame is accounted to (the
+		# sender of a data frame, or the receiver of an ack).
+		if self.sim.sampler != None:
+			return self.sim.sampler.receptionFails(station, draw, receptionProbability)
 
-			# We are finally over with the CSMA/CA proceedure. Medium becomes
-			# idle.
-			self.state = self.STATE_IDLE
+		return draw > receptionProbability
 
 	def transmit(self, currentPacket):
 
 		#self.log("receivedEnergyTRANSMIT", ' '+str(currentPacket)+' ' + str(self.id) +' '+str(self.receivedEnergy[-1]['level']))
-		self.log("Ts", str(currentPacket))
+		self.log(EVENT_TX_START, currentPacket)
 		#print(str(self.env.now) + ': STA ' + str(self.id) + ': Starting transmission...' +' energy: '+str(self.receivedEnergy[-1]['level']))
 
 		# First of all, we have to update the current energy level perceived by
@@ -761,7 +1522,7 @@ class Node:
 		# Compute the duration of the transmission and wait for it to be complete
 		yield self.env.timeout(DATA_PACKET_TIME)
 
-		self.log("To", str(currentPacket))
+		self.log(EVENT_TX_END, currentPacket)
 		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Ending transmission...')
 		# Now the transmission is over, we should update the medium.
 		self.medium.stopNodeTransmission(self)
@@ -781,12 +1542,16 @@ class Node:
 
 	def increaseReceivedEnergy(self, increment):
 
-		currentLevel = self.receivedEnergy[-1]['level']
-		howMany = self.receivedEnergy[-1]['howMany']
+		currentLevel = self.energyLevel
+		howMany = self.energyHowMany
 		newLevel = sumdBmPower(currentLevel, increment)
-		self.receivedEnergy.append({'when': self.env.now, 'level': newLevel, 'howMany': howMany + 1})
+		self.energyLevel = newLevel
+		self.energyHowMany = howMany + 1
+
+		for reception in self.receptions:
+			reception.update(self.env.now, newLevel, howMany + 1)
 
-		self.log("Ei", str(currentLevel) + ' -> ' + str(newLevel) + ' [ ' + str(howMany + 1) + ']', 2)
+		self.log(EVENT_ENERGY_INCREASE, count=howMany + 1, value=newLevel, aux=currentLevel, level=2)
 		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Increasing energy level from ' + str(currentLevel) + ' to ' + str(newLevel) + '...')
 
 		if newLevel > CS_THRESHOLD:
@@ -795,99 +1560,111 @@ class Node:
 			elif self.state == self.STATE_BACKOFF and self.backoffAction.triggered == False:
 				self.backoffAction.succeed()
 
-		self.cleanReceivedEnergyHistory()
-
 	def decreaseReceivedEnergy(self, decrement):
 
-		currentLevel = self.receivedEnergy[-1]['level']
-		howMany = self.receivedEnergy[-1]['howMany']
+		currentLevel = self.energyLevel
+		howMany = self.energyHowMany
 
 		if howMany == 1:
 			# Mitigate float point approximation errors: if we are 'removing' the
 			# energy corresponding to the last still active transmitter, than,
 			# instead of subtracting the power, we simply assign the noise floor.
-			newLevel = BACKGROUND_NOISE
+			newLevel = self.noiseFloor
 		else:
-			newLevel = subtractdBmPower(currentLevel, decrement)
+			try:
+				newLevel = subtractdBmPower(currentLevel, decrement)
+			except ValueError:
+				# The remaining transmitters are too weak, compared to the one
+				# that stopped, to survive the subtraction (e.g., with stations
+				# very close to each other): add them up again.
+				newLevel = self.medium.energyLevelAt(self)
+
+		self.energyLevel = newLevel
+		self.energyHowMany = howMany - 1
 
-		self.receivedEnergy.append({'when': self.env.now, 'level': newLevel, 'howMany': howMany - 1})
+		for reception in self.receptions:
+			reception.update(self.env.now, newLevel, howMany - 1)
 
-		self.log("Ed", str(currentLevel) + ' -> ' + str(newLevel) + ' [ ' + str(howMany - 1) + ']', 2)
+		self.log(EVENT_ENERGY_DECREASE, count=howMany - 1, value=newLevel, aux=currentLevel, level=2)
 		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Decreasing energy level from ' + str(currentLevel) + ' to ' + str(newLevel) + '...')
 
 		if self.state == self.STATE_CCA:
 			if newLevel <= CS_THRESHOLD and self.channelIdle.triggered == False:
 				self.channelIdle.succeed()
 
-		self.cleanReceivedEnergyHistory()
+	def changeReceivedEnergy(self, added, removed, count):
 
-	def cleanReceivedEnergyHistory(self):
+		# Coalesced updates (see Medium.flushUpdates): 'added' and 'removed'
+		# are the total power, in mW, of the transmissions that started and
+		# stopped at this instant, and 'count' the change in their number.
+		currentLevel = self.energyLevel
+		howMany = self.energyHowMany + count
 
-		while len(self.receivedEnergy) > 1:
+		if howMany == 0:
+			newLevel = self.noiseFloor
+		else:
+			try:
+				newLevel = mW2dBm(dBm2mW(currentLevel) + added - removed)
+			except ValueError:
+				# Same as in decreaseReceivedEnergy.
+				newLevel = self.medium.energyLevelAt(self)
 
-			if self.receivedEnergy[1]['when'] < self.env.now - DATA_PACKET_TIME:
-				self.receivedEnergy.pop(0)
-			else:
-				break
+		self.energyLevel = newLevel
+		self.energyHowMany = howMany
+
+		for reception in self.receptions:
+			reception.update(self.env.now, newLevel, howMany)
+
+		if added > removed:
+			self.log(EVENT_ENERGY_INCREASE, count=howMany, value=newLevel, aux=currentLevel, level=2)
+		else:
+			self.log(EVENT_ENERGY_DECREASE, count=howMany, value=newLevel, aux=currentLevel, level=2)
+
+		# As with separate updates, only transmissions that start interrupt
+		# DIFS and backoff, and only transmissions that stop may free the
+		# medium.
+		if newLevel > CS_THRESHOLD:
+			if added > 0:
+				if self.state == self.STATE_DIFS and self.difsAction.triggered == False:
+					self.difsAction.succeed()
+				elif self.state == self.STATE_BACKOFF and self.backoffAction.triggered == False:
+					self.backoffAction.succeed()
+		elif removed > 0 and self.state == self.STATE_CCA and self.channelIdle.triggered == False:
+			self.channelIdle.succeed()
 
 	def receiveData(self, source, currentPacket):
 
 		# TODO: include a propagation delay here.
 
-		self.log("Rs", '_' + str(source.getId()) + '_ ' + str(currentPacket))
+		self.log(EVENT_RX_START, currentPacket, peer=source.getId())
 		#print(str(self.env.now) + ' AP ' + str(self.id) + ': Starting data packet reception...')
 
-		transmissionStart = self.env.now
+		# Start tracking the energy received during the frame.
+		if self.medium.lazy:
+			self.medium.listen(self)
+		if self.medium.meanField != None:
+			self.medium.meanField.receptionStarted(self, source)
+		reception = self.sim.newReception(self.medium.getPowerMatrix(source.id, self.id), self.env.now, DATA_PACKET_TIME, self.energyLevel, self.energyHowMany)
+		self.receptions.append(reception)
 
 		# Wait for the transmission to be concluded.
 		yield self.env.timeout(DATA_PACKET_TIME)
 
-		transmissionEnd = self.env.now
+		self.receptions.remove(reception)
+		if self.medium.meanField != None:
+			self.medium.meanField.receptionEnded(self, source)
+		if self.medium.lazy and not self.isContending():
+			self.medium.stopListening(self)
 
-		self.log("Ro", '_' + str(source.getId()) + '_ ' + str(currentPacket))
+		self.log(EVENT_RX_END, currentPacket, peer=source.getId())
 		#print(str(self.env.now) + ' AP ' + str(self.id) + ': Ending packet reception...')
 
-		# SNIR-based error model: use the received power with respect to the source
-		# and compute how likely it is that the packet was received without errors.
-		receivingPower = self.medium.getPowerMatrix(source.id, self.id)
-		receptionProbability = 1
-		currentStateEnd = transmissionEnd
-		maxSimTransmissions = 0
-		for i in range(len(self.receivedEnergy) - 1, -1, -1):
-
-			if self.receivedEnergy[i]['when'] >= transmissionEnd:
-				continue
-
-			# Check for how long the current receivedEnergy information applies
-			# to the incoming packet.
-			if self.receivedEnergy[i]['when'] <= transmissionStart:
-				currentStateHowLong = currentStateEnd - transmissionStart
-				currentStateEnd = transmissionStart
-			else:
-				currentStateHowLong = currentStateEnd - self.receivedEnergy[i]['when']
-				currentStateEnd = self.receivedEnergy[i]['when']
-
-			# Compute the number of symbols affected by the current energy state.
-			currentStateSymbols = currentStateHowLong / SYMBOL_DURATION
-			# Compute the SINR for the incoming packet
-			currentStateSINR = receivingPower - subtractdBmPower(self.receivedEnergy[i]['level'], receivingPower)
-
-			if maxSimTransmissions < self.receivedEnergy[i]['howMany']:
-				#self.log('receivedEnergyMany', '%' + str(self.receivedEnergy[i]['howMany']) + '% ' + str(maxSimTransmissions) + ' ' + str(maxSimTransmissions))
-				maxSimTransmissions = self.receivedEnergy[i]['howMany']
-            # TODO: use a more complex error model. For now, we are just using a
-			# simple mathematical model for the error in a BPSK modulation symbol.
-			#symbolErrorProbability = math.erfc(math.sqrt(dBm2mW(currentStateSINR))) / 2
-
-			symbolErrorProbability = erfc(math.sqrt(dBm2mW(currentStateSINR))) / 2
-			receptionProbability = receptionProbability * math.pow(1-symbolErrorProbability, currentStateSymbols)
-
-			currentStateEnd = self.receivedEnergy[i]['when']
+		# SNIR-based error model: the reception has accumulated how likely it is
+		# that the packet was received without errors.
+		receptionProbability = reception.finish()
+		maxSimTransmissions = reception.maxSimTransmissions
 
-			if self.receivedEnergy[i]['when'] <= transmissionStart:
-				break
-
-		self.log('PER', '_' + str(source.getId()) + '_ ' + str(currentPacket) + ' ' + str(receptionProbability), 2)
+		self.log(EVENT_PER, currentPacket, peer=source.getId(), value=receptionProbability, level=2)
 		#print(str(self.env.now) + ' AP ' + str(self.id) + ': Estimated PER = ' + str(1-receptionProbability))
 		#print(str(self.env.now) + ' node ' + str(source.id) + ': Estimated PER = ' + str(receptionProbability) + 'symbolErrorProbability' + str(symbolErrorProbability))
 
@@ -896,25 +1673,25 @@ class Node:
 					#SNR = (self.powerMatrix[i.getId()][j.getId()] - BACKGROUND_NOISE)
 					#symbolErrorProbability = erfc(math.sqrt(dBm2mW(SNR))) / 2
 					#receptionProbability = math.pow(1-symbolErrorProbability, DATA_PACKET_SIZE)
-		aaa = random.random()
+		aaa = source.dataRandom.random()
 		#print(str(source.getId()))
 		#print('if aaa > receptionProbability', 'aaa', aaa, 'receptionProbability', receptionProbability)
 		#import os
 		#os.system("pause")
 		
-		if aaa > receptionProbability:
+		if self.receptionFails(source.id, aaa, receptionProbability):
 		#if random.random() > receptionProbability:
-			self.log('d', '_' + str(source.getId()) + '_ ' + str(currentPacket) + ' ' + str(maxSimTransmissions))
+			self.log(EVENT_RX_FAIL, currentPacket, peer=source.getId(), count=maxSimTransmissions)
 			#print(str(self.env.now) + ' AP ' + str(self.id) + ': Packet lost due to SINR...')
 		else:
-			self.log('r', '_' + str(source.getId()) + '_ ' + str(currentPacket) + ' ' + str(maxSimTransmissions))
+			self.log(EVENT_RX_OK, currentPacket, peer=source.getId(), count=maxSimTransmissions)
 			#print(str(self.env.now) + ' AP ' + str(self.id) + ': Packet successfully received, sending ack...')
 
 			# Send ack.
-			self.log('MS', '_' + str(source.getId()) + '_ ' + str(currentPacket) + ' [ack]')
+			self.log(EVENT_ACK_SIFS, currentPacket, peer=source.getId())
 			yield self.env.timeout(SIFS)
 
-			self.log('Ts', '_' + str(source.getId()) + '_ ' + str(currentPacket) + ' [ack]')
+			self.log(EVENT_ACK_TX_START, currentPacket, peer=source.getId())
 
 			# First of all, we have to update the current energy level perceived by
 			# each of the other nodes. We delegate that to the medium class.
@@ -929,234 +1706,661 @@ class Node:
 
 			# Now the transmission is over, we should update the medium.
 			self.medium.stopNodeTransmission(self)
-			self.log('To', '_' + str(source.getId()) + '_ ' + str(currentPacket) + ' [ack]')
+			self.log(EVENT_ACK_TX_END, currentPacket, peer=source.getId())
 
 
 	def receiveAck(self, source, currentPacket):
 
-		self.log("Rs", str(currentPacket) + ' [ack]')
+		self.log(EVENT_ACK_RX_START, currentPacket)
 		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Starting ack packet reception... to ' + str(source.id))
 
-		transmissionStart = self.env.now
+		# Start tracking the energy received during the frame.
+		if self.medium.lazy:
+			self.medium.listen(self)
+		if self.medium.meanField != None:
+			self.medium.meanField.receptionStarted(self, source)
+		reception = self.sim.newReception(self.medium.getPowerMatrix(source.id, self.id), self.env.now, ACK_PACKET_TIME, self.energyLevel, self.energyHowMany)
+		self.receptions.append(reception)
 
 		# Wait for the transmission to be concluded.
 		yield self.env.timeout(ACK_PACKET_TIME)
 
-		transmissionEnd = self.env.now
+		self.receptions.remove(reception)
+		if self.medium.lazy and not self.isContending():
+			self.medium.stopListening(self)
 
-		self.log("Ro", str(currentPacket) + ' [ack]')
+		self.log(EVENT_ACK_RX_END, currentPacket)
 		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Ending ack packet reception...')
 
-		# SNIR-based error model: use the received power with respect to the source
-		# and compute how likely it is that the packet was received without errors.
-		receivingPower = self.medium.getPowerMatrix(source.id, self.id)
-		receptionProbability = 1
-		currentStateEnd = transmissionEnd
-		maxSimTransmissions = 0
-		for i in range(len(self.receivedEnergy) - 1, -1, -1):
+		# SNIR-based error model: the reception has accumulated how likely it is
+		# that the packet was received without errors.
+		receptionProbability = reception.finish()
+		maxSimTransmissions = reception.maxSimTransmissions
 
-			if self.receivedEnergy[i]['when'] >= transmissionEnd:
-				continue
+		self.log(EVENT_ACK_PER, currentPacket, value=receptionProbability)
+		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Estimated PER = ' + str(receptionProbability))
 
-			# Check for how long the current receivedEnergy information applies
-			# to the incoming packet.
-			if self.receivedEnergy[i]['when'] <= transmissionStart:
-				currentStateHowLong = currentStateEnd - transmissionStart
-				currentStateEnd = transmissionStart
-			else:
-				currentStateHowLong = currentStateEnd - self.receivedEnergy[i]['when']
-				currentStateEnd = self.receivedEnergy[i]['when']
+		if self.receptionFails(self.id, self.ackRandom.random(), receptionProbability):
+			self.log(EVENT_ACK_RX_FAIL, currentPacket, count=maxSimTransmissions)
+			#print(str(self.env.now) + ' STA ' + str(self.id) + ': Ack Packet lost due to SINR...')
+		else:
+			self.log(EVENT_ACK_RX_OK, currentPacket, count=maxSimTransmissions)
+			#print(str(self.env.now) + ' STA ' + str(self.id) + ': Ack Packet successfully received')
+			self.ackAction.succeed()
 
-			# Compute the number of symbols affected by the current energy state.
-			currentStateSymbols = currentStateHowLong / SYMBOL_DURATION
-			# Compute the SINR for the incoming packet
-			currentStateSINR = receivingPower - subtractdBmPower(self.receivedEnergy[i]['level'], receivingPower)
+	def log(self, code, packet=-1, peer=-1, count=-1, value=0, aux=0, level=0):
+
+		self.sim.logEvent(level, code, self.env.now, self.id, peer, packet, count, value, aux)
+
+### Simulation API
+
+# Options that define a simulation. They can be set from the command line or,
+# when the simulator is used as a library, passed to the Simulation class as a
+# dictionary keyed by the long option names (e.g., {'numberOfSTAs': 10}).
+def buildArgumentParser():
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-n", "--numberOfSTAs", help="number of STAs in the simulation", type=int, default=1)
+	parser.add_argument("-g", "--numberOfGroups", help="number of RAW grous in the simulation", type=int, default=1)
+	parser.add_argument("-G", "--groupsFromFile", type=str, help="read station grouping information from file. If this option is used, any value specified with -g will be ignored.", default=None)
+	parser.add_argument("-S", "--slotSize", help="length of the slot of each group in us", type=int, default=50e3)
+	parser.add_argument("-W", "--scenarioWidth", help="width of the area used for positioning nodes in m", type=int, default=1000)
+	parser.add_argument("-H", "--scenarioHeight", help="height of the area used for positioning nodes in m", type=int, default=1000)
+	parser.add_argument("-s", "--seed", help="seed for the pseudo-random number generator", type=int, default=random.randint(0, 99999999))
+	parser.add_argument("-T", "--topology", help="place stations with this layout, at real-valued coordinates (see topology.py); by default, stations are placed uniformly at integer coordinates", choices=['uniform', 'cluster', 'grid', 'ring'], default=None)
+	parser.add_argument("-md", "--minDistance", help="minimum distance between stations in m (with -T)", type=float, default=0)
+	parser.add_argument("-c", "--clusters", help="number of clusters of the cluster layout (default: one per 50 stations)", type=int, default=None)
+	parser.add_argument("-cs", "--clusterSpread", help="standard deviation of the distance of stations to their cluster center in m (cluster layout)", type=float, default=None)
+	parser.add_argument("-r", "--rate", help="average packet generation rate for each node in packet/us", type=float, default=10000)
+	parser.add_argument("-l", "--length", help="simulation length in us", type=float, default=2e7) #3e6 #2e7us = 20 segundos)
+	parser.add_argument("-v", "--verbosity", type=int, help="increase output log verbosity", choices=[0, 1, 2, 3, 4], default=0)
+	parser.add_argument("-pP", "--printPositions", type=str, help="create file with node positions", default=None)
+	parser.add_argument("-pE", "--printPER", type=str, help="create file with PER values for each link (considering background noise)", default=None)
+	parser.add_argument("-mp", "--propagationModel", help="calculates loss of path between two stations", default=None)
+	parser.add_argument("-dR", "--disableRawScheduler", help="keep sleeping stations attached to the medium and wake them up individually (slower; reproduces the log of earlier versions exactly)", default=False, action='store_const', const=True)
+	parser.add_argument("-crn", "--commonRandomNumbers", help="give each node separate random streams for its packet arrivals, backoff and receptions, so that runs of different configurations with the same seed share them (see compare.py)", default=False, action='store_const', const=True)
+	parser.add_argument("-av", "--antithetic", help="use the antithetic counterparts of the random streams of -crn (implies -crn)", default=False, action='store_const', const=True)
+	parser.add_argument("-is", "--importanceSampling", help="draw frame receptions whose failure probability is below this value as if it were this value, and weight the statistics by the likelihood ratio (see importance.py)", type=float, default=None)
+	parser.add_argument("-isb", "--biasBackoff", help="with importance sampling, draw half of the backoff counters from this fraction of the contention window (lowest values)", type=float, default=None)
+	parser.add_argument("-lc", "--lazyCarrierSense", help="only update the energy level of the nodes contending for the medium or receiving a frame on each transmission, and compute that of the others when they need it (nodes that are not listening do not log energy changes)", default=False, action='store_const', const=True)
+	parser.add_argument("-cu", "--coalesceUpdates", help="apply the transmissions that start or stop at the same instant (e.g., at the beginning of a RAW slot) to each node as a single update of its energy level, logged as a single energy change", default=False, action='store_const', const=True)
+	parser.add_argument("-mf", "--meanFieldDistance", help="track exactly only the interferers closer than this distance in m to each node, and replace the others by a background term estimated per region and RAW slot (see meanfield.py)", type=float, default=None)
+	parser.add_argument("-mfp", "--meanFieldPower", help="same as -mf, with the limit given as the power received from the interferer in dBm", type=float, default=None)
+	parser.add_argument("-mfc", "--meanFieldCell", help="size in m of the square regions of the mean-field model (default: half the distance of -mf)", type=float, default=None)
+	parser.add_argument("--phy", help="fidelity of the reception model: 'capture' receives a frame if its lowest SINR is above a threshold (fastest), 'segment' integrates the symbol errors over the frame, and 'exact' does the same while checking the computation", choices=['capture', 'segment', 'exact'], default='segment')
+	parser.add_argument("-ct", "--captureThreshold", help="SINR threshold in dB of the capture model (default: the SINR at which a frame of the same size is received with probability 1/2 by the segment model, 5.4 dB for data frames and 1.0 dB for acks)", type=float, default=None)
+	parser.add_argument("--phyCompare", help="also compute the capture and exact models for every frame, and report how far they deviate in the summary (the outcome of frames is decided by --phy)", default=False, action='store_const', const=True)
+	parser.add_argument("--window", help="index of the time window simulated, for time-parallel runs (see timeparallel.py): the stations are placed as with window 0, but the random streams of the nodes depend on the window", type=int, default=0)
+	parser.add_argument("--initialBacklog", help="ids of the stations that have a packet to transmit when the simulation starts", type=int, nargs='+', default=None)
+	parser.add_argument("--initialBlocked", help="ids of the stations that wait for the slot of their group before their first packet", type=int, nargs='+', default=None)
+	parser.add_argument("-og", "--onlyGroup", help="only simulate the stations of this group, with isolated slots (see -iso), for per-group parallel runs (see groupparallel.py); the summary reports its transmissions that end after its slot", type=int, default=None)
+	parser.add_argument("-iso", "--isolatedSlots", help="stations stop contending as soon as the slot of their group ends, and only start a transmission if the wait for its ack also ends within the slot, so the groups never interact", default=False, action='store_const', const=True)
+	parser.add_argument("-fr", "--flightRecorder", type=str, help="keep the last events of each node in memory, whatever the verbosity, and dump them to files with this prefix when a station has too many consecutive ack timeouts, drops a packet or stalls, or on SIGUSR1 (see flightrecorder.py)", default=None)
+	parser.add_argument("-frv", "--flightLevel", type=int, help="verbosity of the events kept by the flight recorder", default=0)
+	parser.add_argument("-frn", "--flightRecords", type=int, help="number of events kept per node by the flight recorder", default=64)
+	parser.add_argument("-fra", "--flightAckTimeouts", type=int, help="number of consecutive ack timeouts of a station that triggers a dump of the flight recorder", default=5)
+	parser.add_argument("-frs", "--flightStall", type=float, help="time in us after which a station with a packet that has logged nothing triggers a dump of the flight recorder (should be longer than a RAW cycle; default: never)", default=None)
+	parser.add_argument("-frd", "--flightDumps", type=int, help="largest number of dumps of the flight recorder", default=10)
+	parser.add_argument("-X", "--scaleMode", help="reduce the memory used per station, for scenarios with very many stations (see scalemode.py); powers are quantized to 0.01 dB or computed on demand", default=False, action='store_const', const=True)
+	parser.add_argument("-M", "--memoryBudget", help="with -X, memory budget in MB: fail right away if the scenario would not fit", type=float, default=None)
+	parser.add_argument("-B", "--binaryLog", type=str, help="write the event log to this file in the columnar binary format (see eventlog.py) instead of the text log", default=None)
+	parser.add_argument("-tr", "--trace", type=str, help="write the simulated timeline to this file in the Chrome trace format, for Perfetto or chrome://tracing (see tracing.py); compressed if its name ends with .gz", default=None)
+	parser.add_argument("-tN", "--traceNodes", help="only trace these nodes (the AP is node 0)", type=int, nargs='+', default=None)
+	parser.add_argument("-tb", "--traceBegin", help="only trace the timeline from this time in us", type=float, default=None)
+	parser.add_argument("-te", "--traceEnd", help="only trace the timeline up to this time in us", type=float, default=None)
+
+	return parser
+
+# Build the complete set of options of a simulation from a dictionary (or an
+# argparse namespace) holding only some of them. The others take their
+# default values.
+def makeConfig(config=None):
+
+	defaults = buildArgumentParser().parse_args([])
+
+	if config == None:
+		config = {}
+	elif isinstance(config, argparse.Namespace):
+		config = vars(config)
+
+	for key, value in config.items():
+		if not hasattr(defaults, key):
+			raise ValueError('unknown simulation option: ' + str(key))
+		setattr(defaults, key, value)
+
+	return defaults
+
+# A single simulation run. Creating it does no work: the scenario is built and
+# simulated by run(), which returns the statistics of the run (see
+# runstats.py). The text log is written to 'output', if given.
+class Simulation:
+
+	def __init__(self, config=None, output=None):
+
+		self.config = makeConfig(config)
+		self.output = output
+
+	def nodeRandom(self, id, purpose):
+
+		# Random stream of a node for the given purpose. With common random
+		# numbers, it only depends on the seed, the node and the purpose, so
+		# it draws the same numbers regardless of the other options. The
+		# positions of the stations still come from the single stream of the
+		# simulation, which draws nothing else.
+		if not (self.config.commonRandomNumbers or self.config.antithetic):
+			return self.random
+
+		seed = str(self.config.seed) + '/' + str(id) + '/' + purpose
+		if self.config.window != 0:
+			seed = seed + '/' + str(self.config.window)
+		if self.config.antithetic:
+			return AntitheticRandom(seed)
+
+		return random.Random(seed)
+
+	def newReception(self, receivingPower, start, duration, level, howMany):
+
+		# Reception of a frame, with the PHY model of the requested level.
+		phy = self.config.phy
+		if phy == 'segment' and not self.config.phyCompare:
+			return Reception(receivingPower, start, duration, level, howMany)
+
+		if phy == 'exact' and not self.config.phyCompare:
+			return ValidatedReception(receivingPower, start, duration, level, howMany)
+
+		margin = self.captureMargins.get(duration)
+		if margin == None:
+			threshold = self.config.captureThreshold
+			if threshold == None:
+				threshold = captureThreshold(duration / SYMBOL_DURATION)
+			margin = mW2dBm(1 + dBm2mW(-threshold))
+			self.captureMargins[duration] = margin
+
+		capture = CaptureReception(receivingPower, start, duration, level, howMany, margin)
+		if not self.config.phyCompare:
+			return capture
+
+		return ComparedReception(phy, capture, ValidatedReception(receivingPower, start, duration, level, howMany), self.phyComparison)
+
+	def endState(self):
+
+		# State of the stations at the end of a run that ends with a RAW cycle
+		# (see timeparallel.py), as three lists of ids: the stations with a
+		# packet that wait for the slot of their group; those that wait for
+		# the slot of their group before they can get another packet, since
+		# they gave up the last one; and those still contending at the end of
+		# the slot of the last group, which are about to give up their packet
+		# and wait likewise. Stations of the last group that wait for the ack
+		# of a frame sent right before the end of the slot may still succeed,
+		# so they are taken as backlogged instead. The slot of the first group
+		# starts right away, so its stations do not have to wait for it.
+		last = self.config.numberOfGroups - 1
+		backlog = []
+		blocked = []
+		aborting = []
+		for node in self.nodeList:
+			group = self.groups[node.getId()]
+			if node.hasPacket and group == last and node.state != node.STATE_TX:
+				aborting.append(node.getId())
+			elif node.hasPacket:
+				backlog.append(node.getId())
+			elif node.blocked and group != 0:
+				blocked.append(node.getId())
+
+		return backlog, blocked, aborting
+
+	def addEventSink(self, sink):
+
+		# Keep, for each level (0 to 4, see -v), the write methods of the sinks
+		# whose level is at least that one, so logging an event takes no test
+		# per sink.
+		self.eventSinks.append(sink)
+		self.eventWriters = [tuple(sink.write for sink in self.eventSinks if level <= sink.level) for level in range(5)]
+
+	def logEvent(self, level, code, time, node, peer, packet, count, value, aux):
+
+		# Deliver an event to every sink whose level is at least that of the
+		# event.
+		for write in self.eventWriters[level]:
+			write(code, time, node, peer, packet, count, value, aux)
 
-			if maxSimTransmissions < self.receivedEnergy[i]['howMany']:
-				maxSimTransmissions = self.receivedEnergy[i]['howMany']
+	def run(self):
 
-			# TODO: use a more complex error model. For now, we are just using a
-			# simple mathematical model for the error in a BPSK modulation symbol.
-			#symbolErrorProbability = math.erfc(math.sqrt(dBm2mW(currentStateSINR))) / 2
-			symbolErrorProbability = erfc(math.sqrt(dBm2mW(currentStateSINR))) / 2
-			receptionProbability = receptionProbability * math.pow(1-symbolErrorProbability, currentStateSymbols)
+		self.setup()
+
+		# Start each nodes' process
+		backlog = set(self.config.initialBacklog or [])
+		blocked = set(self.config.initialBlocked or [])
+		for node in self.nodeList:
+			node.start(node.getId() in backlog, node.getId() in blocked)
+		if self.medium.meanField != None:
+			self.medium.meanField.start()
+		if self.flightRecorder != None:
+			self.flightRecorder.start()
+
+		self.env.run(until=self.config.length)
+
+		for sink in self.eventSinks:
+			sink.close()
+
+		results = self.statistics.summary()
+		if self.sampler != None:
+			results['importanceSampling'].update(self.sampler.summary())
+		if self.medium.meanField != None:
+			results['meanField'] = self.medium.meanField.summary()
+		if self.phyComparison != None:
+			results['phyComparison'] = self.phyComparison.summary()
+		if self.slotSpill != None:
+			results['slotSpill'] = self.slotSpill.summary()
+
+		return results
+
+	def setup(self):
+
+		config = self.config
+
+		# Create the destinations for the simulation log. Check if the user
+		# requested the binary format.
+		self.eventSinks = []
+		self.eventWriters = [()] * 5
+		if config.binaryLog != None:
+			from eventlog import EventLogWriter
+			self.addEventSink(EventLogWriter(config.binaryLog, config.verbosity))
+		elif self.output != None:
+			self.addEventSink(TextEventSink(self.output, config.verbosity))
+
+		# Set seed for pseudo-random number generation.
+		self.random = random.Random(config.seed)
+
+		# Margin of the capture model over the power of the frame, per frame
+		# duration, and comparison of the PHY models, if requested.
+		self.captureMargins = {}
+		self.phyComparison = None
+		if config.phyCompare:
+			self.phyComparison = PhyComparison()
+
+		# Per-group runs only make sense if the groups never interact.
+		self.isolatedSlots = config.isolatedSlots or config.onlyGroup != None
+
+		# Draws biased for importance sampling, if requested.
+		self.sampler = None
+		if config.importanceSampling != None or config.biasBackoff != None:
+			from importance import ImportanceSampler
+			self.sampler = ImportanceSampler(config.importanceSampling, config.biasBackoff)
+
+		# Create simulation environment
+		self.env = simpy.Environment()
+
+		# In scale mode, check that the scenario fits the memory budget before
+		# building it, and measure the memory it actually takes.
+		if config.scaleMode:
+			from scalemode import checkMemoryBudget, MemoryMeter
+			quantized = checkMemoryBudget(config)
+			meter = MemoryMeter()
+
+		# Create the medium object
+		self.medium = Medium(self, config.numberOfSTAs + 1)
+		self.rawScheduler = RawScheduler(self)
+
+		# Create AP.
+		self.ap = Node(self, 0, config.scenarioWidth / 2.0, config.scenarioHeight / 2.0, self.medium, -1, None, None)
+		self.medium.addNode(self.ap)
+
+		# Did the user request logging nodes' positions?
+		if config.printPositions != None:
+			positionsFile = open(config.printPositions, 'w')
+			# The AP is always at the center of the scenario.
+			# positionsFile.write('0 ' + str(config.scenarioWidth / 2.0) + ' ' + str(config.scenarioHeight / 2.0) + '\n')
+			positionsFile.write('ap ' + str(config.scenarioWidth / 2.0) + ' ' + str(config.scenarioHeight / 2.0) + '\n')
 
-			currentStateEnd = self.receivedEnergy[i]['when']
+		else:
+			positionsFile = None
 
-			if self.receivedEnergy[i]['when'] <= transmissionStart:
-				break
+		self.createStations(positionsFile)
 
-		self.log('PER', str(currentPacket) + '  [ack] ' + str(receptionProbability))
-		#print(str(self.env.now) + ' STA ' + str(self.id) + ': Estimated PER = ' + str(receptionProbability))
+		if positionsFile != None:
+			positionsFile.close()
+
+		# Other time windows than the first draw different random numbers
+		# from now on (the stations stay where they are).
+		if config.window != 0:
+			self.random.seed(str(config.seed) + '/window/' + str(config.window))
+
+		if config.scaleMode:
+			self.medium.buildPowerMatrix(quantized)
+			self.scenarioBytes = meter.stop()
+
+		# Only simulate the stations of one group, if requested (see
+		# groupparallel.py). The others keep their place in the medium, but
+		# neither run nor follow its energy level.
+		if config.onlyGroup != None:
+			self.nodeList = [node for node in self.nodeList if self.groups[node.getId()] == config.onlyGroup]
+			for id in list(self.medium.awakeNodes):
+				if id != 0 and self.groups[id] != config.onlyGroup:
+					del self.medium.awakeNodes[id]
+
+		#print("self.nodeList Coordinates")			
+		#for k in nodeList:
+		#	print((k.getId()), str(k.getPosX()),str(k.getPosY()))
+
+		if config.propagationModel != None:
+			self.medium.propagationModelFile(config.propagationModel)
+			
+		# Aggregate the distant interferers, if requested.
+		if config.meanFieldDistance != None or config.meanFieldPower != None:
+			from meanfield import MeanFieldInterference, distanceToPower, powerToDistance
+			if config.meanFieldPower != None:
+				threshold = config.meanFieldPower
+				distance = powerToDistance(threshold, TRANSMISSION_POWER, ANTENNA_GAIN, ANTENNA_HEIGHT)
+			else:
+				distance = config.meanFieldDistance
+				threshold = distanceToPower(distance, TRANSMISSION_POWER, ANTENNA_GAIN, ANTENNA_HEIGHT)
+			cellSize = config.meanFieldCell if config.meanFieldCell != None else distance / 2.0
+			self.medium.meanField = MeanFieldInterference(self, threshold, cellSize, BACKGROUND_NOISE)
+
+		# For debug purposes
+		self.medium.logPowerMatrix()
+		if config.printPER != None:
+			self.medium.logPER(config.printPER)
+
+		# Collect the statistics of the run.
+		if self.sampler != None:
+			self.statistics = RunStatistics(self.groups, self.sampler.weight)
+		else:
+			self.statistics = RunStatistics(self.groups)
+		self.addEventSink(self.statistics)
+
+		# Transmissions of the group that spill over the slots of the others,
+		# when simulating a single group.
+		self.slotSpill = None
+		if config.onlyGroup != None:
+			from groupparallel import SlotSpill
+			self.slotSpill = SlotSpill(config.onlyGroup, config.numberOfGroups, config.slotSize)
+			self.addEventSink(self.slotSpill)
+
+		# Keep the last events of each node, to be dumped if something odd
+		# happens, if requested.
+		self.flightRecorder = None
+		if config.flightRecorder != None:
+			from flightrecorder import FlightRecorder
+			self.flightRecorder = FlightRecorder(self, config.flightRecorder, config.flightLevel, config.flightRecords,
+				config.flightAckTimeouts, config.flightStall, config.flightDumps)
+			self.addEventSink(self.flightRecorder)
+
+		# Did the user request a trace of the timeline?
+		if config.trace != None:
+			from tracing import TraceWriter
+			self.addEventSink(TraceWriter(config.trace, config.numberOfGroups, config.slotSize, self.groups,
+				config.traceNodes, config.traceBegin, config.traceEnd))
+
+	def createStations(self, positionsFile):
+
+		config = self.config
+		medium = self.medium
+		ap = self.ap
+
+		# Check if the user specified a file with the desired grouping of the stations.
+		if config.groupsFromFile != None:
+			i = 0
+			nodeList = []
+			groups = [None]
+			usedCoordinates = {}
+			# Yes, parse that file and generate a dictionary with the mapping between stations
+			# and groups.
+			groupsFile = open(config.groupsFromFile, 'r')
+
+			# Initialize the dictionary
+			coordinatesToGroups = {}
+
+			# In this file's format, each line contains the information regarding the grouping
+			# of a single node. Thus, we split the file into records consisting of one line each.
+			data = groupsFile.readlines()
+			groupsFile.close()
+			for line in data:
+
+				# Each line is of the format
+				# C[XXX, YYY]
+				# where:
+				# - C is the cluster number (from 0 to the number of clusters minus 1)
+				# - XXX is a float-point number representing the x-coordinate of the node position.
+				# - YYY is a float-point number representing the y-coordinate of the node position.
+
+				# Replace characters '[', ']' and ',' in order to facilitate parsing the
+				# information.
+				# print(line)
+				line = line.replace('[', ' ')
+				line = line.replace(']', '')
+				line = line.replace(',', '')
+
+				info = line.split()
+				group = int(info[0])
+				#print(info)
+
+				posX = int(float(info[1]))
+				posY = int(float(info[2]))
+				coordinatesToGroups[str(posX) + '_' + str(posY)] = group
+
+				node = Node(self, i + 1, posX, posY, medium, groups, ap, config.rate)
+				medium.addNode(node)
+				nodeList.append(node)
+				if positionsFile != None:
+					positionsFile.write(str(i) + ' ' + str(posX) + ' ' + str(posY) + '\n')
+
+				i=i+1
+
+				groups.append(coordinatesToGroups[str(posX) + "_" + str(posY)])
+
+				#print(posX,posY,i)
+
+		elif config.topology == None:
+			#GroupFileTXT = open('GroupFile.TXT', 'w') #linha adicionada para atender ao algoritmo HMR dia 26/06/2021
+			# Iterate to create stations
+			nodeList = []
+			groups = [None]
+			usedCoordinates = {}
+			for i in range(config.numberOfSTAs):
+				while True:
+					# TODO: change random function used below to generate real values, instead of integers.
+					posX = self.random.randint(0, config.scenarioWidth)
+					posY = self.random.randint(0, config.scenarioHeight)
+
+					if str(posX) + "_" + str(posY) in usedCoordinates:
+						continue
+					else:
+						usedCoordinates[str(posX) + "_" + str(posY)] = 1
+						break
+
+				node = Node(self, i + 1, posX, posY, medium, groups, ap, config.rate)
+				medium.addNode(node)
+				nodeList.append(node)
+
+				groups.append(i % config.numberOfGroups)
+
+				if positionsFile != None:
+					#positionsFile.write(str(i % config.numberOfGroups) + ' ' + str(i) + ' ' + str(posX) + ' ' + str(posY) + '\n')
+					#print(str(i+1),str(posX),str(posY))
+					positionsFile.write(str(i+1) + ' ' + str(posX) + ' ' + str(posY) + '\n')
+
+				#GroupFileTXT.write(str(i % config.numberOfGroups) + ' ' + str(i+1) + ' ' + str(posX) + ' ' + str(posY) + '\n') #linha adicionada para atender ao algoritmo HMR dia 26/06/2021
 
-		if random.random() > receptionProbability:
-			self.log('d', str(currentPacket) + ' [ack] ' + str(maxSimTransmissions))
-			#print(str(self.env.now) + ' STA ' + str(self.id) + ': Ack Packet lost due to SINR...')
 		else:
-			self.log('r', str(currentPacket) + ' [ack] ' + str(maxSimTransmissions))
-			#print(str(self.env.now) + ' STA ' + str(self.id) + ': Ack Packet successfully received')
-			self.ackAction.succeed()
+			# All positions are generated at once, and the received power matrix
+			# is filled in a single step instead of node by node.
+			import numpy as np
+			from topology import generatePositions
 
-	def log(self, type, what, level=0):
+			positions = generatePositions(config.topology, config.numberOfSTAs, config.scenarioWidth, config.scenarioHeight,
+				np.random.default_rng(config.seed), config.minDistance, config.clusters, config.clusterSpread)
 
-		log(type + ' ' + str(self.env.now) + ' _' + str(self.id) + '_ ' + what, level)
+			nodeList = []
+			groups = [None]
+			for i, (posX, posY) in enumerate(positions.tolist()):
+				nodeList.append(Node(self, i + 1, posX, posY, medium, groups, ap, config.rate))
+				groups.append(i % config.numberOfGroups)
 
-### Main program
+			medium.addNodes(nodeList)
 
-# Parse command line arguments in order to set simulation parameters
-parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-
-parser.add_argument("-n", "--numberOfSTAs", help="number of STAs in the simulation", type=int, default=1)
-parser.add_argument("-g", "--numberOfGroups", help="number of RAW grous in the simulation", type=int, default=1)
-parser.add_argument("-G", "--groupsFromFile", type=str, help="read station grouping information from file. If this option is used, any value specified with -g will be ignored.", default=None)
-parser.add_argument("-S", "--slotSize", help="length of the slot of each group in us", type=int, default=50e3)
-parser.add_argument("-W", "--scenarioWidth", help="width of the area used for positioning nodes in m", type=int, default=1000)
-parser.add_argument("-H", "--scenarioHeight", help="height of the area used for positioning nodes in m", type=int, default=1000)
-parser.add_argument("-s", "--seed", help="seed for the pseudo-random number generator", type=int, default=random.randint(0, 99999999))
-parser.add_argument("-r", "--rate", help="average packet generation rate for each node in packet/us", type=float, default=10000)
-parser.add_argument("-l", "--length", help="simulation length in us", type=float, default=2e7) #3e6 #2e7us = 20 segundos)
-parser.add_argument("-v", "--verbosity", type=int, help="increase output log verbosity", choices=[0, 1, 2, 3, 4], default=0)
-parser.add_argument("-pP", "--printPositions", type=str, help="create file with node positions", default=None)
-parser.add_argument("-pE", "--printPER", type=str, help="create file with PER values for each link (considering background noise)", default=None)
-parser.add_argument("-z", "--zip", help="generate zipped output", default=False, action='store_const', const=True)
-parser.add_argument("-mp", "--propagationModel", help="calculates loss of path between two stations", default=None)
-
-args = parser.parse_args()
-
-# Create the output stream for the simulation log. Check if the user requested
-# a zipped output.
-if args.zip == False:
-	outputStream = OutStream()
-else:
-	outputStream = CompressedOutStream()
-
-# Set seed for pseudo-random number generation.
-random.seed(args.seed)
-
-# Create simulation environment
-env = simpy.Environment()
-
-# Create the medium object
-medium = Medium(args.numberOfSTAs + 1)
-
-# Create AP.
-ap = Node(env, 0, args.scenarioWidth / 2.0, args.scenarioHeight / 2.0, medium, -1, None, None)
-medium.addNode(ap)
-
-# Did the user request logging nodes' positions?
-if args.printPositions != None:
-	positionsFile = open(args.printPositions, 'w')
-	# The AP is always at the center of the scenario.
-	# positionsFile.write('0 ' + str(args.scenarioWidth / 2.0) + ' ' + str(args.scenarioHeight / 2.0) + '\n')
-	positionsFile.write('ap ' + str(args.scenarioWidth / 2.0) + ' ' + str(args.scenarioHeight / 2.0) + '\n')
-
-else:
-	positionsFile = None
-
-# Check if the user specified a file with the desired grouping of the stations.
-if args.groupsFromFile != None:
-	i = 0
-	nodeList = []
-	groups = [None]
-	usedCoordinates = {}
-	# Yes, parse that file and generate a dictionary with the mapping between stations
-	# and groups.
-	groupsFile = open(args.groupsFromFile, 'r')
-
-	# Initialize the dictionary
-	coordinatesToGroups = {}
-
-	# In this file's format, each line contains the information regarding the grouping
-	# of a single node. Thus, we split the file into records consisting of one line each.
-	data = groupsFile.readlines()
-	for line in data:
-
-		# Each line is of the format
-		# C[XXX, YYY]
-		# where:
-		# - C is the cluster number (from 0 to the number of clusters minus 1)
-		# - XXX is a float-point number representing the x-coordinate of the node position.
-		# - YYY is a float-point number representing the y-coordinate of the node position.
-
-		# Replace characters '[', ']' and ',' in order to facilitate parsing the
-		# information.
-		# print(line)
-		line = line.replace('[', ' ')
-		line = line.replace(']', '')
-		line = line.replace(',', '')
-
-		info = line.split()
-		group = int(info[0])
-		#print(info)
-
-		posX = int(float(info[1]))
-		posY = int(float(info[2]))
-		coordinatesToGroups[str(posX) + '_' + str(posY)] = group
-
-		node = Node(env, i + 1, posX, posY, medium, groups, ap, args.rate)
-		medium.addNode(node)
-		nodeList.append(node)
-		if positionsFile != None:
-			positionsFile.write(str(i) + ' ' + str(posX) + ' ' + str(posY) + '\n')
+			if positionsFile != None:
+				positionsFile.write(''.join(str(i + 1) + ' ' + str(posX) + ' ' + str(posY) + '\n' for i, (posX, posY) in enumerate(positions.tolist())))
 
-		i=i+1
+		self.nodeList = nodeList
+		self.groups = groups
+
+### Worker mode
+
+# Requests and responses are exchanged as JSON objects, one per line. A request
+# of the form {"id": ..., "config": {...}} runs a simulation with the given
+# options and is answered with {"id": ..., "results": {...}} (or with
+# {"id": ..., "error": "..."} if it fails). A request {"shutdown": true} stops
+# the worker; further shutdown requests, from the same or other connections,
+# are ignored. Simulations run in a pool of up to 'jobs' processes, started as
+# requests come in and kept for the next ones, so each process pays the
+# start-up cost once.
+
+def runJob(config):
 
-		groups.append(coordinatesToGroups[str(posX) + "_" + str(posY)])
+	return Simulation(config).run()
 
-		#print(posX,posY,i)
+def serve(socketPath, jobs=1):
+
+	import asyncio
+	import os
+	from concurrent.futures import ProcessPoolExecutor
+
+	async def handleConnection(reader, writer):
 
-else:
-	#GroupFileTXT = open('GroupFile.TXT', 'w') #linha adicionada para atender ao algoritmo HMR dia 26/06/2021
-	# Iterate to create stations
-	nodeList = []
-	groups = [None]
-	usedCoordinates = {}
-	for i in range(args.numberOfSTAs):
 		while True:
-			# TODO: change random function used below to generate real values, instead of integers.
-			posX = random.randint(0, args.scenarioWidth)
-			posY = random.randint(0, args.scenarioHeight)
+			line = await reader.readline()
+			if not line:
+				break
 
-			if str(posX) + "_" + str(posY) in usedCoordinates:
-				continue
+			try:
+				request = json.loads(line)
+			except ValueError as e:
+				request = {}
+				response = {'error': 'invalid request: ' + str(e)}
 			else:
-				usedCoordinates[str(posX) + "_" + str(posY)] = 1
-				break
+				if request.get('shutdown') == True:
+					if not stopped.done():
+						stopped.set_result(True)
+					break
 
-		node = Node(env, i + 1, posX, posY, medium, groups, ap, args.rate)
-		medium.addNode(node)
-		nodeList.append(node)
+				try:
+					results = await loop.run_in_executor(executor, runJob, request.get('config', {}))
+					response = {'results': results}
+				except Exception as e:
+					response = {'error': type(e).__name__ + ': ' + str(e)}
 
-		groups.append(i % args.numberOfGroups)
+			if 'id' in request:
+				response['id'] = request['id']
+			writer.write(json.dumps(response).encode() + b'\n')
+			await writer.drain()
 
-		if positionsFile != None:
-			#positionsFile.write(str(i % args.numberOfGroups) + ' ' + str(i) + ' ' + str(posX) + ' ' + str(posY) + '\n')
-			#print(str(i+1),str(posX),str(posY))
-			positionsFile.write(str(i+1) + ' ' + str(posX) + ' ' + str(posY) + '\n')
+		writer.close()
 
-		#GroupFileTXT.write(str(i % args.numberOfGroups) + ' ' + str(i+1) + ' ' + str(posX) + ' ' + str(posY) + '\n') #linha adicionada para atender ao algoritmo HMR dia 26/06/2021
+	async def main():
 
+		server = await asyncio.start_unix_server(handleConnection, path=socketPath)
+		async with server:
+			await stopped
 
+	if os.path.exists(socketPath):
+		os.remove(socketPath)
 
-if positionsFile != None:
-	positionsFile.close()
+	executor = ProcessPoolExecutor(max_workers=jobs)
+	loop = asyncio.new_event_loop()
+	stopped = loop.create_future()
+	try:
+		loop.run_until_complete(main())
+	finally:
+		executor.shutdown()
+		loop.close()
+		if os.path.exists(socketPath):
+			os.remove(socketPath)
 
-#print("self.nodeList Coordinates")			
-#for k in nodeList:
-#	print((k.getId()), str(k.getPosX()),str(k.getPosY()))
+# Client side of the worker mode: run a simulation in the worker listening at
+# 'socketPath' and return its results.
+def submitJob(socketPath, config):
 
-if args.propagationModel != None:
-	medium.propagationModelFile(args.propagationModel)
-	
-# For debug purposes
-medium.logPowerMatrix()
-if args.printPER != None:
-	medium.logPER(args.printPER)
+	import socket
 
-# Start each nodes' process
-for node in nodeList:
-	node.start()
+	connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	connection.connect(socketPath)
+	stream = connection.makefile('rwb')
+	stream.write(json.dumps({'config': config}).encode() + b'\n')
+	stream.flush()
+	response = json.loads(stream.readline())
+	stream.close()
+	connection.close()
 
-env.run(until=args.length)
+	if 'error' in response:
+		raise RuntimeError(response['error'])
+
+	return response['results']
+
+### Main program
 
-outputStream.close()
\ No newline at end of file
+def main():
+
+	# Parse command line arguments in order to set simulation parameters
+	parser = buildArgumentParser()
+	parser.add_argument("-z", "--zip", help="generate zipped output", default=False, action='store_const', const=True)
+	parser.add_argument("-sm", "--summary", type=str, help="write per-node and per-group statistics of the run to this file (JSON)", default=None)
+	parser.add_argument("--serve", type=str, help="run as a worker that accepts simulation jobs on this Unix socket, instead of running a single simulation", default=None)
+	parser.add_argument("--queue", type=str, help="run as a worker that takes simulation jobs from this shared directory (see jobqueue.py), instead of running a single simulation", default=None)
+	parser.add_argument("-j", "--jobs", type=int, help="number of simulations run in parallel in worker mode", default=1)
+	parser.add_argument("--store", type=str, help="result store (see resultstore.py): skip the simulation if its results are already there, and add them otherwise", default=None)
+
+	args = parser.parse_args()
+
+	if args.serve != None:
+		serve(args.serve, args.jobs)
+		return
+
+	if args.queue != None:
+		from jobqueue import workers
+		workers(args.queue, args.jobs)
+		return
+
+	# Create the output stream for the simulation log. Check if the user requested
+	# a zipped output.
+	if args.zip == False:
+		outputStream = OutStream()
+	else:
+		outputStream = CompressedOutStream()
+
+	config = vars(args).copy()
+	for option in ['zip', 'summary', 'serve', 'queue', 'jobs', 'store']:
+		del config[option]
+
+	results = None
+	if args.store != None:
+		from resultstore import ResultStore
+		store = ResultStore(args.store)
+		results = store.get(config)
+		if results != None:
+			sys.stderr.write('Results found in ' + args.store + ', not simulating.\n')
+
+	if results == None:
+		start = time.time()
+		simulation = Simulation(config, outputStream)
+		results = simulation.run()
+		if args.scaleMode:
+			from scalemode import reportMemory
+			reportMemory(simulation)
+		if args.store != None:
+			store.put(config, results, time.time() - start)
+	outputStream.close()
+
+	if args.store != None:
+		store.close()
+
+	if args.summary != None:
+		summaryFile = open(args.summary, 'w')
+		json.dump(results, summaryFile, indent=1, sort_keys=True)
+		summaryFile.write('\n')
+		summaryFile.close()
+
+if __name__ == '__main__':
+	main()
\ No newline at end of file
@@ -0,0 +1,141 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from resultstore import ResultStore, parseValue
+from simulator import Simulation
+
+# Run a simulation for every combination of the given option values and
+# seeds, keeping the results in a result store (see resultstore.py). Points
+# already in the store are not simulated again, so an interrupted sweep can be
+# resumed by running the same command. With a job queue (see jobqueue.py), the
+# points are simulated by the workers of the queue instead, on any machine
+# that shares its directory.
+
+def parseOptions(texts):
+
+	# 'option=v1,v2,...' -> {'option': [v1, v2, ...]}
+	options = {}
+	for text in texts:
+		option, values = text.split('=', 1)
+		options[option] = [parseValue(value) for value in values.split(',')]
+
+	return options
+
+def parseSeeds(text):
+
+	# Seeds are given as a comma separated list of numbers or ranges
+	# (e.g., '1-10,20').
+	seeds = []
+	for part in text.split(','):
+		if '-' in part:
+			first, last = part.split('-')
+			seeds.extend(range(int(first), int(last) + 1))
+		else:
+			seeds.append(int(part))
+
+	return seeds
+
+def sweepPoints(base, options, seeds):
+
+	# Configurations of all points of the sweep.
+	names = sorted(options)
+	points = []
+	for values in itertools.product(*[options[name] for name in names]):
+		for seed in seeds:
+			config = dict(base)
+			config.update(zip(names, values))
+			config['seed'] = seed
+			points.append(config)
+
+	return points
+
+def runPoint(config):
+
+	start = time.time()
+	results = Simulation(config).run()
+	return results, time.time() - start
+
+def sweep(store, points, jobs=None, queue=None, poll=5.0):
+
+	# Simulate the points not yet in the store. Returns the number of points
+	# simulated.
+	pending = [config for config in points if not store.contains(config)]
+	sys.stderr.write(str(len(points) - len(pending)) + ' of ' + str(len(points)) + ' points already in the store.\n')
+
+	if queue != None:
+		return sweepQueue(store, pending, queue, poll)
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = dict((executor.submit(runPoint, config), config) for config in pending)
+		done = 0
+		for future in as_completed(futures):
+			results, duration = future.result()
+			store.put(futures[future], results, duration)
+			done = done + 1
+			sys.stderr.write('[' + str(done) + '/' + str(len(pending)) + '] ' + json.dumps(futures[future], sort_keys=True) + ': ' + str(results['total']['success']) + ' successes (' + str(round(duration, 1)) + ' s)\n')
+
+	return len(pending)
+
+def sweepQueue(store, pending, path, poll):
+
+	# Queue the points and wait for the workers, adding their results to the
+	# store as they finish.
+	from jobqueue import DONE, FAILED, JobQueue
+
+	queue = JobQueue(path)
+	keys = dict(zip(queue.submit(pending), pending))
+	done = 0
+	failed = []
+	while len(keys) > 0:
+		for key in list(keys):
+			state = queue.state(key)
+			if state == DONE:
+				job = queue.result(DONE, key)
+				store.put(keys.pop(key), job['results'], job['duration'])
+				done = done + 1
+				sys.stderr.write('[' + str(done) + '/' + str(len(pending)) + '] ' + json.dumps(job['config'], sort_keys=True) + ': ' + str(job['results']['total']['success']) + ' successes (' + job['worker'] + ', ' + str(round(job['duration'], 1)) + ' s)\n')
+			elif state == FAILED:
+				failed.append(queue.result(FAILED, key))
+				del keys[key]
+		if len(keys) > 0:
+			time.sleep(poll)
+
+	if len(failed) > 0:
+		raise RuntimeError(str(len(failed)) + ' points failed, e.g., ' + json.dumps(failed[0]['config'], sort_keys=True) + ': ' + failed[0]['error'])
+
+	return done
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-D", "--store", help="result store (SQLite database)", type=str, required=True)
+	parser.add_argument("-p", "--parameter", help="option swept and its values (e.g., numberOfGroups=1,2,4); may be repeated", type=str, action='append', default=[])
+	parser.add_argument("-o", "--option", help="option with a fixed value for all points (e.g., length=1e7); may be repeated", type=str, action='append', default=[])
+	parser.add_argument("-s", "--seeds", help="seeds of each point (e.g., 1-10,20)", type=str, default='1')
+	parser.add_argument("-j", "--jobs", help="number of worker processes (default: number of CPUs)", type=int, default=None)
+	parser.add_argument("-Q", "--queue", help="queue the points in this shared directory and wait for its workers to simulate them (see jobqueue.py), instead of simulating them here", type=str, default=None)
+
+	args = parser.parse_args()
+
+	base = {}
+	for option, values in parseOptions(args.option).items():
+		base[option] = values[0]
+
+	points = sweepPoints(base, parseOptions(args.parameter), parseSeeds(args.seeds))
+
+	store = ResultStore(args.store)
+	sweep(store, points, args.jobs, args.queue)
+
+	# Output the totals of every point of the sweep.
+	output = []
+	for config in points:
+		output.append({'config': config, 'total': store.get(config)['total']})
+	store.close()
+
+	json.dump(output, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
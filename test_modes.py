@@ -0,0 +1,238 @@
+import io
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from compare import compare
+from eventlog import INDEX_SUFFIX, EventLog
+from events import EVENT_ACK_TIMEOUT
+from groupparallel import groupParallel
+from importance import ImportanceSampler
+from jobqueue import DONE, FAILED, PENDING, RUNNING, JobQueue, workers
+from loganalyzer import analyzeLogs
+from resultstore import ResultStore, resultKey
+from simulator import AntitheticRandom, Simulation
+from sweep import sweep, sweepPoints
+from timeparallel import timeParallel
+
+# Runs simulator.py from the command line, with its standard output written
+# to 'output'.
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator.py')
+
+def runSimulator(options, output):
+
+	with open(output, 'wb') as f:
+		subprocess.run([sys.executable, SIMULATOR] + [str(option) for option in options], stdout=f, check=True)
+
+def test_binaryLogRoundTrip(tmp_path):
+
+	# The binary log, converted back to text, must be the text log, also when
+	# its index has to be rebuilt, and selecting a node must give its events.
+	options = ['-n', 20, '-g', 2, '-l', 2e5, '-s', 3, '-v', 2]
+	runSimulator(options, str(tmp_path / 'log.txt'))
+	runSimulator(options + ['-B', str(tmp_path / 'log.bin')], str(tmp_path / 'output.txt'))
+	expected = open(str(tmp_path / 'log.txt')).read()
+
+	for rebuild in (False, True):
+		if rebuild:
+			os.remove(str(tmp_path / 'log.bin') + INDEX_SUFFIX)
+		log = EventLog(str(tmp_path / 'log.bin'))
+		text = io.StringIO()
+		log.toText(text)
+		assert text.getvalue() == expected
+
+	lines = [line for line in expected.splitlines() if line.split()[2] == '_5_']
+	assert len(log.select(nodes=5)['time']) == len(lines) > 0
+
+def test_analyzerMatchesSummary(tmp_path):
+
+	# The statistics the analyzer computes from a text log, plain or
+	# compressed, and split in small pieces, must be those of the run (-sm).
+	options = ['-n', 40, '-g', 4, '-l', 5e5, '-s', 3, '-sm', str(tmp_path / 'summary.json')]
+	runSimulator(options, str(tmp_path / 'log.txt'))
+	runSimulator(options + ['-z'], str(tmp_path / 'log.gz'))
+	expected = json.load(open(str(tmp_path / 'summary.json')))
+
+	for statistics in analyzeLogs([str(tmp_path / 'log.txt'), str(tmp_path / 'log.gz')], jobs=2, chunkSize=4096):
+		statistics.groups = [None] + [i % 4 for i in range(40)]
+		summary = statistics.summary()
+		for part in ('nodes', 'groups', 'total'):
+			assert summary[part] == expected[part]
+
+def test_resultStoreResume(tmp_path):
+
+	# A sweep only simulates the points that are not in the store yet, and
+	# options that do not change the results (logging, or options given at
+	# their default values) do not change the key of a run.
+	store = ResultStore(str(tmp_path / 'results.db'))
+	points = sweepPoints({'numberOfSTAs': 20, 'length': 2e5}, {'numberOfGroups': [1, 2]}, [1, 2])
+	assert sweep(store, points[:3], jobs=1) == 3
+	assert sweep(store, points, jobs=1) == 1
+	assert sweep(store, points, jobs=1) == 0
+
+	assert store.get(points[0]) == Simulation(points[0]).run()
+	assert resultKey(dict(points[0], verbosity=2, slotSize=50e3)) == resultKey(points[0])
+	assert len(store.query({'numberOfGroups': 2})) == 2
+	store.close()
+
+def test_commonRandomNumbers(tmp_path):
+
+	# With -crn, the positions and the random streams of each station do not
+	# depend on the other options, and compare.py pairs the runs by seed.
+	config = {'numberOfSTAs': 30, 'length': 2e5, 'seed': 3, 'commonRandomNumbers': True}
+	runs = []
+	for groups in (1, 4):
+		sim = Simulation(dict(config, numberOfGroups=groups))
+		sim.setup()
+		runs.append(sim)
+	assert [(node.getPosX(), node.getPosY()) for node in runs[0].nodeList] == [(node.getPosX(), node.getPosY()) for node in runs[1].nodeList]
+	assert runs[0].nodeRandom(5, 'backoff').random() == runs[1].nodeRandom(5, 'backoff').random()
+	assert AntitheticRandom('3/5/backoff').random() == 1 - random.Random('3/5/backoff').random()
+
+	store = ResultStore(str(tmp_path / 'results.db'))
+	output = compare(store, config, [{'numberOfGroups': 1}, {'numberOfGroups': 4}], [1, 2, 3], ['success'], jobs=1)
+	differences = [Simulation(dict(config, numberOfGroups=4, seed=seed)).run()['total']['success']
+		- Simulation(dict(config, numberOfGroups=1, seed=seed)).run()['total']['success'] for seed in (1, 2, 3)]
+	assert abs(output['differences'][0]['success']['mean'] - statistics.mean(differences)) < 1e-9
+	store.close()
+
+def test_importanceSamplingWeights():
+
+	# Weighted by the likelihood ratio, biased draws give unbiased estimates:
+	# the mean weight is 1, the weighted failures estimate the failure
+	# probability of the model and the weighted backoff counters are uniform.
+	sampler = ImportanceSampler(failureProbability=0.1, backoffFraction=0.25)
+	rng = random.Random(1)
+	draws = 20000
+	weights = 0.0
+	failures = 0.0
+	backoffs = [0.0] * 16
+	for i in range(draws):
+		sampler.newPacket(1)
+		failed = sampler.receptionFails(1, rng.random(), 0.999)
+		weights = weights + sampler.weight(1)
+		if failed:
+			failures = failures + sampler.weight(1)
+
+		sampler.newPacket(1)
+		backoff = sampler.drawBackoff(1, rng, 15)
+		backoffs[backoff] = backoffs[backoff] + sampler.weight(1)
+
+	assert abs(weights / draws - 1) < 0.02
+	assert abs(failures / draws - 0.001) < 0.0001
+	assert all(abs(weight / draws - 1 / 16.0) < 0.01 for weight in backoffs)
+
+	results = Simulation({'numberOfSTAs': 20, 'length': 2e5, 'seed': 3, 'importanceSampling': 0.1}).run()
+	assert results['importanceSampling']['biasedDraws'] > 0
+	assert results['importanceSampling']['weightedTotal']['success'] > 0
+
+# Options that only change how the simulation is carried out must not change
+# its results. With common random numbers, each node draws from its own
+# streams, so the per-node counters of both runs must match exactly.
+
+SCENARIO = {'numberOfSTAs': 200, 'numberOfGroups': 4, 'length': 2e6, 'commonRandomNumbers': True}
+
+def assertSameResults(options, seeds=(3, 5)):
+
+	for seed in seeds:
+		config = dict(SCENARIO, seed=seed)
+		expected = Simulation(config).run()
+		results = Simulation(dict(config, **options)).run()
+		assert results['nodes'] == expected['nodes'], 'seed ' + str(seed) + ': ' + str(results['total']) + ' != ' + str(expected['total'])
+
+def test_lazyCarrierSense():
+
+	assertSameResults({'lazyCarrierSense': True})
+
+def test_coalescedUpdates():
+
+	assertSameResults({'coalesceUpdates': True})
+
+def test_phyLevels():
+
+	# The exact level only checks the segment level, and comparing the levels
+	# does not change the outcome of the selected one.
+	assertSameResults({'phy': 'exact'}, seeds=(3,))
+	assertSameResults({'phyCompare': True}, seeds=(3,))
+
+	comparison = Simulation(dict(SCENARIO, seed=3, phy='capture', phyCompare=True)).run()['phyComparison']
+	assert comparison['receptions'] > 0
+	assert 0 <= comparison['meanAbsDifference'] <= comparison['maxAbsDifference'] <= 1
+	assert comparison['disagreements'] <= comparison['receptions']
+
+def test_timeParallel():
+
+	# With a single window, the time-parallel run is the sequential one. With
+	# several, windows are simulated again until each one starts from the
+	# state the previous one ends with.
+	options = dict(SCENARIO, seed=3)
+	assert timeParallel(options, 1, jobs=1)['nodes'] == Simulation(options).run()['nodes']
+
+	summary = timeParallel(options, 2, tolerance=0.0, jobs=1)['timeParallel']
+	assert summary['maxDrift'] == 0.0
+	assert summary['bounds'][1] % (SCENARIO['numberOfGroups'] * 50e3) == 0
+
+def test_groupParallel():
+
+	# The runs of the groups add up to the complete run with isolated slots,
+	# and nothing spills over the slot of another group.
+	options = dict(SCENARIO, seed=3)
+	summary = groupParallel(options, jobs=1)
+	assert summary['nodes'] == Simulation(dict(options, isolatedSlots=True)).run()['nodes']
+	assert summary['groupParallel']['exact']
+
+def test_jobQueue(tmp_path):
+
+	# Two workers run all the jobs of the queue between them, including one
+	# claimed by a worker whose heartbeat stopped long ago.
+	queue = JobQueue(str(tmp_path))
+	queue.submit([{'numberOfSTAs': 20, 'length': 2e5, 'seed': seed} for seed in range(4)])
+	job, running = queue.claim('dead')
+	os.utime(running, (time.time() - 600, time.time() - 600))
+
+	assert workers(str(tmp_path), 2, heartbeat=0.1, staleAfter=60, poll=0.1, exitWhenIdle=True) == 4
+	assert queue.status() == {PENDING: 0, RUNNING: 0, DONE: 4, FAILED: 0}
+	assert queue.result(DONE, job['key'])['results'] == Simulation(job['config']).run()
+
+# Simulation that sends itself SIGUSR1 once it has simulated 'at' us.
+class SignalledSimulation(Simulation):
+
+	def __init__(self, config, at):
+
+		Simulation.__init__(self, config)
+		self.at = at
+
+	def setup(self):
+
+		Simulation.setup(self)
+		self.env.process(self.signal())
+
+	def signal(self):
+
+		yield self.env.timeout(self.at)
+		os.kill(os.getpid(), signal.SIGUSR1)
+
+def test_flightRecorderTriggers(tmp_path):
+
+	# Each dump holds the last events of every node, and those of the station
+	# that triggered it end with the event that did. No more dumps are
+	# written than requested.
+	prefix = str(tmp_path / 'dump')
+	Simulation(dict(SCENARIO, seed=3, flightRecorder=prefix, flightAckTimeouts=2, flightRecords=8, flightDumps=2)).run()
+	for i in (1, 2):
+		dump = json.load(open(prefix + '.' + str(i) + '.json'))
+		assert dump['trigger'] == 'ackTimeouts'
+		events = EventLog(dump['log']).select(nodes=dump['node'])
+		assert events['code'][-1] == EVENT_ACK_TIMEOUT
+		assert len(events['code']) <= 8
+	assert not os.path.exists(prefix + '.3.json')
+
+	if hasattr(signal, 'SIGUSR1'):
+		SignalledSimulation(dict(SCENARIO, seed=3, length=2e5, flightRecorder=prefix + 'Signal', flightAckTimeouts=1000), 1e5).run()
+		assert json.load(open(prefix + 'Signal.1.json'))['trigger'] == 'signal'
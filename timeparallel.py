@@ -0,0 +1,207 @@
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from runstats import COUNTER_ABORTS, COUNTERS, RunStatistics
+from simulator import Simulation, makeConfig
+from sweep import parseOptions
+
+# Time-parallel simulation of a single long run.
+#
+# The simulated time is split into K windows, which are simulated at once by
+# different processes. Windows start and end at the beginning of a RAW cycle,
+# so the only state that matters at their boundaries is which stations have a
+# packet waiting for the slot of their group (the backlog), and which ones
+# gave up their last packet and wait for the slot of their group before they
+# can get another one (see Simulation.endState): all transmissions and
+# receptions are over once a slot ends, and packets arrive following a
+# Poisson process, which has no memory.
+#
+# The first window starts empty, as the sequential run. The initial state of
+# any other window is guessed by a short warm-up run from an empty system.
+# Once all windows are over, the state each window ends with is compared with
+# the one the next window assumed; if they differ by more than a given
+# fraction of the stations of some group, the next window is simulated again
+# starting from the right state (which may in turn change the state it ends
+# with). This is repeated until every window agrees with the previous one,
+# which takes at most K - 1 iterations, since after iteration i the first
+# i + 1 windows are exact.
+#
+# Each window draws its own random numbers (option --window), and the
+# counters of all windows are added up. Packets carried over from a window to
+# the next are not counted again as generated or deferred, and the stations
+# still contending at the end of a window are counted as aborted. The only
+# approximation is for the stations waiting for an ack at the end of the slot
+# of the last group, whose packet is carried over as if they were still
+# contending for it instead of being taken as sent or aborted.
+#
+# The state at the boundaries fluctuates from a cycle to the next, so with a
+# short warm-up or a tight tolerance most windows are simulated again, one
+# after the other, and the run is no faster than the sequential one. The
+# defaults (a warm-up of 4 cycles and a tolerance of a quarter of a group)
+# keep the counters within the noise of sequential runs with about one
+# window simulated again per run. The summary tells how much was simulated
+# in all (work) and along the longest chain of runs that had to wait for
+# each other (span), as multiples of the length of the simulation.
+
+def windowState(sim):
+
+	# State a simulation ends with, as the initial backlog and blocked
+	# stations of the next window, and the stations that abort at the
+	# boundary.
+	backlog, blocked, aborting = sim.endState()
+	return (backlog, blocked + aborting), aborting
+
+def runWindow(config):
+
+	# Simulate a window and return its results and the state it ends with.
+	sim = Simulation(config)
+	results = sim.run()
+	final, aborting = windowState(sim)
+	return results, final, aborting, sim.groups
+
+def warmUpAndRunWindow(config, warmUp):
+
+	# Guess the initial state of a window with a run from an empty system,
+	# with random numbers of its own, and simulate the window from it.
+	warm = Simulation(dict(config, length=warmUp, window=-config['window']))
+	warm.run()
+	initial, aborting = windowState(warm)
+
+	return (initial,) + runWindow(windowConfig(config, initial))
+
+def windowConfig(config, initial):
+
+	return dict(config, initialBacklog=initial[0], initialBlocked=initial[1])
+
+def stateDrift(assumed, actual, groups):
+
+	# Largest difference between the number of stations of a group that are
+	# backlogged or blocked in two states, as a fraction of the stations of
+	# the group.
+	sizes = {}
+	for group in groups[1:]:
+		sizes[group] = sizes.get(group, 0) + 1
+
+	drift = 0.0
+	for first, second in zip(assumed, actual):
+		difference = dict((group, 0) for group in sizes)
+		for node in first:
+			difference[groups[node]] = difference[groups[node]] + 1
+		for node in second:
+			difference[groups[node]] = difference[groups[node]] - 1
+		drift = max([drift] + [abs(difference[group]) / float(sizes[group]) for group in sizes])
+
+	return drift
+
+def windowBounds(config, windows):
+
+	# Windows span whole RAW cycles, except perhaps the last one, which ends
+	# with the simulation.
+	cycle = config.numberOfGroups * config.slotSize
+	cycles = int(config.length // cycle)
+	bounds = [0.0]
+	for k in range(1, windows):
+		bounds.append(round(k * cycles / float(windows)) * cycle)
+	bounds.append(config.length)
+
+	if any(bounds[k + 1] <= bounds[k] for k in range(windows)):
+		raise ValueError('the simulation is too short for ' + str(windows) + ' windows of whole RAW cycles')
+
+	return bounds
+
+def timeParallel(options, windows, warmUpCycles=4, tolerance=0.25, jobs=None):
+
+	config = makeConfig(options)
+	if config.binaryLog != None or config.trace != None:
+		raise ValueError('time-parallel runs do not support event logs or traces')
+
+	bounds = windowBounds(config, windows)
+	warmUp = warmUpCycles * config.numberOfGroups * config.slotSize
+
+	points = []
+	for k in range(windows):
+		point = dict(vars(config))
+		point.update({'length': bounds[k + 1] - bounds[k], 'window': k, 'initialBacklog': None, 'initialBlocked': None})
+		points.append(point)
+
+	# Initial state assumed by each window, and results, final state and
+	# stations aborting at the end of each one.
+	initial = [([], []) for k in range(windows)]
+	results = [None] * windows
+	final = [None] * windows
+	aborting = [None] * windows
+	reruns = 0
+
+	# Simulated time of all runs, and along the longest chain of runs.
+	lengths = [bounds[k + 1] - bounds[k] for k in range(windows)]
+	work = sum(lengths) + (windows - 1) * warmUp
+	span = max([lengths[0]] + [warmUp + lengths[k] for k in range(1, windows)])
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+
+		futures = [executor.submit(runWindow, points[0])]
+		for k in range(1, windows):
+			futures.append(executor.submit(warmUpAndRunWindow, points[k], warmUp))
+
+		results[0], final[0], aborting[0], groups = futures[0].result()
+		for k in range(1, windows):
+			initial[k], results[k], final[k], aborting[k], groups = futures[k].result()
+
+		iterations = 0
+		while True:
+			drifts = [stateDrift(initial[k], final[k - 1], groups) for k in range(1, windows)]
+			pending = [k for k in range(1, windows) if drifts[k - 1] > tolerance]
+			if len(pending) == 0:
+				break
+
+			iterations = iterations + 1
+			futures = {}
+			for k in pending:
+				initial[k] = final[k - 1]
+				futures[k] = executor.submit(runWindow, windowConfig(points[k], initial[k]))
+			for k in pending:
+				results[k], final[k], aborting[k], groups = futures[k].result()
+			reruns = reruns + len(pending)
+			work = work + sum(lengths[k] for k in pending)
+			span = span + max(lengths[k] for k in pending)
+
+	# Add up the counters of all windows, with the aborts at their
+	# boundaries.
+	statistics = RunStatistics(groups)
+	for k in range(windows):
+		for node, counters in results[k]['nodes'].items():
+			for i in range(len(COUNTERS)):
+				statistics.count(int(node), i, counters[COUNTERS[i]])
+		if k < windows - 1:
+			for node in aborting[k]:
+				statistics.count(node, COUNTER_ABORTS)
+
+	summary = statistics.summary()
+	summary['timeParallel'] = {'windows': windows, 'bounds': bounds, 'iterations': iterations, 'reruns': reruns,
+		'tolerance': tolerance, 'maxDrift': max(drifts or [0.0]), 'work': work / config.length, 'span': span / config.length,
+		'initialBacklog': [len(state[0]) for state in initial], 'initialBlocked': [len(state[1]) for state in initial]}
+
+	return summary
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-o", "--option", help="option of the simulation (e.g., numberOfSTAs=200); may be repeated", type=str, action='append', default=[])
+	parser.add_argument("-K", "--windows", help="number of time windows", type=int, default=4)
+	parser.add_argument("-w", "--warmUp", help="length of the warm-up run that guesses the initial state of each window, in RAW cycles", type=float, default=4)
+	parser.add_argument("-t", "--tolerance", help="largest difference between the state a window ends with and the one the next window assumed, as a fraction of the stations of a group, that does not require simulating the next window again", type=float, default=0.25)
+	parser.add_argument("-j", "--jobs", help="number of worker processes (default: number of CPUs)", type=int, default=None)
+
+	args = parser.parse_args()
+
+	options = {}
+	for option, values in parseOptions(args.option).items():
+		options[option] = values[0]
+
+	summary = timeParallel(options, args.windows, args.warmUp, args.tolerance, args.jobs)
+
+	json.dump(summary, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')
@@ -0,0 +1,229 @@
+import argparse
+import math
+import sys
+
+import numpy as np
+
+# Generation of the positions of the stations.
+#
+# All positions are drawn at once with NumPy, as real-valued coordinates in
+# [0, width] x [0, height]. The AP is always at the center of the scenario.
+# Layouts:
+#  - 'uniform': independently and uniformly distributed over the area.
+#  - 'cluster': Poisson cluster process (Thomas process): cluster centers are
+#    uniformly distributed, and stations are normally distributed around a
+#    randomly chosen center.
+#  - 'grid': regular grid covering the area.
+#  - 'ring': evenly spaced on a circle around the AP.
+#
+# For the random layouts, a minimum distance between stations can be
+# enforced. Candidates are drawn in batches and checked against the stations
+# already placed using a grid hash, with cells small enough to hold at most
+# one station, so each check only looks at a few neighboring cells.
+
+LAYOUTS = ['uniform', 'cluster', 'grid', 'ring']
+
+# Give up placing stations with a minimum distance after this many batches
+# without progress (the area is probably too crowded).
+MAX_FAILED_BATCHES = 20
+
+def uniformCandidates(count, width, height, rng):
+
+	return np.column_stack((rng.uniform(0, width, count), rng.uniform(0, height, count)))
+
+def clusterCandidates(count, width, height, rng, centers, spread):
+
+	# Stations that would fall out of the area are reflected back into it.
+	chosen = centers[rng.integers(0, len(centers), count)]
+	positions = chosen + rng.normal(0, spread, (count, 2))
+	for axis, size in ((0, width), (1, height)):
+		positions[:, axis] = np.abs(positions[:, axis])
+		positions[:, axis] = size - np.abs(size - positions[:, axis])
+
+	return np.clip(positions, 0, [width, height])
+
+def gridPositions(count, width, height):
+
+	# Use the number of columns and rows that best matches the aspect ratio
+	# of the area, and place stations at the center of each cell.
+	columns = max(1, int(math.ceil(math.sqrt(count * width / float(max(height, 1e-9))))))
+	rows = int(math.ceil(count / float(columns)))
+	i = np.arange(count)
+	return np.column_stack(((i % columns + 0.5) * width / columns, (i // columns + 0.5) * height / rows))
+
+def ringPositions(count, width, height, rng, radius=None):
+
+	if radius == None:
+		radius = min(width, height) / 2.0
+	angles = rng.uniform(0, 2 * math.pi) + 2 * math.pi * np.arange(count) / count
+	return np.column_stack((width / 2.0 + radius * np.cos(angles), height / 2.0 + radius * np.sin(angles)))
+
+def minimumSpacing(positions):
+
+	# Smallest distance between two of the positions (for the deterministic
+	# layouts, which are checked instead of enforced).
+	if len(positions) < 2:
+		return float('inf')
+	cellSize = max(np.ptp(positions[:, 0]), np.ptp(positions[:, 1]), 1e-9) / math.sqrt(len(positions))
+	return _nearestNeighborDistances(positions, cellSize).min()
+
+def _nearestNeighborDistances(positions, cellSize):
+
+	# Distance from each position to its nearest neighbor, looking only at
+	# the neighboring cells (positions farther than one cell report inf).
+	cells = np.floor(positions / cellSize).astype(np.int64)
+	order = np.lexsort((cells[:, 1], cells[:, 0]))
+	keys = cells[order, 0] * (1 << 32) + cells[order, 1]
+
+	nearest = np.full(len(positions), np.inf)
+	for dx in (-1, 0, 1):
+		for dy in (-1, 0, 1):
+			neighbor = (cells[:, 0] + dx) * (1 << 32) + (cells[:, 1] + dy)
+			start = np.searchsorted(keys, neighbor, side='left')
+			end = np.searchsorted(keys, neighbor, side='right')
+			for k in range(int((end - start).max()) if len(start) > 0 else 0):
+				has = start + k < end
+				j = order[np.minimum(start + k, len(order) - 1)]
+				distance = np.sqrt(((positions - positions[j])**2).sum(axis=1))
+				distance[~has | (j == np.arange(len(positions)))] = np.inf
+				nearest = np.minimum(nearest, distance)
+
+	return nearest
+
+def placeWithMinimumDistance(count, width, height, minDistance, draw):
+
+	# Accept candidates from 'draw(k)' (a function returning k candidate
+	# positions) that are at least 'minDistance' away from all accepted
+	# ones. With cells of side minDistance / sqrt(2), a cell holds at most one
+	# station, and conflicting stations are at most two cells apart.
+	cellSize = minDistance / math.sqrt(2)
+	columns = int(math.floor(width / cellSize)) + 1
+	rows = int(math.floor(height / cellSize)) + 1
+	grid = np.full((columns + 4, rows + 4), -1, dtype=np.int64)
+
+	accepted = np.zeros((count, 2))
+	placed = 0
+	failed = 0
+	while placed < count:
+
+		candidates = draw(max(2 * (count - placed), 1024))
+		cells = np.floor(candidates / cellSize).astype(np.int64) + 2
+
+		# Keep a single candidate per cell, and only in free cells.
+		free = grid[cells[:, 0], cells[:, 1]] < 0
+		candidates = candidates[free]
+		cells = cells[free]
+		cellIds = cells[:, 0] * grid.shape[1] + cells[:, 1]
+		unique, first = np.unique(cellIds, return_index=True)
+		first = np.sort(first)
+		candidates = candidates[first]
+		cells = cells[first]
+
+		# Reject candidates too close to an accepted station, or to an
+		# earlier candidate of the same batch.
+		batch = np.full(grid.shape, -1, dtype=np.int64)
+		batch[cells[:, 0], cells[:, 1]] = np.arange(len(candidates))
+		ok = np.ones(len(candidates), dtype=bool)
+		for dx in range(-2, 3):
+			for dy in range(-2, 3):
+				if dx == 0 and dy == 0:
+					continue
+				x = cells[:, 0] + dx
+				y = cells[:, 1] + dy
+
+				other = grid[x, y]
+				near = other >= 0
+				distance = np.sqrt(((candidates[near] - accepted[other[near]])**2).sum(axis=1))
+				ok[np.nonzero(near)[0][distance < minDistance]] = False
+
+				other = batch[x, y]
+				near = (other >= 0) & (other < np.arange(len(candidates)))
+				distance = np.sqrt(((candidates[near] - candidates[other[near]])**2).sum(axis=1))
+				ok[np.nonzero(near)[0][distance < minDistance]] = False
+
+		candidates = candidates[ok][:count - placed]
+		cells = cells[ok][:count - placed]
+		if len(candidates) == 0:
+			failed = failed + 1
+			if failed >= MAX_FAILED_BATCHES:
+				raise ValueError('could only place ' + str(placed) + ' of ' + str(count) + ' stations at least ' + str(minDistance) + ' m apart')
+			continue
+
+		accepted[placed:placed + len(candidates)] = candidates
+		grid[cells[:, 0], cells[:, 1]] = np.arange(placed, placed + len(candidates))
+		placed = placed + len(candidates)
+
+	return accepted
+
+def placeUnique(count, draw):
+
+	# Real-valued coordinates hardly ever repeat, but make sure.
+	positions = draw(count)
+	while True:
+		unique, first = np.unique(positions, axis=0, return_index=True)
+		if len(unique) == count:
+			return positions
+		positions = np.concatenate([positions[np.sort(first)], draw(count - len(unique))])
+
+def generatePositions(layout, count, width, height, rng, minDistance=0, clusters=None, spread=None):
+
+	# Return a (count, 2) array with the positions of the stations.
+	if layout == 'uniform':
+		draw = lambda k: uniformCandidates(k, width, height, rng)
+	elif layout == 'cluster':
+		if clusters == None:
+			clusters = max(1, count // 50)
+		if spread == None:
+			spread = min(width, height) / (4.0 * math.sqrt(clusters))
+		centers = uniformCandidates(clusters, width, height, rng)
+		draw = lambda k: clusterCandidates(k, width, height, rng, centers, spread)
+	elif layout == 'grid' or layout == 'ring':
+		if layout == 'grid':
+			positions = gridPositions(count, width, height)
+		else:
+			positions = ringPositions(count, width, height, rng)
+		if minDistance > 0 and minimumSpacing(positions) < minDistance:
+			raise ValueError('stations of the ' + layout + ' layout are less than ' + str(minDistance) + ' m apart')
+		return positions
+	else:
+		raise ValueError('unknown layout: ' + str(layout))
+
+	if minDistance > 0:
+		return placeWithMinimumDistance(count, width, height, minDistance, draw)
+
+	return placeUnique(count, draw)
+
+def receivedPowerMatrix(positions, transmissionPower, antennaGain, antennaHeight):
+
+	# Received power, in dBm, between every pair of the given positions, with
+	# the two-ray ground path loss model used by simulator.py.
+	positions = np.asarray(positions, dtype=np.float64)
+	dist = np.sqrt(((positions[:, None, :] - positions[None, :, :])**2).sum(axis=2))
+
+	loss = np.zeros(dist.shape)
+	far = dist > 0
+	loss[far] = -10.0 * math.log10(2.0 * antennaGain * math.pow(antennaHeight, 4.0)) + 40.0 * np.log10(dist[far])
+
+	return transmissionPower - loss
+
+if __name__ == '__main__':
+
+	# Write a layout in the format of the positions file of simulator.py (-pP).
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-t", "--topology", help="layout of the stations", choices=LAYOUTS, default='uniform')
+	parser.add_argument("-n", "--numberOfSTAs", help="number of STAs", type=int, default=1)
+	parser.add_argument("-W", "--scenarioWidth", help="width of the area used for positioning nodes in m", type=float, default=1000)
+	parser.add_argument("-H", "--scenarioHeight", help="height of the area used for positioning nodes in m", type=float, default=1000)
+	parser.add_argument("-s", "--seed", help="seed for the pseudo-random number generator", type=int, default=None)
+	parser.add_argument("-d", "--minDistance", help="minimum distance between stations in m", type=float, default=0)
+	parser.add_argument("-c", "--clusters", help="number of clusters of the cluster layout (default: one per 50 stations)", type=int, default=None)
+	parser.add_argument("-cs", "--clusterSpread", help="standard deviation of the distance of stations to their cluster center in m", type=float, default=None)
+
+	args = parser.parse_args()
+
+	positions = generatePositions(args.topology, args.numberOfSTAs, args.scenarioWidth, args.scenarioHeight,
+		np.random.default_rng(args.seed), args.minDistance, args.clusters, args.clusterSpread)
+
+	sys.stdout.write('ap ' + str(args.scenarioWidth / 2.0) + ' ' + str(args.scenarioHeight / 2.0) + '\n')
+	sys.stdout.write(''.join(str(i + 1) + ' ' + str(x) + ' ' + str(y) + '\n' for i, (x, y) in enumerate(positions.tolist())))
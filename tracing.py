@@ -0,0 +1,280 @@
+import argparse
+import json
+import math
+from gzip import GzipFile
+
+from events import *
+
+# Export of the simulated timeline in the Chrome trace event format (JSON),
+# which can be opened with Perfetto (ui.perfetto.dev) or chrome://tracing.
+#
+# The trace has one track per station, with spans for the time it spends
+# waiting for the medium to become idle (CCA), counting down DIFS and the
+# backoff, transmitting, and receiving the ack, plus instant events for
+# deferrals, aborts, losses and timeouts. The AP has a track with its ack
+# transmissions and two counters: the energy it receives and the number of
+# concurrent transmitters. Finally, each group has a track with its RAW
+# slots.
+#
+# Trace times are in us, as in the simulation. The trace is written as a JSON
+# array, which the viewers also accept if it is truncated (e.g., when the
+# simulation is interrupted). Names ending with '.gz' produce a compressed
+# trace.
+
+# Number of trace events kept in memory before they are written out.
+BUFFER_EVENTS = 16384
+
+PID_AP = 0
+PID_STATIONS = 1
+PID_SLOTS = 2
+
+# Spans opened and closed by each event code: name of the span, and whether
+# the event opens (True) or closes (False) it.
+_SPANS = {
+	EVENT_MEDIUM_BUSY: ('CCA', True),
+	EVENT_MEDIUM_IDLE: ('CCA', False),
+	EVENT_DIFS_START: ('DIFS', True),
+	EVENT_DIFS_INTERRUPT: ('DIFS', False),
+	EVENT_DIFS_OVER: ('DIFS', False),
+	EVENT_BACKOFF_START: ('Backoff', True),
+	EVENT_BACKOFF_INTERRUPT: ('Backoff', False),
+	EVENT_TX_START: ('TX', True),
+	EVENT_TX_END: ('TX', False),
+	EVENT_ACK_RX_START: ('Ack RX', True),
+	EVENT_ACK_RX_END: ('Ack RX', False),
+	EVENT_ACK_TX_START: ('Ack TX', True),
+	EVENT_ACK_TX_END: ('Ack TX', False),
+}
+
+# Events shown as instants on the track of the node that logged them.
+_INSTANTS = {
+	EVENT_DEFER: 'Defer',
+	EVENT_ABORT: 'Abort',
+	EVENT_SUCCESS: 'Success',
+	EVENT_ACK_TIMEOUT: 'Ack timeout',
+	EVENT_DROP: 'Drop',
+	EVENT_ACK_RX_FAIL: 'Ack lost (SINR)',
+}
+
+# Event sink that writes the trace. Only the events of 'nodes' (all of them,
+# if None) between 'start' and 'end' are exported; spans crossing the limits
+# of the window are clipped. The counters of the AP always account for all
+# nodes. 'groups' (indexed by node id) is only used to name the tracks.
+class TraceWriter(object):
+
+	def __init__(self, path, numberOfGroups, slotSize, groups=None, nodes=None, start=None, end=None):
+
+		# The energy received by the AP is logged at level 2.
+		self.level = 2
+
+		self.path = path
+		if path.endswith('.gz'):
+			self.output = GzipFile(path, 'wb')
+		else:
+			self.output = open(path, 'wb')
+		self.output.write(b'[\n')
+		self.buffer = []
+		self.first = True
+
+		self.numberOfGroups = numberOfGroups
+		self.slotSize = slotSize
+		self.groups = groups
+		self.start = start if start != None else 0
+		self.end = end if end != None else math.inf
+		if nodes is not None:
+			nodes = set(nodes)
+		self.nodes = nodes
+
+		# Spans currently open, keyed by (node, name, peer): their start
+		# time and arguments.
+		self.open = {}
+		self.named = set()
+		self.transmitters = 0
+		self.energy = None
+		self.inWindow = False
+		self.lastTime = self.start
+
+		# Index of the next RAW slot to export.
+		self.nextSlot = int(self.start // slotSize)
+
+		self.emit({'name': 'process_name', 'ph': 'M', 'pid': PID_AP, 'args': {'name': 'AP'}})
+		self.emit({'name': 'process_name', 'ph': 'M', 'pid': PID_STATIONS, 'args': {'name': 'Stations'}})
+		self.emit({'name': 'process_name', 'ph': 'M', 'pid': PID_SLOTS, 'args': {'name': 'RAW slots'}})
+		for group in range(numberOfGroups):
+			self.emit({'name': 'thread_name', 'ph': 'M', 'pid': PID_SLOTS, 'tid': group, 'args': {'name': 'Group ' + str(group)}})
+
+	def emit(self, event):
+
+		self.buffer.append(json.dumps(event, separators=(',', ':')))
+		if len(self.buffer) >= BUFFER_EVENTS:
+			self.flush()
+
+	def flush(self):
+
+		if len(self.buffer) == 0:
+			return
+
+		data = ',\n'.join(self.buffer)
+		if not self.first:
+			data = ',\n' + data
+		self.first = False
+		self.buffer = []
+		self.output.write(data.encode())
+
+	def track(self, node):
+
+		# Process and thread of the track of a node, named on first use.
+		if node == 0:
+			pid = PID_AP
+		else:
+			pid = PID_STATIONS
+
+		if node not in self.named:
+			self.named.add(node)
+			if node == 0:
+				name = 'AP'
+			elif self.groups != None:
+				name = 'STA ' + str(node) + ' (group ' + str(self.groups[node]) + ')'
+			else:
+				name = 'STA ' + str(node)
+			self.emit({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': node, 'args': {'name': name}})
+			self.emit({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid, 'tid': node, 'args': {'sort_index': node}})
+
+		return pid
+
+	def span(self, node, name, begin, end, args):
+
+		# Export a span clipped to the time window.
+		begin = max(begin, self.start)
+		end = min(end, self.end)
+		if end < begin or begin >= self.end:
+			return
+
+		self.emit({'name': name, 'ph': 'X', 'pid': self.track(node), 'tid': node, 'ts': begin, 'dur': end - begin, 'args': args})
+
+	def slotsUntil(self, time):
+
+		# Export the RAW slots that have started by 'time'.
+		while self.nextSlot * self.slotSize <= time and self.nextSlot * self.slotSize < self.end:
+			begin = self.nextSlot * self.slotSize
+			group = self.nextSlot % self.numberOfGroups
+			self.emit({'name': 'Slot', 'ph': 'X', 'pid': PID_SLOTS, 'tid': group, 'ts': max(begin, self.start),
+				'dur': min(begin + self.slotSize, self.end) - max(begin, self.start), 'args': {'group': group}})
+			self.nextSlot = self.nextSlot + 1
+
+	def counter(self, time, name, value):
+
+		if not self.start <= time < self.end:
+			return
+
+		# Counters start the window with the values they had before it.
+		if not self.inWindow:
+			self.inWindow = True
+			self.emit({'name': 'Concurrent transmitters', 'ph': 'C', 'pid': PID_AP, 'ts': self.start, 'args': {'value': self.transmitters}})
+			if self.energy != None:
+				self.emit({'name': 'AP received energy (dBm)', 'ph': 'C', 'pid': PID_AP, 'ts': self.start, 'args': {'value': self.energy}})
+
+		self.emit({'name': name, 'ph': 'C', 'pid': PID_AP, 'ts': time, 'args': {'value': value}})
+
+	def write(self, code, time, node, peer, packet, count, value, aux):
+
+		if time > self.lastTime:
+			self.lastTime = time
+		self.slotsUntil(time)
+
+		# Counters of the AP.
+		if code == EVENT_TX_START or code == EVENT_ACK_TX_START:
+			self.transmitters = self.transmitters + 1
+			self.counter(time, 'Concurrent transmitters', self.transmitters)
+		elif code == EVENT_TX_END or code == EVENT_ACK_TX_END:
+			self.transmitters = self.transmitters - 1
+			self.counter(time, 'Concurrent transmitters', self.transmitters)
+		elif code == EVENT_ENERGY_INCREASE or code == EVENT_ENERGY_DECREASE:
+			if node == 0:
+				self.counter(time, 'AP received energy (dBm)', value)
+				self.energy = value
+			return
+
+		# Data frame losses are logged by the AP; they are shown on the track
+		# of the sender.
+		if code == EVENT_RX_FAIL:
+			code = None
+			node = peer
+
+		if self.nodes is not None and node not in self.nodes:
+			return
+
+		if code == None:
+			if self.start <= time < self.end:
+				self.emit({'name': 'Data lost (SINR)', 'ph': 'i', 's': 't', 'pid': self.track(node), 'tid': node, 'ts': time,
+					'args': {'packet': packet, 'transmitters': count}})
+			return
+
+		span = _SPANS.get(code)
+		if span != None:
+			name, opens = span
+			key = (node, name, peer)
+			if opens:
+				args = {'packet': packet}
+				if code == EVENT_BACKOFF_START:
+					args['counter'] = value
+				elif peer >= 0:
+					args['peer'] = peer
+				self.open[key] = (time, args)
+			elif key in self.open:
+				begin, args = self.open.pop(key)
+				if code == EVENT_DIFS_INTERRUPT:
+					args['interrupted'] = True
+				self.span(node, name, begin, time, args)
+			return
+
+		name = _INSTANTS.get(code)
+		if name != None and self.start <= time < self.end:
+			self.emit({'name': name, 'ph': 'i', 's': 't', 'pid': self.track(node), 'tid': node, 'ts': time, 'args': {'packet': packet}})
+
+	def close(self):
+
+		# Spans still open at the end of the simulation end with it.
+		for (node, name, peer), (begin, args) in sorted(self.open.items(), key=lambda item: item[1][0]):
+			self.span(node, name, begin, self.lastTime, args)
+		self.open = {}
+
+		self.flush()
+		self.output.write(b'\n]\n')
+		self.output.close()
+
+if __name__ == '__main__':
+
+	# Export the timeline of a binary event log (see eventlog.py). The log
+	# must have been written with verbosity 2 for the energy counter.
+	from eventlog import EventLog
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-f", "--file", help="binary event log to export", type=str, required=True)
+	parser.add_argument("-o", "--output", help="trace file to write (compressed if its name ends with .gz)", type=str, required=True)
+	parser.add_argument("-g", "--numberOfGroups", help="number of RAW groups of the simulation", type=int, default=1)
+	parser.add_argument("-S", "--slotSize", help="length of the slot of each group in us", type=float, default=50e3)
+	parser.add_argument("-N", "--nodes", help="only export the tracks of these nodes", type=int, nargs='+', default=None)
+	parser.add_argument("-b", "--begin", help="only export events at or after this time in us", type=float, default=None)
+	parser.add_argument("-e", "--end", help="only export events before this time in us", type=float, default=None)
+
+	args = parser.parse_args()
+
+	log = EventLog(args.file)
+	writer = TraceWriter(args.output, args.numberOfGroups, args.slotSize, None, args.nodes, args.begin, args.end)
+
+	# Spans that cross the beginning of the window start before it, so the
+	# log is read from the beginning, but not beyond the end of the window.
+	for i in log.chunksFor(None, None, args.end):
+		columns = log.chunk(i)
+		for code, time, node, peer, packet, count, value, aux in zip(
+				columns['code'].tolist(), columns['time'].tolist(),
+				columns['node'].tolist(), columns['peer'].tolist(),
+				columns['packet'].tolist(), columns['count'].tolist(),
+				columns['value'].tolist(), columns['aux'].tolist()):
+			if args.end != None and time >= args.end:
+				break
+			writer.write(code, time, node, peer, packet, count, value, aux)
+
+	writer.close()
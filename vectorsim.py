@@ -0,0 +1,618 @@
+import argparse
+import json
+import math
+import random
+import sys
+
+import numpy as np
+
+from runstats import *
+from simulator import (makeConfig, SLOT_TIME, SIFS, DIFS, SYMBOL_DURATION,
+	DATA_PACKET_TIME, ACK_PACKET_TIME, ACK_TIMEOUT, RETRY_LIMIT, CW_MIN, CW_MAX,
+	CS_THRESHOLD, BACKGROUND_NOISE, TRANSMISSION_POWER, ANTENNA_GAIN,
+	ANTENNA_HEIGHT, dBm2mW)
+
+# Vectorized engine for saturated single-AP scenarios.
+#
+# Simulates several replicas (seeds) of the same scenario in lockstep. The
+# state of every station of every replica (CSMA/CA phase, backoff counter,
+# contention window, retries, energy perceived, ...) is kept in NumPy arrays
+# of shape (replicas, stations), and each step of the simulation advances all
+# replicas at once.
+#
+# The model follows the one in simulator.py, with two simplifications:
+#  - Stations always have a packet to transmit (saturation): a new packet is
+#    available as soon as the previous one is done with.
+#  - Time advances in steps of SLOT_TIME. All durations (DIFS, SIFS, frames,
+#    ack timeout) and slot boundaries are rounded to a whole number of steps.
+#
+# Each replica has its own clock, and each step of the engine advances every
+# replica to the next step where one of its timers (those of its stations and
+# of the acks owed by the AP) expires, and processes it. Replicas are
+# independent, so they do not have to be at the same instant: with many
+# stations, some replica has an event on almost every step, while each of them
+# only has one every few steps. Carrier sense is only re-evaluated in the
+# replicas where the energy on the medium changed.
+#
+# Events falling on the same step are not necessarily simultaneous, though. In
+# simulator.py, a new packet shows up a tiny random time after the previous one
+# is done with (or after the station wakes up for its slot), which shifts all
+# the countdowns of the station by that amount. When two stations finish their
+# countdown "at the same time", the one that finishes first transmits and the
+# other one, if it senses the first, defers instead of colliding. To keep this
+# behavior, each station carries the offset of its countdowns within the step
+# (its phase), and stations ready to transmit on the same step do so in order
+# of phase.
+#
+# The replicas use the same node positions as simulator.py with the same
+# seeds (seed, seed + 1, ...), but their random draws are taken from a single
+# NumPy generator, so the results of a replica also depend on how many
+# replicas are simulated together.
+
+TICK = SLOT_TIME
+
+DIFS_TICKS = int(round(DIFS / float(TICK)))
+SIFS_TICKS = int(round(SIFS / float(TICK)))
+DATA_TICKS = int(round(DATA_PACKET_TIME / float(TICK)))
+ACK_TICKS = int(round(ACK_PACKET_TIME / float(TICK)))
+ACK_TIMEOUT_TICKS = int(round(ACK_TIMEOUT / float(TICK)))
+
+# Mean delay, in us, between a packet being done with and the next one (the
+# mean packet interval of simulator.py with its default rate).
+PACKET_JITTER = 1e-4
+
+# Number of symbols received during a step.
+SYMBOLS_PER_TICK = TICK / float(SYMBOL_DURATION)
+
+NEVER = np.iinfo(np.int64).max
+
+# States of a station.
+STATE_SLEEP = 0
+STATE_CCA = 1
+STATE_DIFS = 2
+STATE_BACKOFF = 3
+STATE_TX = 4
+STATE_WAIT_ACK = 5
+
+# States of the ack the AP owes each station.
+ACK_NONE = 0
+ACK_SIFS = 1
+ACK_TX = 2
+
+try:
+	from scipy.special import erfc as _erfc
+except ImportError:
+
+	def _erfc(x):
+
+		# Complementary error function of an array (x >= 0), with a relative
+		# error below 1.2e-7 (Numerical Recipes, erfcc).
+		t = 1.0 / (1.0 + 0.5 * x)
+		return t * np.exp(-x * x - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 +
+			t * (-0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 +
+			t * (-0.82215223 + t * 0.17087277)))))))))
+
+def stationPositions(config, seed):
+
+	# Same positions simulator.py generates for this seed.
+	rng = random.Random(seed)
+	positions = []
+	usedCoordinates = set()
+	for i in range(config.numberOfSTAs):
+		while True:
+			posX = rng.randint(0, config.scenarioWidth)
+			posY = rng.randint(0, config.scenarioHeight)
+			if (posX, posY) not in usedCoordinates:
+				usedCoordinates.add((posX, posY))
+				break
+		positions.append((posX, posY))
+
+	return positions
+
+def readGroupsFile(path):
+
+	# Positions and groups of the stations, in the format of the -G option.
+	positions = []
+	groups = []
+	for line in open(path, 'r'):
+		info = line.replace('[', ' ').replace(']', '').replace(',', '').split()
+		if len(info) > 0:
+			groups.append(int(info[0]))
+			positions.append((int(float(info[1])), int(float(info[2]))))
+
+	return positions, groups
+
+def receivedPower(positions, config):
+
+	# Matrix of received power, in mW, between every pair of nodes (the AP is
+	# node 0).
+	nodes = np.array([(config.scenarioWidth / 2.0, config.scenarioHeight / 2.0)] + list(positions), dtype=np.float64)
+	dist = np.sqrt(((nodes[:, None, :] - nodes[None, :, :])**2).sum(axis=2))
+
+	loss = np.zeros(dist.shape)
+	far = dist > 0
+	loss[far] = -10.0 * math.log10(2.0 * ANTENNA_GAIN * math.pow(ANTENNA_HEIGHT, 4.0)) + 40.0 * np.log10(dist[far])
+
+	return 10.0 ** ((TRANSMISSION_POWER - loss) / 10.0)
+
+class ReplicaEngine(object):
+
+	def __init__(self, config=None, replicas=1):
+
+		self.config = makeConfig(config)
+		self.replicas = replicas
+		self.seeds = [self.config.seed + r for r in range(replicas)]
+		self.rng = np.random.default_rng(self.config.seed)
+
+		R = replicas
+		if self.config.groupsFromFile != None:
+			positions, groups = readGroupsFile(self.config.groupsFromFile)
+			self.power = np.repeat(receivedPower(positions, self.config)[None], R, axis=0)
+			self.groups = np.array(groups, dtype=np.int64)
+		else:
+			self.power = np.array([receivedPower(stationPositions(self.config, seed), self.config) for seed in self.seeds])
+			self.groups = np.arange(self.config.numberOfSTAs, dtype=np.int64) % self.config.numberOfGroups
+		N = len(self.groups)
+		self.N = N
+
+		# Power each station's transmissions are received with at the AP, and
+		# the AP's at each station.
+		self.uplinkPower = self.power[:, 1:, 0].copy()
+		self.downlinkPower = self.power[:, 0, 1:].copy()
+
+		self.noise = dBm2mW(BACKGROUND_NOISE)
+		self.csThreshold = dBm2mW(CS_THRESHOLD)
+
+		# Station state.
+		self.state = np.full((R, N), STATE_SLEEP, dtype=np.int8)
+		self.deadline = np.full((R, N), NEVER, dtype=np.int64)
+		self.cw = np.full((R, N), CW_MIN, dtype=np.int64)
+		self.backoff = np.zeros((R, N), dtype=np.int64)
+		self.backoffStart = np.zeros((R, N), dtype=np.int64)
+		self.attempts = np.zeros((R, N), dtype=np.int64)
+		self.needsBackoff = np.zeros((R, N), dtype=bool)
+		self.slotEnd = np.zeros((R, N), dtype=np.int64)
+		self.generateOnWake = np.zeros((R, N), dtype=bool)
+
+		# Offset of the station's countdowns within the step (see above), and
+		# whether it is waiting for the medium to become idle.
+		self.phase = np.zeros((R, N))
+		self.waitingIdle = np.zeros((R, N), dtype=bool)
+
+		# Log of the probability that the data frame being sent by each
+		# station, and the ack being sent to it, are received correctly.
+		self.dataLogSuccess = np.zeros((R, N))
+		self.ackLogSuccess = np.zeros((R, N))
+
+		# Acks sent by the AP.
+		self.ackState = np.full((R, N), ACK_NONE, dtype=np.int8)
+		self.ackDeadline = np.full((R, N), NEVER, dtype=np.int64)
+
+		# Power perceived by each node (AP first), without the noise floor.
+		self.energy = np.zeros((R, N + 1))
+
+		self.counters = np.zeros((len(COUNTERS), R, N), dtype=np.int64)
+
+		# Current step of each replica.
+		self.now = np.zeros(R, dtype=np.int64)
+
+		# Steps at which the energy of each replica last changed.
+		self.lastChange = np.zeros(R, dtype=np.int64)
+
+		# Replicas where carrier sense has to be evaluated on this step.
+		self.touched = []
+
+	### Slots
+
+	def slotIndex(self, t):
+
+		return np.floor(t * TICK / float(self.config.slotSize)).astype(np.int64)
+
+	def slotStart(self, k):
+
+		# Slots start at the first step at or after their exact beginning.
+		return np.ceil(k * float(self.config.slotSize) / TICK).astype(np.int64)
+
+	### Timers
+
+	def setDeadline(self, r, i, ticks):
+
+		self.deadline[r, i] = ticks
+
+	def setAckDeadline(self, r, i, ticks):
+
+		self.ackDeadline[r, i] = ticks
+
+	### Medium
+
+	def startTransmissions(self, r, i):
+
+		if len(r) == 0:
+			return
+
+		# Stations (r, i) start transmitting.
+		self.accumulate(r)
+		np.add.at(self.energy, r, self.power[r, i + 1, :])
+
+	def stopTransmissions(self, r, i):
+
+		if len(r) == 0:
+			return
+
+		self.accumulate(r)
+		np.subtract.at(self.energy, r, self.power[r, i + 1, :])
+
+	def startAcks(self, r):
+
+		if len(r) == 0:
+			return
+
+		self.accumulate(r)
+		np.add.at(self.energy, r, self.power[r, 0, :])
+
+	def stopAcks(self, r):
+
+		if len(r) == 0:
+			return
+
+		self.accumulate(r)
+		np.subtract.at(self.energy, r, self.power[r, 0, :])
+
+	def cleanEnergy(self, r):
+
+		# Mitigate float point approximation errors: reset the energy of the
+		# replicas where nothing is being transmitted anymore (once the
+		# transmissions that just ended are no longer marked as active).
+		if len(r) == 0:
+			return
+		r = np.unique(r)
+		idle = ((self.state[r] != STATE_TX).all(axis=1)) & ((self.ackState[r] != ACK_TX).all(axis=1))
+		self.energy[r[idle]] = 0.0
+
+	def accumulate(self, replicas):
+
+		# The energy of these replicas is about to change. Account for the
+		# symbols received since the last change, during which the energy
+		# level at every node was constant.
+		self.touched.append(replicas)
+		replicas = np.unique(replicas)
+		replicas = replicas[self.lastChange[replicas] < self.now[replicas]]
+		if len(replicas) == 0:
+			return
+
+		symbols = (self.now - self.lastChange) * SYMBOLS_PER_TICK
+		self.lastChange[replicas] = self.now[replicas]
+
+		k, i = np.nonzero(self.state[replicas] == STATE_TX)
+		if len(k) > 0:
+			r = replicas[k]
+			signal = self.uplinkPower[r, i]
+			self.dataLogSuccess[r, i] += symbols[r] * self.logSymbolSuccess(signal, self.noise + self.energy[r, 0] - signal)
+
+		k, i = np.nonzero(self.ackState[replicas] == ACK_TX)
+		if len(k) > 0:
+			r = replicas[k]
+			signal = self.downlinkPower[r, i]
+			self.ackLogSuccess[r, i] += symbols[r] * self.logSymbolSuccess(signal, self.noise + self.energy[r, i + 1] - signal)
+
+	def logSymbolSuccess(self, signal, interference):
+
+		# Same error model as simulator.py (BPSK symbol error probability).
+		interference = np.maximum(interference, self.noise)
+		symbolErrorProbability = _erfc(np.sqrt(signal / interference)) / 2
+		return np.log1p(-symbolErrorProbability)
+
+	### Station state machine
+
+	def count(self, counter, r, i):
+
+		# Each station appears at most once.
+		if len(r) > 0:
+			self.counters[counter, r, i] += 1
+
+	def newPacket(self, r, i):
+
+		if len(r) == 0:
+			return
+
+		self.count(COUNTER_GENERATED, r, i)
+		self.phase[r, i] += self.rng.exponential(PACKET_JITTER, size=len(r))
+
+		k = self.slotIndex(self.now[r])
+		inSlot = self.groups[i] == k % self.config.numberOfGroups
+		self.startContention(r[inSlot], i[inSlot], self.slotStart(k[inSlot] + 1))
+
+		r = r[~inSlot]
+		i = i[~inSlot]
+		self.count(COUNTER_DEFERRED, r, i)
+		self.sleep(r, i, False)
+
+	def sleep(self, r, i, generateOnWake):
+
+		if len(r) == 0:
+			return
+
+		# Wait until the next slot of the group.
+		k = self.slotIndex(self.now[r])
+		base = k - k % self.config.numberOfGroups
+		groups = self.groups[i]
+		nextSlot = np.where(k % self.config.numberOfGroups < groups, base + groups, base + self.config.numberOfGroups + groups)
+
+		self.state[r, i] = STATE_SLEEP
+		self.setDeadline(r, i, self.slotStart(nextSlot))
+		self.generateOnWake[r, i] = generateOnWake
+
+	def startContention(self, r, i, slotEnd):
+
+		if len(r) == 0:
+			return
+
+		# Begin CSMA/CA for a new packet.
+		self.slotEnd[r, i] = slotEnd
+		self.cw[r, i] = CW_MIN
+		self.attempts[r, i] = 0
+		self.needsBackoff[r, i] = False
+		self.backoff[r, i] = self.rng.integers(0, CW_MIN + 1, size=len(r))
+		self.loopTop(r, i)
+
+	def loopTop(self, r, i):
+
+		if len(r) == 0:
+			return
+
+		# The slot may have ended since the last check.
+		over = self.now[r] > self.slotEnd[r, i]
+		self.count(COUNTER_ABORTS, r[over], i[over])
+
+		self.state[r[~over], i[~over]] = STATE_CCA
+		self.deadline[r[~over], i[~over]] = NEVER
+		self.touched.append(r)
+
+		if over.any():
+			self.newPacket(r[over], i[over])
+
+	def ready(self, r, i):
+
+		if len(r) == 0:
+			return
+
+		# Stations of the same replica get to transmit in order of phase
+		# (those with the same phase, at once). The ones that sense a
+		# transmission started before them defer.
+		order = np.lexsort((self.phase[r, i], r))
+		r = r[order]
+		i = i[order]
+		phase = self.phase[r, i]
+		first = np.ones(len(r), dtype=bool)
+		first[1:] = r[1:] != r[:-1]
+		level = np.cumsum(first | np.concatenate([[True], phase[1:] != phase[:-1]]))
+		level = level - np.maximum.accumulate(np.where(first, level, 0))
+
+		for l in range(int(level.max()) + 1):
+			rl = r[level == l]
+			il = i[level == l]
+
+			busy = self.noise + self.energy[rl, il + 1] > self.csThreshold
+			self.needsBackoff[rl[busy], il[busy]] = True
+			self.loopTop(rl[busy], il[busy])
+
+			self.transmit(rl[~busy], il[~busy])
+
+	def transmit(self, r, i):
+
+		if len(r) == 0:
+			return
+
+		# Transmit, unless the frame does not fit in what is left of the slot.
+		fits = self.now[r] + DATA_TICKS <= self.slotEnd[r, i]
+
+		self.count(COUNTER_ABORTS, r[~fits], i[~fits])
+		self.sleep(r[~fits], i[~fits], True)
+
+		r = r[fits]
+		i = i[fits]
+		self.startTransmissions(r, i)
+		self.state[r, i] = STATE_TX
+		self.setDeadline(r, i, self.now[r] + DATA_TICKS)
+		self.dataLogSuccess[r, i] = 0.0
+
+	def timeout(self, r, i):
+
+		# No ack for the last attempt: retry, unless the retry limit was
+		# reached.
+		self.count(COUNTER_ACK_TIMEOUTS, r, i)
+		self.attempts[r, i] += 1
+		dropped = self.attempts[r, i] > RETRY_LIMIT
+		self.count(COUNTER_DROPS, r[dropped], i[dropped])
+		self.newPacket(r[dropped], i[dropped])
+
+		r = r[~dropped]
+		i = i[~dropped]
+		self.cw[r, i] = np.where(self.cw[r, i] < CW_MAX, 2 * (self.cw[r, i] + 1) - 1, self.cw[r, i])
+		self.backoff[r, i] = self.rng.integers(0, self.cw[r, i] + 1)
+		self.needsBackoff[r, i] = True
+		self.loopTop(r, i)
+
+	def step(self, end):
+
+		# Advance every replica to its next event, and stop once all of them
+		# reach the end of the simulation.
+		self.now = np.minimum(self.deadline.min(axis=1), self.ackDeadline.min(axis=1))
+		active = self.now < end
+		if not active.any():
+			return False
+		now = np.where(active, self.now, -1)[:, None]
+
+		# Phase at which the medium becomes idle for the stations waiting for
+		# it: that of the last transmission ending now.
+		self.idlePhase = np.zeros(self.replicas)
+
+		# Acks sent by the AP.
+		r, i = np.nonzero(self.ackDeadline == now)
+		if len(r) > 0:
+			ending = self.ackState[r, i] == ACK_TX
+			rEnd = r[ending]
+			iEnd = i[ending]
+			self.stopAcks(rEnd)
+			self.ackState[rEnd, iEnd] = ACK_NONE
+			self.ackDeadline[rEnd, iEnd] = NEVER
+			self.cleanEnergy(rEnd)
+			np.maximum.at(self.idlePhase, rEnd, self.phase[rEnd, iEnd])
+
+			rStart = r[~ending]
+			iStart = i[~ending]
+			self.startAcks(rStart)
+			self.ackState[rStart, iStart] = ACK_TX
+			self.setAckDeadline(rStart, iStart, self.now[rStart] + ACK_TICKS)
+			self.ackLogSuccess[rStart, iStart] = 0.0
+
+			# Stations that received their ack are done with the packet.
+			received = self.rng.random(len(rEnd)) <= np.exp(self.ackLogSuccess[rEnd, iEnd])
+			self.count(COUNTER_ACK_SINR_FAILURES, rEnd[~received], iEnd[~received])
+			self.count(COUNTER_SUCCESS, rEnd[received], iEnd[received])
+			self.newPacket(rEnd[received], iEnd[received])
+
+		r, i = np.nonzero(self.deadline == now)
+		if len(r) > 0:
+			state = self.state[r, i]
+
+			# End of data frames.
+			ending = state == STATE_TX
+			rEnd = r[ending]
+			iEnd = i[ending]
+			self.stopTransmissions(rEnd, iEnd)
+			self.state[rEnd, iEnd] = STATE_WAIT_ACK
+			self.setDeadline(rEnd, iEnd, self.now[rEnd] + ACK_TIMEOUT_TICKS)
+			self.cleanEnergy(rEnd)
+			np.maximum.at(self.idlePhase, rEnd, self.phase[rEnd, iEnd])
+			received = self.rng.random(len(rEnd)) <= np.exp(self.dataLogSuccess[rEnd, iEnd])
+			self.count(COUNTER_DATA_SINR_FAILURES, rEnd[~received], iEnd[~received])
+			self.ackState[rEnd[received], iEnd[received]] = ACK_SIFS
+			self.setAckDeadline(rEnd[received], iEnd[received], self.now[rEnd[received]] + SIFS_TICKS)
+
+			# Ack timeouts.
+			timeout = state == STATE_WAIT_ACK
+			rTimeout = r[timeout]
+			iTimeout = i[timeout]
+			if len(rTimeout) > 0:
+				self.timeout(rTimeout, iTimeout)
+
+			# Stations waking up at the beginning of their group's slot.
+			waking = state == STATE_SLEEP
+			rWake = r[waking]
+			iWake = i[waking]
+			if len(rWake) > 0:
+				# Stations that aborted get a new packet (with its delay),
+				# while deferred ones start their countdowns right at the
+				# boundary.
+				self.phase[rWake, iWake] = 0.0
+				generate = self.generateOnWake[rWake, iWake]
+				self.count(COUNTER_GENERATED, rWake[generate], iWake[generate])
+				self.phase[rWake[generate], iWake[generate]] = self.rng.exponential(PACKET_JITTER, size=int(generate.sum()))
+				self.startContention(rWake, iWake, self.slotStart(self.slotIndex(self.now[rWake]) + 1))
+
+			# End of DIFS: count the backoff down, if needed.
+			difs = state == STATE_DIFS
+			rDifs = r[difs]
+			iDifs = i[difs]
+			counting = self.needsBackoff[rDifs, iDifs] & (self.backoff[rDifs, iDifs] > 0)
+			self.state[rDifs[counting], iDifs[counting]] = STATE_BACKOFF
+			self.backoffStart[rDifs[counting], iDifs[counting]] = self.now[rDifs[counting]]
+			self.setDeadline(rDifs[counting], iDifs[counting], self.now[rDifs[counting]] + self.backoff[rDifs[counting], iDifs[counting]])
+			self.touched.append(rDifs[counting])
+
+			# End of backoff.
+			backoff = state == STATE_BACKOFF
+			self.backoff[r[backoff], i[backoff]] = 0
+
+			self.ready(np.concatenate([rDifs[~counting], r[backoff]]), np.concatenate([iDifs[~counting], i[backoff]]))
+
+		self.senseCarrier()
+		return True
+
+	def senseCarrier(self):
+
+		# Carrier sense, after all transmissions starting or ending now, in
+		# the replicas where something changed.
+		if len(self.touched) == 0:
+			return
+		replicas = np.unique(np.concatenate(self.touched))
+		self.touched = []
+
+		busy = self.noise + self.energy[replicas, 1:] > self.csThreshold
+
+		state = self.state[replicas]
+		k, i = np.nonzero(busy & ((state == STATE_DIFS) | (state == STATE_BACKOFF)))
+		if len(k) > 0:
+			r = replicas[k]
+			backoff = self.state[r, i] == STATE_BACKOFF
+			self.backoff[r[backoff], i[backoff]] -= self.now[r[backoff]] - self.backoffStart[r[backoff], i[backoff]]
+			self.needsBackoff[r, i] = True
+			self.loopTop(r, i)
+			state = self.state[replicas]
+
+		waiting = state == STATE_CCA
+		k, i = np.nonzero(waiting & busy)
+		self.needsBackoff[replicas[k], i] = True
+		self.waitingIdle[replicas[k], i] = True
+
+		k, i = np.nonzero(waiting & ~busy)
+		r = replicas[k]
+		idle = self.waitingIdle[r, i]
+		self.phase[r[idle], i[idle]] = self.idlePhase[r[idle]]
+		self.waitingIdle[r, i] = False
+		self.state[r, i] = STATE_DIFS
+		self.setDeadline(r, i, self.now[r] + DIFS_TICKS)
+		self.touched = []
+
+	def run(self):
+
+		# All stations get their first packet at the beginning.
+		R, N = self.state.shape
+		r, i = np.nonzero(np.ones((R, N), dtype=bool))
+		self.idlePhase = np.zeros(R)
+		self.newPacket(r, i)
+		self.senseCarrier()
+
+		end = int(math.ceil(self.config.length / TICK))
+		while self.step(end):
+			pass
+
+		return self.summaries()
+
+	def summaries(self):
+
+		# One summary per replica, in the format of the simulator's -sm option.
+		groups = [None] + self.groups.tolist()
+		results = []
+		for r in range(self.replicas):
+			statistics = RunStatistics(groups)
+			statistics.nodes = dict(enumerate(self.counters[:, r, :].T.tolist(), 1))
+			results.append(statistics.summary())
+
+		return results
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+	parser.add_argument("-n", "--numberOfSTAs", help="number of STAs in the simulation", type=int, default=1)
+	parser.add_argument("-g", "--numberOfGroups", help="number of RAW grous in the simulation", type=int, default=1)
+	parser.add_argument("-G", "--groupsFromFile", type=str, help="read station grouping information from file (shared by all replicas)", default=None)
+	parser.add_argument("-S", "--slotSize", help="length of the slot of each group in us", type=int, default=50e3)
+	parser.add_argument("-W", "--scenarioWidth", help="width of the area used for positioning nodes in m", type=int, default=1000)
+	parser.add_argument("-H", "--scenarioHeight", help="height of the area used for positioning nodes in m", type=int, default=1000)
+	parser.add_argument("-s", "--seed", help="seed of the first replica (replica i uses seed + i)", type=int, default=random.randint(0, 99999999))
+	parser.add_argument("-l", "--length", help="simulation length in us", type=float, default=2e7)
+	parser.add_argument("-R", "--replicas", help="number of replicas simulated together", type=int, default=1)
+
+	args = parser.parse_args()
+
+	config = vars(args).copy()
+	del config['replicas']
+	engine = ReplicaEngine(config, args.replicas)
+	results = engine.run()
+
+	output = dict((str(seed), summary) for seed, summary in zip(engine.seeds, results))
+	json.dump(output, sys.stdout, indent=1, sort_keys=True)
+	sys.stdout.write('\n')